@@ -1,28 +1,132 @@
 import os
+import re
 import json
+import binascii
 import requests
-from base64 import b64decode
 
-def generate_image_google(prompt, api_key=None):
+from generation_result import GenerationResult
+from singleflight import single_flight
+from tracing import traced
+from metrics import measured
+
+MODEL = "imagen-3.0-generate-002"
+
+# Error responses are quoted in the error message up to this many characters
+MAX_ERROR_CHARS = 500
+
+# Bytes read from the connection at a time
+CHUNK_SIZE = 256 * 1024
+
+# Imagen returns at most this many samples per request
+MAX_SAMPLES = 4
+
+ASPECT_RATIOS = ("1:1", "3:4", "4:3", "9:16", "16:9")
+MIME_TYPES = ("image/png", "image/jpeg")
+
+# Start of an image's base64 payload: the bytesBase64Encoded string of a prediction
+_PREDICTION_BYTES = re.compile(rb'"bytesBase64Encoded"\s*:\s*"')
+
+
+def _read_body(response, limit=None):
+    """
+    Read a streamed response body into a single buffer
+
+    The buffer is allocated at the Content-Length up front when the server
+    sends one and filled in place (requests' .content instead keeps every
+    chunk and joins them, two copies at peak). Stops once limit bytes are in.
+    """
+    length = response.headers.get("Content-Length", "")
+    body = bytearray(int(length)) if length.isdigit() and limit is None else bytearray()
+    filled = 0
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE if limit is None else min(limit, CHUNK_SIZE)):
+        # In place while it fits; grows the buffer if the body is longer than announced
+        body[filled:filled + len(chunk)] = chunk
+        filled += len(chunk)
+        if limit is not None and filled >= limit:
+            break
+    del body[filled:]
+    return body
+
+
+def _excerpt(body):
+    """The start of a response body as text, for error messages"""
+    text = bytes(body[:MAX_ERROR_CHARS]).decode("utf-8", errors="replace")
+    return f"{text}..." if len(body) > MAX_ERROR_CHARS else text
+
+
+def _error_excerpt(response):
+    """The start of an error response, without reading (or holding) the rest of it"""
+    return _excerpt(_read_body(response, limit=MAX_ERROR_CHARS + 1))
+
+
+def _decode_predictions(body):
     """
-    Generate an image using Google's Imagen 3 (imagen-3.0-generate-002) through Gemini API
+    Decode the images of a :predict response body, in prediction order
+
+    Rather than parsing the whole document (which holds the base64 text as a
+    str, then again inside the parsed dicts), this finds each payload in the
+    raw bytes and decodes it from a view of the body, so the only new buffer
+    is the decoded image itself, sized up front by the decoder. Base64 has
+    no quotes, so a payload ends at the next one. A payload containing JSON
+    escapes ("\\/", "\\u003d", ...) is unescaped with the json module first,
+    since the decoder would otherwise read the escapes' letters as data.
+    """
+    images = []
+    view = memoryview(body)
+    try:
+        position = 0
+        while True:
+            match = _PREDICTION_BYTES.search(body, position)
+            if match is None:
+                break
+            end = body.find(b'"', match.end())
+            if end < 0:
+                break
+            if body.find(b"\\", match.end(), end) >= 0:
+                images.append(binascii.a2b_base64(json.loads(body[match.end() - 1:end + 1])))
+            else:
+                images.append(binascii.a2b_base64(view[match.end():end]))
+            position = end + 1
+    finally:
+        view.release()
+    return images
+
+@traced("google.generate")
+@single_flight("google", MODEL)
+@measured("google", MODEL)
+def generate_image_google(prompt, api_key=None, num_images=1, aspect_ratio="1:1", mime_type="image/png"):
+    """
+    Generate one or more images using Google's Imagen 3 (imagen-3.0-generate-002) through the Gemini API
+
+    Uses the model's :predict endpoint, which returns up to MAX_SAMPLES
+    samples from a single request.
 
     Args:
         prompt: Text prompt for image generation
         api_key: Google API key (optional, will use env var if not provided)
+        num_images: Number of samples to request in a single call (1 to MAX_SAMPLES)
+        aspect_ratio: One of ASPECT_RATIOS
+        mime_type: Output format, one of MIME_TYPES
 
     Returns:
-        dict: Dictionary containing image data or error
+        GenerationResult: Every decoded image, or the error
     """
     try:
         # Use provided API key or get from environment
         api_key = api_key or os.environ.get('GOOGLE_API_KEY')
 
         if not api_key:
-            return {"error": "API key not provided or found in environment variables."}
+            return GenerationResult.failure("google", MODEL, "API key not provided or found in environment variables.")
+        if aspect_ratio not in ASPECT_RATIOS:
+            return GenerationResult.failure(
+                "google", MODEL, f"Unsupported aspect ratio {aspect_ratio}; expected one of {', '.join(ASPECT_RATIOS)}")
+        if mime_type not in MIME_TYPES:
+            return GenerationResult.failure(
+                "google", MODEL, f"Unsupported output type {mime_type}; expected one of {', '.join(MIME_TYPES)}")
 
-        # Google Gemini API endpoint for Imagen 3 with API key as query parameter
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/imagen-3.0-generate-002:generateContent?key={api_key}"
+        # Gemini API predict endpoint for Imagen 3 with API key as query parameter
+        base_url = os.environ.get('GOOGLE_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+        url = f"{base_url}/v1beta/models/{MODEL}:predict?key={api_key}"
 
         # Request headers
         headers = {
@@ -31,52 +135,51 @@ def generate_image_google(prompt, api_key=None):
 
         # Request body
         data = {
-            "contents": [
+            "instances": [
                 {
-                    "role": "user",
-                    "parts": [
-                        {
-                            "text": prompt
-                        }
-                    ]
+                    "prompt": prompt
                 }
             ],
-            "generation_config": {
-                "temperature": 0.4,
-                "topP": 1.0,
-                "topK": 32
+            "parameters": {
+                "sampleCount": max(1, min(num_images, MAX_SAMPLES)),
+                "aspectRatio": aspect_ratio,
+                "outputOptions": {
+                    "mimeType": mime_type
+                }
             }
         }
 
-        # Make API request
-        response = requests.post(url, headers=headers, json=data)
-
-        # Check if request was successful
-        if response.status_code == 200:
-            response_json = response.json()
-
-            # Extract image data
-            for candidate in response_json.get('candidates', []):
-                for part in candidate.get('content', {}).get('parts', []):
-                    if 'inlineData' in part:
-                        # Extract and decode base64 image data
-                        image_data = b64decode(part['inlineData']['data'])
-                        return {"image_data": image_data}
-
-            return {"error": "No image data found in the response"}
-        elif response.status_code == 401:
-            return {"error": f"Google API error: Unauthorized (401). Check your API key and restrictions."}
-        elif response.status_code == 400:
-            return {"error": f"Google API error: Bad Request (400). Check the request payload. {response.text}"}
-        else:
-            return {"error": f"Google API error: {response.status_code} - {response.text}"}
+        # Make API request; the body is read by hand below rather than through response.content/json()
+        with requests.post(url, headers=headers, json=data, stream=True) as response:
+            if response.status_code == 200:
+                body = _read_body(response)
+            elif response.status_code == 401:
+                return GenerationResult.failure(
+                    "google", MODEL, "Google API error: Unauthorized (401). Check your API key and restrictions.")
+            elif response.status_code == 400:
+                return GenerationResult.failure(
+                    "google", MODEL,
+                    f"Google API error: Bad Request (400). Check the request payload. {_error_excerpt(response)}")
+            else:
+                return GenerationResult.failure(
+                    "google", MODEL, f"Google API error: {response.status_code} - {_error_excerpt(response)}")
+
+        # Extract and decode the base64 image data of every sample, then drop the raw body
+        images = _decode_predictions(body)
+        if images:
+            del body
+            return GenerationResult("google", MODEL, images=images,
+                                    metadata={"aspect_ratio": aspect_ratio, "mime_type": mime_type})
+
+        # Samples blocked by the safety filters come back without image data
+        return GenerationResult.failure("google", MODEL, f"No image data found in the response: {_excerpt(body)}")
 
     except requests.exceptions.RequestException as e:
-        return {"error": f"Request error: {str(e)}"}
-    except json.JSONDecodeError as e:
-        return {"error": f"JSON decode error: {str(e)} - {response.text}"}
+        return GenerationResult.failure("google", MODEL, f"Request error: {str(e)}")
+    except binascii.Error as e:
+        return GenerationResult.failure("google", MODEL, f"Image data decode error: {str(e)}")
     except Exception as e:
-        return {"error": f"Google API error: {str(e)}"}
+        return GenerationResult.failure("google", MODEL, f"Google API error: {str(e)}")
 
 # Test the function
 if __name__ == "__main__":
@@ -2,23 +2,34 @@ import os
 import requests
 import json
 
-def generate_image_ideogram(prompt, api_key=None):
+from generation_result import GenerationResult
+from singleflight import single_flight
+from tracing import traced
+from metrics import measured
+
+MODEL = "model-2.0"
+
+@traced("ideogram.generate")
+@single_flight("ideogram", MODEL)
+@measured("ideogram", MODEL)
+def generate_image_ideogram(prompt, api_key=None, num_images=1):
     """
-    Generate an image using Ideogram v2
+    Generate one or more images using Ideogram v2
     
     Args:
         prompt: Text prompt for image generation
         api_key: Ideogram API key (optional, will use env var if not provided)
+        num_images: Number of images to generate in a single request
         
     Returns:
-        dict: Dictionary containing image URL or error
+        GenerationResult: The URLs of every image, or the error
     """
     try:
         # Use provided API key or get from environment
         api_key = api_key or os.environ.get('IDEOGRAM_API_KEY')
         
         # Ideogram API endpoint
-        url = "https://api.ideogram.ai/api/v1/images/generations"
+        url = f"{os.environ.get('IDEOGRAM_API_BASE_URL', 'https://api.ideogram.ai')}/api/v1/images/generations"
         
         # Request headers
         headers = {
@@ -28,12 +39,12 @@ def generate_image_ideogram(prompt, api_key=None):
         
         # Request parameters
         data = {
-            "model": "model-2.0",
+            "model": MODEL,
             "prompt": prompt,
             "width": 1024,
             "height": 1024,
             "style": "natural",
-            "num_images": 1
+            "num_images": num_images
         }
         
         # Make API request
@@ -43,14 +54,14 @@ def generate_image_ideogram(prompt, api_key=None):
         if response.status_code == 200:
             response_json = response.json()
             
-            # Extract image URL
-            for generation in response_json.get('generations', []):
-                if 'url' in generation:
-                    return {"url": generation['url']}
+            # Extract image URLs
+            urls = [generation['url'] for generation in response_json.get('generations', []) if 'url' in generation]
+            if urls:
+                return GenerationResult("ideogram", MODEL, urls=urls)
             
-            return {"error": "No image URL found in the response"}
+            return GenerationResult.failure("ideogram", MODEL, "No image URL found in the response")
         else:
-            return {"error": f"Ideogram API error: {response.status_code} - {response.text}"}
+            return GenerationResult.failure("ideogram", MODEL, f"Ideogram API error: {response.status_code} - {response.text}")
     
     except Exception as e:
-        return {"error": f"Ideogram API error: {str(e)}"}
+        return GenerationResult.failure("ideogram", MODEL, f"Ideogram API error: {str(e)}")
@@ -2,6 +2,16 @@ import os
 import requests
 from openai import OpenAI
 
+from generation_result import GenerationResult
+from singleflight import single_flight
+from tracing import traced
+from metrics import measured
+
+MODEL = "dall-e-3"
+
+@traced("openai.generate")
+@single_flight("openai", MODEL)
+@measured("openai", MODEL)
 def generate_image_openai(prompt, api_key=None):
     """
     Generate an image using OpenAI's DALL-E 3
@@ -11,7 +21,7 @@ def generate_image_openai(prompt, api_key=None):
         api_key: OpenAI API key (optional, will use env var if not provided)
         
     Returns:
-        dict: Dictionary containing image URL or error
+        GenerationResult: The image URL, or the error
     """
     try:
         # Initialize OpenAI client
@@ -19,7 +29,7 @@ def generate_image_openai(prompt, api_key=None):
         
         # Call DALL-E 3 API
         response = client.images.generate(
-            model="dall-e-3",
+            model=MODEL,
             prompt=prompt,
             n=1,
             size="1024x1024",
@@ -29,7 +39,7 @@ def generate_image_openai(prompt, api_key=None):
         # Extract image URL
         image_url = response.data[0].url
         
-        return {"url": image_url}
+        return GenerationResult("openai", MODEL, urls=[image_url])
     
     except Exception as e:
-        return {"error": f"OpenAI API error: {str(e)}"}
+        return GenerationResult.failure("openai", MODEL, f"OpenAI API error: {str(e)}")
@@ -2,6 +2,16 @@ import os
 import requests
 from base64 import b64decode
 
+from generation_result import GenerationResult
+from singleflight import single_flight
+from tracing import traced
+from metrics import measured
+
+MODEL = "sd3"
+
+@traced("recraft.generate")
+@single_flight("recraft", MODEL)
+@measured("recraft", MODEL)
 def generate_image_recraft(prompt, api_key=None):
     """
     Generate an image using Recraft AI
@@ -11,14 +21,14 @@ def generate_image_recraft(prompt, api_key=None):
         api_key: Recraft API key (optional, will use env var if not provided)
         
     Returns:
-        dict: Dictionary containing image URL or error
+        GenerationResult: The image URL, or the error
     """
     try:
         # Use provided API key or get from environment
         api_key = api_key or os.environ.get('RECRAFT_API_KEY')
         
         # Recraft API endpoint
-        url = "https://api.recraft.ai/creations"
+        url = f"{os.environ.get('RECRAFT_API_BASE_URL', 'https://api.recraft.ai')}/creations"
         
         # Request headers
         headers = {
@@ -28,7 +38,7 @@ def generate_image_recraft(prompt, api_key=None):
         
         # Request parameters
         data = {
-            "model": "sd3",
+            "model": MODEL,
             "prompt": prompt,
             "width": 1024,
             "height": 1024
@@ -43,11 +53,11 @@ def generate_image_recraft(prompt, api_key=None):
             
             # Extract image URL
             if "url" in response_json:
-                return {"url": response_json["url"]}
+                return GenerationResult("recraft", MODEL, urls=[response_json["url"]])
             else:
-                return {"error": "No image URL found in the response"}
+                return GenerationResult.failure("recraft", MODEL, "No image URL found in the response")
         else:
-            return {"error": f"Recraft API error: {response.status_code} - {response.text}"}
+            return GenerationResult.failure("recraft", MODEL, f"Recraft API error: {response.status_code} - {response.text}")
     
     except Exception as e:
-        return {"error": f"Recraft API error: {str(e)}"}
+        return GenerationResult.failure("recraft", MODEL, f"Recraft API error: {str(e)}")
@@ -1,18 +1,18 @@
 import streamlit as st
 import os
-import io
 import time
-import pandas as pd
-from PIL import Image
-import base64
-from concurrent.futures import ThreadPoolExecutor
-import asyncio
 
-from api_clients.openai_client import generate_image_openai
-from api_clients.google_client import generate_image_google
-from api_clients.recraft_client import generate_image_recraft
-from api_clients.ideogram_client import generate_image_ideogram
-from utils import save_image_from_url, save_image_from_bytes
+from utils import build_generators
+from jobs import JobManager
+from archive_index import ArchiveIndex
+from run_history import RunHistory
+from singleflight import default_group as request_flights
+from tracing import span, traced
+from metrics import registry as metrics_registry, provider_summary, start_exporters
+from cassettes import install_from_environment as install_cassette
+from startup import mark as mark_startup
+
+mark_startup("app", "imports")
 
 st.set_page_config(
     page_title="AI Image Generator Comparison",
@@ -46,6 +46,33 @@ if 'api_keys_set' not in st.session_state:
 if 'loading' not in st.session_state:
     st.session_state.loading = False
 
+if 'images_per_provider' not in st.session_state:
+    st.session_state.images_per_provider = 1
+
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+
+@st.cache_resource
+def get_archive_index():
+    """Metadata and full-text index over the shared generated_images/ archive"""
+    return ArchiveIndex("generated_images")
+
+@st.cache_resource
+def get_run_history():
+    """Saves every run into generated_images/ in the background and lists past runs"""
+    return RunHistory("generated_images", archive_index=get_archive_index())
+
+@st.cache_resource
+def get_job_manager():
+    """Process-wide job manager, shared by all sessions and kept across reruns"""
+    return JobManager(on_result=get_run_history().record)
+
+@st.cache_resource
+def start_metrics_exporters():
+    """Start the Prometheus endpoint/file exporters once per process"""
+    start_exporters()
+    return True
+
 def check_api_keys():
     """Check if API keys are available in session state or environment variables"""
     # First check session state for manually entered keys
@@ -72,48 +99,171 @@ def check_api_keys():
     
     return api_keys
 
-def generate_images(prompt):
-    """Generate images from all enabled AI services"""
-    st.session_state.loading = True
-    st.session_state.generated_images = {}
-    
+@traced("app.generate_images")
+def generate_images(prompt, images_per_provider=1):
+    """Submit a background job generating images from all enabled AI services"""
     # Get the latest API keys
     api_keys = check_api_keys()
     
-    # Define generator functions with their respective requirements
-    generators = []
-    if st.session_state.api_keys_set['openai']:
-        generators.append(('OpenAI DALL-E 3', lambda: generate_image_openai(prompt, api_keys['openai'])))
-    if st.session_state.api_keys_set['google']:
-        generators.append(('Google Imagen 3', lambda: generate_image_google(prompt, api_keys['google'])))
-    if st.session_state.api_keys_set['recraft']:
-        generators.append(('Recraft AI', lambda: generate_image_recraft(prompt, api_keys['recraft'])))
-    if st.session_state.api_keys_set['ideogram']:
-        generators.append(('Ideogram v2', lambda: generate_image_ideogram(prompt, api_keys['ideogram'])))
+    # Google and Ideogram return several images from one request; the others are fanned out
+    n = images_per_provider
+    generators = build_generators(prompt, api_keys, n)
+    
+    if not generators:
+        st.error("No API keys configured. Please add at least one API key in the API Keys Configuration section.")
+        return
+    
+    # Identical in-flight submissions (e.g. a double-click) reuse the running job
+    job = get_job_manager().submit(prompt, generators, credentials=api_keys.values(),
+                                   params={'images_per_provider': n})
+    st.session_state.job_id = job.id
+    st.session_state.generated_images = {}
+    st.session_state.loading = True
+
+@traced("app.render_results")
+def render_generation_results():
+    """Render the current job's results, polling while it is still running"""
+    job = get_job_manager().get(st.session_state.job_id) if st.session_state.job_id else None
+    
+    if job is not None:
+        st.session_state.generated_images = job.results()
+        if job.done and st.session_state.loading:
+            # Full rerun so the page stops polling and the generate button updates
+            st.session_state.loading = False
+            st.rerun()
+    elif st.session_state.loading:
+        st.session_state.loading = False
+    
+    providers = job.providers if job is not None else list(st.session_state.generated_images)
+    if not providers:
+        return
+    
+    # Display loading status
+    if st.session_state.loading:
+        st.markdown("### Generating images...")
+        st.progress(job.progress)
+    
+    # Display generated images
+    st.markdown("### Generated Images")
+    st.markdown(f"**Prompt:** {job.prompt if job is not None else st.session_state.prompt}")
+    
+    flight_stats = request_flights.stats()
+    if flight_stats['coalesced']:
+        st.caption(f"{flight_stats['coalesced']} duplicate provider request(s) shared an in-flight call")
     
-    # Use ThreadPoolExecutor to run API calls in parallel
-    results = {}
-    if generators:
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            # Submit all tasks and collect futures
-            futures = {executor.submit(generator): name for name, generator in generators}
+    file_timestamp = int(job.created_at) if job is not None else int(time.time())
+    
+    # Create columns for each provider
+    cols = st.columns(len(providers))
+    
+    for i, name in enumerate(providers):
+        with cols[i]:
+            st.markdown(f"#### {name}")
             
-            # Process futures as they complete
-            for future in futures:
-                name = futures[future]
+            result = st.session_state.generated_images.get(name)
+            if result is None:
+                st.info("Generating...")
+            elif not result.ok:
+                st.error(f"Error: {result.error}")
+            else:
+                # Some of a fanned-out provider's requests failed; say why images are missing
+                errors = result.metadata.get("errors")
+                if errors:
+                    st.warning(f"{len(errors)} of {result.count + len(errors)} request(s) failed: {errors[0]}")
                 try:
-                    result = future.result()
-                    results[name] = result
+                    file_prefix = f"{name.lower().replace(' ', '_')}_{file_timestamp}"
+                    # The run history saves this same result object: whichever gets here first
+                    # downloads the URL images, once, and polling reruns reuse them
+                    with span("app.download", images=len(result.urls)):
+                        images = result.fetch()
+                    for image_idx in range(result.count):
+                        url = result.urls[image_idx] if image_idx < len(result.urls) else None
+                        image_data = images[image_idx] if image_idx < len(images) else None
+                        
+                        # Display from the provider's URL when there is one; bytes are served as-is
+                        if url or image_data:
+                            st.image(url or image_data, use_column_width=True)
+                        
+                        # Download button
+                        if image_data:
+                            st.download_button(
+                                label="Download",
+                                data=image_data,
+                                file_name=f"{file_prefix}{'_' + str(image_idx + 1) if result.count > 1 else ''}"
+                                          f"{result.extension}",
+                                mime=result.mime_type,
+                                key=f"download_{file_prefix}_{image_idx}"
+                            )
                 except Exception as e:
-                    results[name] = {'error': str(e)}
-    else:
-        st.error("No API keys configured. Please add at least one API key in the API Keys Configuration section.")
-    
-    st.session_state.generated_images = results
-    st.session_state.loading = False
+                    st.error(f"Error displaying image: {str(e)}")
+
+def render_archive_search():
+    """Full-text search over previously generated images"""
+    with st.expander("Search past generations"):
+        query = st.text_input("Search prompts", key="archive_query")
+        if not query.strip():
+            return
+        
+        archive_index = get_archive_index()
+        started = time.monotonic()
+        rows = archive_index.search(query, limit=24)
+        st.caption(f"{len(rows)} result(s) in {(time.monotonic() - started) * 1000:.1f} ms")
+        
+        cols = st.columns(4)
+        for i, row in enumerate(rows):
+            with cols[i % 4]:
+                filepath = archive_index.absolute_path(row['path'])
+                if os.path.exists(filepath):
+                    st.image(filepath, caption=f"{row['model_name']}: {row['prompt'][:80]}", use_column_width=True)
+
+def render_run_history():
+    """Reload the results of a previous run from the archive"""
+    with st.expander("Past runs"):
+        runs = get_run_history().recent()
+        if not runs:
+            st.caption("Finished runs are saved to generated_images/ and listed here.")
+            return
+        
+        labels = {
+            run['id']: f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(run['created_at']))} - {run['prompt'][:60]}"
+            for run in runs
+        }
+        run_id = st.selectbox("Run", list(labels), format_func=labels.get)
+        if st.button("Load run", disabled=st.session_state.loading):
+            run = next(run for run in runs if run['id'] == run_id)
+            st.session_state.generated_images = get_run_history().load(run)
+            st.session_state.prompt = run['prompt']
+            st.session_state.job_id = None
+            st.rerun()
+
+def render_diagnostics():
+    """Per-provider latency, error and throughput figures for this server process"""
+    with st.expander("Diagnostics"):
+        rows = provider_summary()
+        if not rows:
+            st.caption("No provider requests yet.")
+        else:
+            st.dataframe([
+                {
+                    "Provider": row['provider'],
+                    "Model": row['model'],
+                    "Requests": row['requests'],
+                    "Error rate": f"{row['error_rate']:.0%}",
+                    "p50 (s)": f"{row['p50_s']:.1f}" if row['p50_s'] is not None else "-",
+                    "p95 (s)": f"{row['p95_s']:.1f}" if row['p95_s'] is not None else "-",
+                    "In flight": row['in_flight'],
+                    "Req/min (5 min)": f"{row['per_minute']:.1f}",
+                }
+                for row in rows
+            ], use_container_width=True)
+        st.download_button("Download metrics (Prometheus format)", metrics_registry.render_prometheus(),
+                           file_name="metrics.prom", mime="text/plain")
 
 def main():
     st.title("AI Image Generator Comparison")
+    start_metrics_exporters()
+    # Record or replay provider HTTP traffic, if IMAGEGENIE_CASSETTE is set
+    install_cassette()
     
     with st.expander("API Keys Configuration", expanded=not any(st.session_state.api_keys_set.values())):
         st.markdown("""
@@ -193,13 +343,22 @@ def main():
     st.subheader("Enter your prompt")
     prompt = st.text_area("Image Generation Prompt", st.session_state.prompt, height=100)
     
+    images_per_provider = st.slider(
+        "Images per provider",
+        min_value=1,
+        max_value=4,
+        value=st.session_state.images_per_provider,
+        help="Google and Ideogram return all images from one request; other providers run parallel requests."
+    )
+    st.session_state.images_per_provider = images_per_provider
+    
     # Generate button
     generate_col, status_col = st.columns([2, 3])
     
     with generate_col:
         if st.button("Generate Images", disabled=not any(st.session_state.api_keys_set.values()) or not prompt):
             st.session_state.prompt = prompt
-            generate_images(prompt)
+            generate_images(prompt, images_per_provider)
     
     with status_col:
         if not any(st.session_state.api_keys_set.values()):
@@ -207,54 +366,13 @@ def main():
         elif not prompt:
             st.info("Enter a prompt to generate images.")
     
-    # Display loading status
-    if st.session_state.loading:
-        st.markdown("### Generating images...")
-        st.progress(0.75)
+    # Display results; while a job is running only this fragment reruns, once a second
+    st.fragment(run_every=1.0 if st.session_state.loading else None)(render_generation_results)()
     
-    # Display generated images
-    if st.session_state.generated_images:
-        st.markdown("### Generated Images")
-        st.markdown(f"**Prompt:** {st.session_state.prompt}")
-        
-        # Create columns for each generated image
-        cols = st.columns(len(st.session_state.generated_images))
-        
-        for i, (name, result) in enumerate(st.session_state.generated_images.items()):
-            with cols[i]:
-                st.markdown(f"#### {name}")
-                
-                if 'error' in result:
-                    st.error(f"Error: {result['error']}")
-                else:
-                    try:
-                        if 'url' in result:
-                            # Display image from URL
-                            st.image(result['url'], use_column_width=True)
-                            
-                            # Download button
-                            image_data = save_image_from_url(result['url'])
-                            if image_data:
-                                st.download_button(
-                                    label="Download",
-                                    data=image_data,
-                                    file_name=f"{name.lower().replace(' ', '_')}_{int(time.time())}.png",
-                                    mime="image/png"
-                                )
-                        elif 'image_data' in result:
-                            # Display image from bytes
-                            image = Image.open(io.BytesIO(result['image_data']))
-                            st.image(image, use_column_width=True)
-                            
-                            # Download button
-                            st.download_button(
-                                label="Download",
-                                data=result['image_data'],
-                                file_name=f"{name.lower().replace(' ', '_')}_{int(time.time())}.png",
-                                mime="image/png"
-                            )
-                    except Exception as e:
-                        st.error(f"Error displaying image: {str(e)}")
+    render_run_history()
+    render_archive_search()
+    render_diagnostics()
+    mark_startup("app", "first_render")
 
 if __name__ == "__main__":
     main()
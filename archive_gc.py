@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+import time
+
+
+class RetentionPolicy:
+    """
+    How much of the archive to keep
+
+    Args:
+        max_bytes: Delete the oldest images while the archive is larger than this
+        max_age_days: Delete images older than this many days
+        keep_starred: Never delete starred images
+    """
+    def __init__(self, max_bytes=None, max_age_days=None, keep_starred=True):
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.keep_starred = keep_starred
+
+    @property
+    def enabled(self):
+        return self.max_bytes is not None or self.max_age_days is not None
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build a policy from the "retention" section of settings.json"""
+        retention = settings.get("retention") or {}
+        return cls(
+            max_bytes=retention.get("max_bytes"),
+            max_age_days=retention.get("max_age_days"),
+            keep_starred=retention.get("keep_starred", True)
+        )
+
+    def to_settings(self):
+        return {"max_bytes": self.max_bytes, "max_age_days": self.max_age_days, "keep_starred": self.keep_starred}
+
+
+class ArchiveSweeper:
+    """
+    Applies a RetentionPolicy to the archive in a low-priority background thread
+
+    Candidates come from the metadata index (oldest first), never from walking
+    the tree. Each deleted image is removed from disk (through the blob store,
+    so shared content is only freed with its last path), from the index and
+    from the thumbnail atlas, and on_change is called with the removed paths.
+    Deletions happen in small batches with a pause in between so a large sweep
+    doesn't compete with generation for disk I/O.
+    """
+    def __init__(self, archive_index, policy=None, blob_store=None, thumbnail_atlas=None, on_change=None,
+                 log=None, interval=600, batch_size=100, batch_pause=0.2):
+        self.archive_index = archive_index
+        self.policy = policy or RetentionPolicy()
+        self.blob_store = blob_store
+        self.thumbnail_atlas = thumbnail_atlas
+        self.on_change = on_change or (lambda paths: None)
+        self.log = log or (lambda message: None)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="archive-sweeper")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def set_policy(self, policy):
+        """Replace the policy and sweep with it soon"""
+        self.policy = policy
+        self._wake.set()
+
+    def _run(self):
+        if sys.platform.startswith("linux"):
+            # On Linux priorities are per thread, so this only lowers the sweeper
+            try:
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+            except (AttributeError, OSError):
+                pass
+        while not self._stop.is_set():
+            try:
+                self.sweep()
+            except Exception as e:
+                self.log(f"Archive cleanup error: {str(e)}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def sweep(self):
+        """
+        Delete whatever the policy says should go
+
+        Returns:
+            tuple: (number of images deleted, bytes freed)
+        """
+        policy = self.policy
+        if not policy.enabled:
+            return 0, 0
+        include_starred = not policy.keep_starred
+        deleted = freed = 0
+
+        if policy.max_age_days is not None:
+            cutoff = time.time() - policy.max_age_days * 86400
+            while not self._stop.is_set():
+                rows = self.archive_index.oldest(self.batch_size, before=cutoff, include_starred=include_starred)
+                if not rows:
+                    break
+                count, size = self._delete(rows)
+                deleted += count
+                freed += size
+
+        if policy.max_bytes is not None:
+            while not self._stop.is_set():
+                excess = self.archive_index.stored_bytes() - policy.max_bytes
+                if excess <= 0:
+                    break
+                rows = self.archive_index.oldest(self.batch_size, include_starred=include_starred)
+                if not rows:
+                    break  # Only kept (starred) images are left
+                # Take just enough of the oldest to cover the excess; shared content can
+                # free less than expected, which the next round makes up
+                needed = 0
+                for needed, row in enumerate(rows, 1):
+                    excess -= row['size_bytes'] or 0
+                    if excess <= 0:
+                        break
+                count, size = self._delete(rows[:needed])
+                deleted += count
+                freed += size
+
+        if deleted:
+            self.log(f"Archive cleanup: deleted {deleted} image(s), freed {freed / (1024 * 1024):.1f} MB")
+        return deleted, freed
+
+    def _delete(self, rows):
+        """Delete one batch of images and everything derived from them"""
+        paths = [row['path'] for row in rows]
+        filepaths = [self.archive_index.absolute_path(path) for path in paths]
+        freed = 0
+        for filepath in filepaths:
+            try:
+                if self.blob_store is not None:
+                    freed += self.blob_store.unlink(filepath)
+                elif os.path.exists(filepath):
+                    freed += os.path.getsize(filepath)
+                    os.remove(filepath)
+            except OSError as e:
+                self.log(f"Archive cleanup: could not delete {filepath}: {str(e)}")
+
+        # Drop the rows even for files that were already gone, or they would be picked again
+        self.archive_index.remove(filepaths)
+        if self.thumbnail_atlas is not None:
+            for path in paths:
+                self.thumbnail_atlas.remove(path)
+        self.on_change(paths)
+        self._stop.wait(self.batch_pause)
+        return len(paths), freed
@@ -0,0 +1,333 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import struct
+import time
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    model_name TEXT NOT NULL,
+    model_id TEXT,
+    provider TEXT,
+    prompt TEXT NOT NULL,
+    original_prompt TEXT,
+    params TEXT,
+    created_at REAL NOT NULL,
+    generation_ms REAL,
+    download_ms REAL,
+    total_ms REAL,
+    width INTEGER,
+    height INTEGER,
+    size_bytes INTEGER,
+    sha256 TEXT,
+    starred INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS images_created_at ON images (created_at);
+CREATE INDEX IF NOT EXISTS images_model_created_at ON images (model_name, created_at);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+"""
+
+# Full-text index over the prompts, kept in sync with the images table by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE images_fts USING fts5(
+    prompt, original_prompt, content='images', content_rowid='id', tokenize='porter unicode61'
+);
+CREATE TRIGGER images_fts_insert AFTER INSERT ON images BEGIN
+    INSERT INTO images_fts (rowid, prompt, original_prompt) VALUES (new.id, new.prompt, new.original_prompt);
+END;
+CREATE TRIGGER images_fts_delete AFTER DELETE ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt, original_prompt)
+    VALUES ('delete', old.id, old.prompt, old.original_prompt);
+END;
+CREATE TRIGGER images_fts_update AFTER UPDATE OF prompt, original_prompt ON images BEGIN
+    INSERT INTO images_fts (images_fts, rowid, prompt, original_prompt)
+    VALUES ('delete', old.id, old.prompt, old.original_prompt);
+    INSERT INTO images_fts (rowid, prompt, original_prompt) VALUES (new.id, new.prompt, new.original_prompt);
+END;
+INSERT INTO images_fts (images_fts) VALUES ('rebuild');
+"""
+
+COLUMNS = ("path", "model_name", "model_id", "provider", "prompt", "original_prompt", "params",
+           "created_at", "generation_ms", "download_ms", "total_ms", "width", "height",
+           "size_bytes", "sha256", "starred")
+
+
+class ArchiveIndex:
+    """
+    SQLite metadata index over the images saved under generated_images/
+
+    The database runs in WAL mode so the UI can query while generation threads
+    write. Each thread gets its own connection; every write is one transaction.
+    Paths are stored relative to the archive root.
+    """
+    def __init__(self, root_dir, filename="index.sqlite3"):
+        self.root_dir = root_dir
+        self.path = os.path.join(root_dir, filename)
+        self._local = threading.local()
+        if not os.path.exists(root_dir):
+            os.makedirs(root_dir)
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+            has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'").fetchone()
+            if not has_fts:
+                # Creates the index and backfills it from existing rows
+                conn.executescript(FTS_SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def relative_path(self, filepath):
+        return os.path.relpath(filepath, self.root_dir).replace(os.sep, "/")
+
+    def absolute_path(self, relative_path):
+        return os.path.join(self.root_dir, *relative_path.split("/"))
+
+    def add_image(self, filepath, image_data, model_name, prompt, model_id=None, provider=None,
+                  original_prompt=None, params=None, timings=None, size=None, created_at=None,
+                  replace=True):
+        """
+        Record a saved image
+
+        Args:
+            filepath: Path of the saved image file
+            image_data: The image bytes that were written (hashed, not stored)
+            model_name: Display name of the model
+            prompt: Full prompt the image was generated from
+            model_id: Provider model identifier
+            provider: Provider name (e.g. "replicate")
+            original_prompt: The user's prompt before enhancement, if it was enhanced
+            params: Optional dict of generation parameters
+            timings: Optional dict with generation_ms, download_ms and total_ms
+            size: Optional (width, height) of the image
+            created_at: Unix timestamp; defaults to now
+            replace: Overwrite an existing row for the same path; when False an
+                existing row is left untouched
+
+        Returns:
+            int: Row id of the image
+        """
+        timings = timings or {}
+        width, height = size or (None, None)
+        row = {
+            "path": self.relative_path(filepath),
+            "model_name": model_name,
+            "model_id": model_id,
+            "provider": provider,
+            "prompt": prompt,
+            "original_prompt": original_prompt,
+            "params": json.dumps(params, sort_keys=True) if params else None,
+            "created_at": created_at or time.time(),
+            "generation_ms": timings.get("generation_ms"),
+            "download_ms": timings.get("download_ms"),
+            "total_ms": timings.get("total_ms"),
+            "width": width,
+            "height": height,
+            "size_bytes": len(image_data),
+            "sha256": hashlib.sha256(image_data).hexdigest(),
+            "starred": 0,
+        }
+        placeholders = ", ".join(f":{column}" for column in COLUMNS)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in COLUMNS if column not in ("path", "starred"))
+        conflict = f"DO UPDATE SET {updates}" if replace else "DO NOTHING"
+        with self._connection() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO images ({', '.join(COLUMNS)}) VALUES ({placeholders}) "
+                f"ON CONFLICT (path) {conflict}",
+                row
+            )
+            return cursor.lastrowid
+
+    @staticmethod
+    def _filters(model_name=None, since=None, until=None):
+        """Build the WHERE clause and arguments for the common model/time filters"""
+        clauses, args = [], []
+        if model_name:
+            clauses.append("model_name = ?")
+            args.append(model_name)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            args.append(until)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), args
+
+    def query(self, model_name=None, since=None, until=None, limit=100, offset=0):
+        """Return image rows, newest first, optionally filtered by model and creation time"""
+        where, args = self._filters(model_name, since, until)
+        return self._connection().execute(
+            f"SELECT * FROM images {where} ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?",
+            args + [limit, offset]
+        ).fetchall()
+
+    def count(self, model_name=None, since=None, until=None):
+        where, args = self._filters(model_name, since, until)
+        return self._connection().execute(f"SELECT COUNT(*) FROM images {where}", args).fetchone()[0]
+
+    def get(self, filepath):
+        """Return the row for a file path, or None"""
+        return self._connection().execute(
+            "SELECT * FROM images WHERE path = ?", (self.relative_path(filepath),)).fetchone()
+
+    def model_names(self):
+        return [row[0] for row in self._connection().execute(
+            "SELECT DISTINCT model_name FROM images ORDER BY model_name")]
+
+    def set_starred(self, filepath, starred=True):
+        with self._connection() as conn:
+            conn.execute("UPDATE images SET starred = ? WHERE path = ?",
+                         (1 if starred else 0, self.relative_path(filepath)))
+
+    def move(self, old_filepath, new_filepath):
+        """Point an indexed image at its new location, keeping the rest of its row"""
+        with self._connection() as conn:
+            conn.execute("UPDATE images SET path = ? WHERE path = ?",
+                         (self.relative_path(new_filepath), self.relative_path(old_filepath)))
+
+    def remove(self, filepaths):
+        """Remove the rows for the given file paths"""
+        with self._connection() as conn:
+            conn.executemany("DELETE FROM images WHERE path = ?",
+                             [(self.relative_path(filepath),) for filepath in filepaths])
+
+    def stored_bytes(self):
+        """Bytes on disk for the indexed images, counting identical content once"""
+        return self._connection().execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM "
+            "(SELECT MAX(size_bytes) AS size_bytes FROM images GROUP BY COALESCE(sha256, path))"
+        ).fetchone()[0]
+
+    def oldest(self, limit=100, before=None, include_starred=False):
+        """Return the oldest image rows, optionally only those created before a timestamp"""
+        clauses, args = [], []
+        if before is not None:
+            clauses.append("created_at < ?")
+            args.append(before)
+        if not include_starred:
+            clauses.append("starred = 0")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._connection().execute(
+            f"SELECT * FROM images {where} ORDER BY created_at, id LIMIT ?", args + [limit]
+        ).fetchall()
+
+    def model_stats(self):
+        """Per-model image count, total bytes and average generation time"""
+        return self._connection().execute(
+            "SELECT model_name, COUNT(*) AS images, SUM(size_bytes) AS total_bytes, "
+            "AVG(generation_ms) AS avg_generation_ms FROM images GROUP BY model_name ORDER BY model_name"
+        ).fetchall()
+
+    @staticmethod
+    def fts_query(text):
+        """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+        words = [word.replace('"', '""') for word in text.split()]
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += "*"
+        return " ".join(terms)
+
+    def search(self, text, model_name=None, limit=50):
+        """
+        Full-text search over prompts and original (pre-enhancement) prompts
+
+        Args:
+            text: Free-text search terms
+            model_name: Optional model to restrict the results to
+            limit: Maximum number of results
+
+        Returns:
+            list: Image rows, best match first
+        """
+        query = self.fts_query(text)
+        if query is None:
+            return []
+        model_clause = "AND images.model_name = ?" if model_name else ""
+        args = [query] + ([model_name] if model_name else []) + [limit]
+        return self._connection().execute(
+            "SELECT images.* FROM images_fts JOIN images ON images.id = images_fts.rowid "
+            f"WHERE images_fts MATCH ? {model_clause} "
+            "ORDER BY bm25(images_fts, 1.0, 0.5), images.created_at DESC LIMIT ?",
+            args
+        ).fetchall()
+
+    def add_file(self, filepath):
+        """Index an existing image file from its path and contents alone"""
+        with open(filepath, 'rb') as f:
+            image_data = f.read()
+        # The model directory is the top level; sharded layouts add date/bucket levels below it
+        model_dir = self.relative_path(filepath).split("/")[0]
+        stem = os.path.splitext(os.path.basename(filepath))[0]
+        # "<sanitized prompt>_<timestamp>[_<n>][_<id>]" -> "sanitized prompt", timestamp
+        words = stem.split("_")
+        timestamp_positions = [i for i, word in enumerate(words) if word.isdigit() and len(word) == 10]
+        if timestamp_positions:
+            prompt_words = words[:timestamp_positions[-1]]
+            created_at = int(words[timestamp_positions[-1]])
+        else:
+            prompt_words = [word for word in words if not word.isdigit()]
+            created_at = os.path.getmtime(filepath)
+        return self.add_image(
+            filepath,
+            image_data,
+            model_dir.replace("_", " "),
+            " ".join(prompt_words),
+            size=image_size(image_data),
+            created_at=created_at,
+            replace=False
+        )
+
+    def refresh_file(self, filepath):
+        """Update the content columns (size, hash, dimensions) of an indexed file that changed on disk"""
+        with open(filepath, 'rb') as f:
+            image_data = f.read()
+        width, height = image_size(image_data) or (None, None)
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE images SET size_bytes = ?, sha256 = ?, width = ?, height = ? WHERE path = ?",
+                (len(image_data), hashlib.sha256(image_data).hexdigest(), width, height,
+                 self.relative_path(filepath))
+            )
+
+    def paths_in(self, directory):
+        """Return {relative path: size in bytes} for indexed files directly or indirectly under directory"""
+        prefix = self.relative_path(directory).rstrip("/") + "/"
+        if prefix == "./":
+            prefix = ""
+        # "/" sorts just before "0", so this is a prefix range scan on the path index
+        upper = prefix[:-1] + "0" if prefix else "\U0010ffff"
+        return {row[0]: row[1] for row in self._connection().execute(
+            "SELECT path, size_bytes FROM images WHERE path >= ? AND path < ?", (prefix, upper))}
+
+
+def image_size(image_data):
+    """Read (width, height) from a PNG or WebP header without decoding the image, or None"""
+    if image_data[:8] == b"\x89PNG\r\n\x1a\n" and len(image_data) >= 24:
+        return struct.unpack(">II", image_data[16:24])
+    if image_data[:4] == b"RIFF" and image_data[8:12] == b"WEBP" and len(image_data) >= 30:
+        chunk = image_data[12:16]
+        if chunk == b"VP8X":
+            width = int.from_bytes(image_data[24:27], "little") + 1
+            height = int.from_bytes(image_data[27:30], "little") + 1
+            return width, height
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", image_data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(image_data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
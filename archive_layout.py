@@ -0,0 +1,136 @@
+import hashlib
+import os
+import re
+import time
+import uuid
+
+
+class ArchiveLayout:
+    """
+    Decides where a new image goes under the archive root
+
+    The flat layout puts every image of a model in one directory:
+    Model/<prompt>_<timestamp>_<id>.png. The sharded layout adds the creation
+    date and a one-hex-digit hash bucket, Model/2025-03-25/a/<file>, so no
+    directory grows past one day's output / 16 and listing, syncing or backing
+    up a directory stays proportional to the shard. The archive index records
+    each image's full relative path, so readers never need to know which
+    layout wrote it and both can coexist.
+    """
+    LAYOUTS = ("flat", "sharded")
+
+    def __init__(self, root_dir, layout="flat"):
+        if layout not in self.LAYOUTS:
+            raise ValueError(f"Unknown archive layout: {layout}")
+        self.root_dir = root_dir
+        self.layout = layout
+
+    @classmethod
+    def from_settings(cls, root_dir, settings):
+        """The layout named by "archive_layout" in settings.json, flat if unset or unknown"""
+        layout = settings.get("archive_layout", "flat")
+        return cls(root_dir, layout if layout in cls.LAYOUTS else "flat")
+
+    @staticmethod
+    def filename_for(prompt, timestamp, suffix="", extension=".png"):
+        """
+        Readable, unique file name for a new image: <prompt, 50 chars>_<timestamp><suffix>_<id><extension>
+
+        The random id keeps images that finish in the same second from overwriting each other.
+        """
+        sanitized_prompt = re.sub(r'[^\w\s-]', '', prompt)
+        sanitized_prompt = re.sub(r'[\s-]+', '_', sanitized_prompt)
+        sanitized_prompt = sanitized_prompt[:50]
+        return f"{sanitized_prompt}_{int(timestamp)}{suffix}_{uuid.uuid4().hex[:8]}{extension}"
+
+    @staticmethod
+    def shard(filename, created_at):
+        """Return the "<date>/<bucket>" shard for a file name created at a Unix timestamp"""
+        day = time.strftime("%Y-%m-%d", time.localtime(created_at))
+        bucket = hashlib.sha1(filename.encode("utf-8")).hexdigest()[0]
+        return f"{day}/{bucket}"
+
+    def relative_path_for(self, model_dir, filename, created_at, layout=None):
+        """Relative path (with "/" separators) for a new file in the given model directory"""
+        if (layout or self.layout) == "sharded":
+            return f"{model_dir}/{self.shard(filename, created_at)}/{filename}"
+        return f"{model_dir}/{filename}"
+
+    def path_for(self, model_dir, filename, created_at):
+        """Absolute path for a new file in the given model directory"""
+        return os.path.join(self.root_dir, *self.relative_path_for(model_dir, filename, created_at).split("/"))
+
+
+def migrate(root_dir, layout="sharded", log=print):
+    """
+    Move every indexed image of an archive into the given layout
+
+    Run it while the app is closed. The index is brought up to date first so
+    that files it didn't know about are moved too; each image is then moved
+    together with its index row, blob link and thumbnail, and the run
+    manifests app.py wrote are pointed at the new paths, so nothing needs to
+    be rebuilt afterwards.
+
+    Returns:
+        int: Number of images moved
+    """
+    from archive_index import ArchiveIndex
+    from archive_sync import ArchiveSync
+    from blob_store import BlobStore
+    from run_history import rename_paths
+    from thumbnail_atlas import ThumbnailAtlas
+
+    archive_index = ArchiveIndex(root_dir)
+    thumbnail_atlas = ThumbnailAtlas(root_dir)
+    blob_store = BlobStore(root_dir)
+    ArchiveSync(root_dir, archive_index, thumbnail_atlas).reconcile()
+    target = ArchiveLayout(root_dir, layout)
+
+    renamed = {}
+    old_directories = set()
+    offset = 0
+    while True:
+        rows = archive_index.query(limit=500, offset=offset)
+        if not rows:
+            break
+        offset += len(rows)
+        for row in rows:
+            path = row['path']
+            model_dir, filename = path.split("/")[0], path.rsplit("/", 1)[-1]
+            new_path = target.relative_path_for(model_dir, filename, row['created_at'])
+            if new_path == path or "/" not in path:
+                continue
+            old_filepath = archive_index.absolute_path(path)
+            new_filepath = archive_index.absolute_path(new_path)
+            if os.path.lexists(new_filepath):
+                log(f"Skipping {path}: {new_path} already exists")
+                continue
+            if not blob_store.move(old_filepath, new_filepath):
+                os.makedirs(os.path.dirname(new_filepath), exist_ok=True)
+                os.rename(old_filepath, new_filepath)
+            archive_index.move(old_filepath, new_filepath)
+            thumbnail_atlas.move(path, new_path)
+            old_directories.add(os.path.dirname(old_filepath))
+            renamed[path] = new_path
+            # Moved rows keep their created_at order, so the query offset stays valid
+
+    # Drop shard directories that the move emptied
+    for directory in sorted(old_directories, key=len, reverse=True):
+        while os.path.abspath(directory) != os.path.abspath(root_dir):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+    thumbnail_atlas.close()
+    rewritten = rename_paths(root_dir, renamed)
+    log(f"Moved {len(renamed)} image(s) to the {layout} layout, updated {rewritten} run manifest(s)")
+    return len(renamed)
+
+
+if __name__ == "__main__":
+    # One-time migration: python archive_layout.py [root_dir] [sharded|flat]
+    import sys
+    migrate(sys.argv[1] if len(sys.argv) > 1 else "generated_images",
+            sys.argv[2] if len(sys.argv) > 2 else "sharded")
@@ -0,0 +1,333 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from archive_index import IMAGE_EXTENSIONS
+
+# inotify event masks (from <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def load_inotify():
+    """Return libc with the inotify functions, or None where inotify isn't available"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+class ArchiveSync:
+    """
+    Keeps the archive index and thumbnail atlas in step with generated_images/
+
+    On start, only directories whose mtime changed since the last run are
+    re-listed, so a restart doesn't rescan the tree. While running, changes are
+    picked up through inotify where available; elsewhere (or if inotify can't
+    be set up) the same mtime check runs every poll_interval seconds.
+    """
+    def __init__(self, root_dir, archive_index, thumbnail_atlas=None, on_change=None, log=None,
+                 poll_interval=5.0, settle_delay=0.5):
+        self.root_dir = root_dir
+        self.archive_index = archive_index
+        self.thumbnail_atlas = thumbnail_atlas
+        self.on_change = on_change or (lambda paths: None)
+        self.log = log or (lambda message: None)
+        self.poll_interval = poll_interval
+        self.settle_delay = settle_delay
+        # In a hidden directory: rewriting a file in the root would change the root's mtime
+        self.state_path = os.path.join(root_dir, ".sync", "state.json")
+        self._dir_mtimes = self._load_state()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Reconcile changed directories, then watch for changes in a daemon thread"""
+        self._thread = threading.Thread(target=self._run, daemon=True, name="archive-sync")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        started = time.monotonic()
+        changed = self.reconcile()
+        self.log(f"Archive sync: {len(changed)} change(s) found in {(time.monotonic() - started) * 1000:.0f} ms")
+
+        libc = load_inotify()
+        if libc is not None:
+            try:
+                self._watch_inotify(libc)
+                return
+            except OSError as e:
+                self.log(f"Archive sync: inotify unavailable ({str(e)}), polling instead")
+        self._poll()
+
+    # Directory-level reconciliation
+
+    def reconcile(self):
+        """
+        Re-check directories whose mtime changed since they were last synced
+
+        Known directories cost one stat each. Only a directory whose mtime
+        changed (or that is new) is listed, and new subdirectories can only
+        appear in such a directory, so an unchanged directory's children are
+        taken from the saved state rather than from a listing.
+
+        Returns:
+            list: Relative paths that were added, updated or removed
+        """
+        with self._lock:
+            changed = []
+            current = {}
+            known_children = {}
+            for dirpath in self._dir_mtimes:
+                known_children.setdefault(os.path.dirname(dirpath), []).append(dirpath)
+
+            pending = [self.root_dir]
+            while pending:
+                dirpath = pending.pop()
+                try:
+                    mtime = os.stat(dirpath).st_mtime
+                except OSError:
+                    continue
+                current[dirpath] = mtime
+                if self._dir_mtimes.get(dirpath) == mtime:
+                    pending.extend(known_children.get(dirpath, ()))
+                else:
+                    changed.extend(self._sync_directory(dirpath, subdirs=pending))
+
+            # Directories that disappeared take their index entries with them
+            for dirpath in set(self._dir_mtimes) - set(current):
+                for path in self.archive_index.paths_in(dirpath):
+                    self._remove(path)
+                    changed.append(path)
+
+            if current != self._dir_mtimes:
+                self._dir_mtimes = current
+                self._save_state()
+
+        if changed:
+            self.on_change(changed)
+        return changed
+
+    def _sync_directory(self, dirpath, subdirs=None):
+        """
+        Bring the entries for the files directly in dirpath up to date
+
+        The (non-hidden) subdirectories found are appended to subdirs if given.
+        """
+        changed = []
+        prefix = self.archive_index.relative_path(dirpath)
+        prefix = "" if prefix == "." else prefix + "/"
+        indexed = {path: size for path, size in self.archive_index.paths_in(dirpath).items()
+                   if "/" not in path[len(prefix):]}
+        try:
+            with os.scandir(dirpath) as scan:
+                entries = list(scan)
+        except OSError:
+            entries = []
+
+        on_disk = set()
+        for entry in entries:
+            if subdirs is not None and not entry.name.startswith(".") and entry.is_dir(follow_symlinks=False):
+                subdirs.append(os.path.join(dirpath, entry.name))
+                continue
+            if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            filepath = os.path.join(dirpath, entry.name)
+            path = self.archive_index.relative_path(filepath)
+            on_disk.add(path)
+            if self._sync_file(filepath, indexed.get(path)):
+                changed.append(path)
+
+        for path in set(indexed) - on_disk:
+            self._remove(path)
+            changed.append(path)
+        return changed
+
+    def _sync_file(self, filepath, indexed_size=None, known=True):
+        """Add or update one file; returns True if anything changed"""
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            return False
+        path = self.archive_index.relative_path(filepath)
+        if not known:
+            row = self.archive_index.get(filepath)
+            indexed_size = row['size_bytes'] if row is not None else None
+
+        did_change = False
+        try:
+            if indexed_size is None:
+                self.archive_index.add_file(filepath)
+                did_change = True
+            elif indexed_size != stat.st_size:
+                self.archive_index.refresh_file(filepath)
+                did_change = True
+        except OSError:
+            return False
+
+        if self.thumbnail_atlas is not None and not self.thumbnail_atlas.is_current(path, stat.st_mtime):
+            did_change = self.thumbnail_atlas.add_file(path, filepath) or did_change
+        return did_change
+
+    def _remove(self, path):
+        self.archive_index.remove([self.archive_index.absolute_path(path)])
+        if self.thumbnail_atlas is not None:
+            self.thumbnail_atlas.remove(path)
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(self._dir_mtimes, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass
+
+    # Watching
+
+    def _poll(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                self.log(f"Archive sync error: {str(e)}")
+
+    def _watch_inotify(self, libc):
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        watches = {}
+
+        def add_watch(dirpath):
+            wd = libc.inotify_add_watch(fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd >= 0:
+                watches[wd] = dirpath
+
+        try:
+            for dirpath in list(self._dir_mtimes):
+                add_watch(dirpath)
+            if not watches:
+                raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+            # Catch anything that changed between the reconcile and the watches
+            self.reconcile()
+
+            pending = {}  # filepath -> time of last event
+            while not self._stop.is_set():
+                readable, _, _ = select.select([fd], [], [], self.settle_delay)
+                if readable:
+                    try:
+                        buffer = os.read(fd, 64 * 1024)
+                    except BlockingIOError:
+                        buffer = b""
+                    overflow = self._parse_events(buffer, watches, pending, add_watch)
+                    if overflow:
+                        pending.clear()
+                        self.reconcile()
+
+                # Handle files once they have been quiet for settle_delay
+                now = time.monotonic()
+                ready = [filepath for filepath, seen in pending.items() if now - seen >= self.settle_delay]
+                if ready:
+                    for filepath in ready:
+                        del pending[filepath]
+                    self._apply_events(ready)
+        finally:
+            os.close(fd)
+
+    def _parse_events(self, buffer, watches, pending, add_watch):
+        """Record the files touched by a buffer of inotify events; returns True on queue overflow"""
+        offset = 0
+        now = time.monotonic()
+        while offset + EVENT_HEADER.size <= len(buffer):
+            wd, mask, _, name_length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + name_length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + name_length
+
+            if mask & IN_Q_OVERFLOW:
+                return True
+            dirpath = watches.get(wd)
+            if dirpath is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                del watches[wd]
+                pending[dirpath] = now
+                continue
+
+            filepath = os.path.join(dirpath, os.fsdecode(name))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not os.path.basename(filepath).startswith("."):
+                    add_watch(filepath)
+                pending[filepath] = now
+            elif filepath.lower().endswith(IMAGE_EXTENSIONS):
+                pending[filepath] = now
+        return False
+
+    def _apply_events(self, filepaths):
+        changed = []
+        with self._lock:
+            for filepath in filepaths:
+                path = self.archive_index.relative_path(filepath)
+                if os.path.isdir(filepath):
+                    for dirpath, dirnames, _ in os.walk(filepath):
+                        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+                        changed.extend(self._sync_directory(dirpath))
+                elif os.path.exists(filepath):
+                    if self._sync_file(filepath, known=False):
+                        changed.append(path)
+                else:
+                    # A removed file, or a removed directory and everything under it
+                    removed = [path] if self.archive_index.get(filepath) is not None else []
+                    removed += list(self.archive_index.paths_in(filepath))
+                    for removed_path in removed:
+                        self._remove(removed_path)
+                    changed.extend(removed)
+
+                parent = os.path.dirname(filepath)
+                try:
+                    self._dir_mtimes[parent] = os.stat(parent).st_mtime
+                except OSError:
+                    self._dir_mtimes.pop(parent, None)
+                if not os.path.isdir(filepath):
+                    self._dir_mtimes.pop(filepath, None)
+                else:
+                    self._dir_mtimes[filepath] = os.stat(filepath).st_mtime
+            self._save_state()
+
+        if changed:
+            self.on_change(changed)
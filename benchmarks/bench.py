@@ -0,0 +1,357 @@
+"""
+Offline throughput benchmarks against the local mock provider server
+
+Scenarios:
+    app   The Streamlit path: JobManager jobs built with utils.build_generators
+          (all four api_clients), with URL results downloaded as the results
+          view does
+    grok  The desktop path: ImageGeneratorApp._generate_image_thread (Replicate
+          prediction, download, decode, batched save and indexing) on a
+          headless app instance writing to a temporary archive
+
+Each scenario runs in its own process against a mock server subprocess and
+reports images/sec, latency percentiles, provider errors, peak RSS and peak
+thread count. Results are compared with benchmarks/baselines.json; a run
+that is more than --tolerance worse on any figure exits with status 1, as
+does a scenario that wrote no images or had more than --max-errors provider
+errors (such a run is never saved as a baseline).
+
+    python -m benchmarks.bench                      # run all scenarios, compare
+    python -m benchmarks.bench --save-baseline      # record this machine's baseline
+    python -m benchmarks.bench --scenario grok --jobs 200 --concurrency 16 --time-scale 0.1
+
+With --cassette DIR the provider traffic is replayed from a cassette (see
+cassettes.py) instead of the mock server; record one from real providers by
+running the app with IMAGEGENIE_CASSETTE=DIR IMAGEGENIE_CASSETTE_MODE=record.
+--cassette-mode record captures the mock server's responses instead.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SCENARIOS = ("app", "grok")
+
+# Figures compared against the baseline, and whether higher is better
+COMPARED = {
+    "images_per_sec": True,
+    "p50_s": False,
+    "p95_s": False,
+    "peak_rss_mb": False,
+    "peak_threads": False,
+}
+
+
+def percentile(values, q):
+    """Linear-interpolated q-quantile (0..1) of values, or None if empty"""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = q * (len(values) - 1)
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+class ThreadSampler:
+    """Samples the live thread count in the background and keeps the peak"""
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="bench-thread-sampler")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            # Don't count the sampler itself
+            self.peak = max(self.peak, threading.active_count() - 1)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def start_mock_server(args):
+    """Start benchmarks.mock_provider in a subprocess; returns (process, base URL)"""
+    command = [sys.executable, "-m", "benchmarks.mock_provider", "--port", "0",
+               "--time-scale", str(args.time_scale), "--seed", str(args.seed)]
+    if args.profiles:
+        command += ["--profiles", args.profiles]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Mock providers listening on "):
+        process.kill()
+        raise RuntimeError(f"Mock provider server did not start: {line!r}")
+    return process, line.split()[-1]
+
+
+def provider_errors():
+    from metrics import provider_requests
+    with provider_requests._lock:
+        return sum(value for key, value in provider_requests._values.items() if key[-1] == "error")
+
+
+def run_app_scenario(args):
+    """Drive the Streamlit generation path; returns (latencies, images)"""
+    from jobs import JobManager
+    from utils import build_generators
+
+    api_keys = {name: "mock" for name in ("openai", "google", "recraft", "ideogram")}
+    latencies = []
+    images = [0]
+    lock = threading.Lock()
+    remaining = threading.Semaphore(0)
+
+    def on_result(job, provider, result):
+        # What the results view does with each provider's result
+        try:
+            count = len([data for data in result.fetch() if data]) if result.ok else 0
+            with lock:
+                latencies.append(time.time() - job.created_at)
+                images[0] += count
+        finally:
+            remaining.release()
+
+    manager = JobManager(max_workers=args.concurrency, max_finished_jobs=args.jobs, on_result=on_result)
+    results = 0
+    for i in range(args.jobs):
+        prompt = f"{args.prompt} #{i}"
+        generators = build_generators(prompt, api_keys, args.images)
+        manager.submit(prompt, generators, credentials=api_keys.values(),
+                       params={"images_per_provider": args.images})
+        results += len(generators)
+    for _ in range(results):
+        remaining.acquire()
+    manager.executor.shutdown(wait=True)
+    return latencies, images[0]
+
+
+class _HeadlessRoot:
+    """Stands in for the Tk root: UI callbacks scheduled with after() are dropped"""
+    def after(self, delay, callback=None, *args):
+        return None
+
+
+def run_grok_scenario(args):
+    """Drive ImageGeneratorApp._generate_image_thread without a window; returns (latencies, images)"""
+    from grok import ImageGeneratorApp
+
+    app = ImageGeneratorApp.headless(_HeadlessRoot(), tempfile.mkdtemp(prefix="imagegenie-bench-"), args.layout)
+    app.add_log = lambda message: None
+
+    latencies = []
+    lock = threading.Lock()
+    complete_event = threading.Event()
+
+    def generate(i):
+        name = f"{args.model} ({i})"
+        started = time.monotonic()
+        app._generate_image_thread("r8_mock", f"{args.prompt} #{i}", name, args.model, i, complete_event, name)
+        with lock:
+            latencies.append(time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(generate, range(args.jobs)))
+    app.image_writer.flush()
+    images = app.image_writer.stats()["written"]
+    app.image_writer.close()
+    return latencies, images
+
+
+def run_scenario(args):
+    """Run one scenario in this process and return its figures"""
+    errors_before = provider_errors()
+    with ThreadSampler() as sampler:
+        started = time.monotonic()
+        latencies, images = (run_app_scenario if args.scenario == "app" else run_grok_scenario)(args)
+        elapsed = time.monotonic() - started
+    return {
+        "scenario": args.scenario,
+        "jobs": args.jobs,
+        "images": images,
+        "elapsed_s": elapsed,
+        "images_per_sec": images / elapsed if elapsed else 0.0,
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "errors": provider_errors() - errors_before,
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+        "peak_threads": sampler.peak,
+    }
+
+
+def baseline_key(args, scenario):
+    """Baselines are only comparable between runs with the same settings"""
+    key = (f"{scenario}:jobs={args.jobs}:concurrency={args.concurrency}:images={args.images}"
+           f":time_scale={args.time_scale}:seed={args.seed}:profiles={os.path.basename(args.profiles or 'default')}")
+    if args.cassette and args.cassette_mode == "replay":
+        key += f":cassette={os.path.basename(os.path.normpath(args.cassette))}:timing={args.cassette_timing}"
+    return key
+
+
+def load_baselines():
+    try:
+        with open(BASELINE_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baselines(entries):
+    """Merge entries (key -> figures) into the stored baselines"""
+    baselines = load_baselines()
+    baselines.update(entries)
+    with open(BASELINE_PATH, 'w') as f:
+        json.dump(baselines, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(result, baseline, tolerance, figures=COMPARED):
+    """Return a message per figure that is worse than the baseline by more than tolerance"""
+    regressions = []
+    for figure, higher_is_better in figures.items():
+        current, previous = result.get(figure), baseline.get(figure)
+        if current is None or not previous:
+            continue
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{figure}: {previous:.3f} -> {current:.3f} ({change:+.0%})")
+    return regressions
+
+
+def failures(result, max_errors):
+    """Return why a scenario's run doesn't count as a measurement, if it doesn't"""
+    problems = []
+    if not result["images"]:
+        problems.append("no images written")
+    if result["errors"] > max_errors:
+        problems.append(f"{result['errors']} provider error(s), at most {max_errors} allowed")
+    return problems
+
+
+def print_result(result):
+    def seconds(value):
+        return "-" if value is None else f"{value:.3f}s"
+    print(f"{result['scenario']:>5}: {result['images']} images in {result['elapsed_s']:.2f}s "
+          f"= {result['images_per_sec']:.2f} img/s | latency p50 {seconds(result['p50_s'])} "
+          f"p95 {seconds(result['p95_s'])} p99 {seconds(result['p99_s'])} | errors {result['errors']} | "
+          f"peak RSS {result['peak_rss_mb']:.0f} MB | peak threads {result['peak_threads']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline image generation benchmarks")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--jobs", type=int, default=50, help="Generation jobs per scenario")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent generation workers")
+    parser.add_argument("--images", type=int, default=1, help="Images per provider (app scenario)")
+    parser.add_argument("--model", default="black-forest-labs/flux-schnell", help="Replicate model (grok scenario)")
+    parser.add_argument("--layout", default="flat", help="Archive layout (grok scenario)")
+    parser.add_argument("--prompt", default="A lighthouse on a cliff at dusk")
+    parser.add_argument("--profiles", help="JSON file of per-provider mock profile overrides")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Multiply every mock latency by this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cassette", help="Cassette directory to replay (or record) provider traffic")
+    parser.add_argument("--cassette-mode", choices=("record", "replay"), default="replay")
+    parser.add_argument("--cassette-timing", type=float, default=1.0,
+                        help="Scale for replayed response times (0 answers immediately)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--max-errors", type=int, default=0,
+                        help="Provider errors a scenario may have (raise it for profiles with an error rate)")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    parser.add_argument("--json", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.json:
+        # Child process: one scenario against an already running server
+        from benchmarks.mock_provider import provider_environment
+        environment = provider_environment(args.base_url or "")
+        if not args.base_url:
+            # Replaying: the clients talk to their real hosts and the cassette answers
+            environment = {name: value for name, value in environment.items() if "BASE_URL" not in name}
+        os.environ.update(environment)
+        sys.path.insert(0, REPO_ROOT)
+        os.chdir(REPO_ROOT)
+        if args.cassette:
+            from cassettes import Cassette
+            Cassette(args.cassette, args.cassette_mode, args.cassette_timing).install()
+        print(json.dumps(run_scenario(args)))
+        return 0
+
+    replaying = args.cassette and args.cassette_mode == "replay"
+    server, base_url = (None, None) if replaying else start_mock_server(args)
+    results = []
+    try:
+        scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+        for scenario in scenarios:
+            # A fresh process per scenario, so peak RSS and thread counts are its own
+            child_args = [arg for arg in (argv if argv is not None else sys.argv[1:])
+                          if arg != "--save-baseline"]
+            if base_url:
+                child_args += ["--base-url", base_url]
+            child = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench", *child_args, "--scenario", scenario, "--json"],
+                cwd=REPO_ROOT, stdout=subprocess.PIPE, text=True
+            )
+            if child.returncode != 0:
+                print(f"{scenario}: benchmark failed (exit status {child.returncode})", file=sys.stderr)
+                return child.returncode
+            result = json.loads(child.stdout.strip().splitlines()[-1])
+            print_result(result)
+            results.append(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    # A run where requests failed measures the failure path; don't compare it or save it as a baseline
+    failed = False
+    for result in results:
+        for problem in failures(result, args.max_errors):
+            print(f"{result['scenario']}: FAILED {problem}", file=sys.stderr)
+            failed = True
+    if failed:
+        return 1
+
+    if args.save_baseline:
+        save_baselines({baseline_key(args, result["scenario"]): {figure: result[figure] for figure in COMPARED}
+                        for result in results})
+        print(f"Saved baselines to {BASELINE_PATH}")
+        return 0
+
+    baselines = load_baselines()
+
+    status = 0
+    for result in results:
+        baseline = baselines.get(baseline_key(args, result["scenario"]))
+        if baseline is None:
+            print(f"{result['scenario']}: no baseline for these settings (run with --save-baseline)")
+            continue
+        regressions = compare(result, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"{result['scenario']}: REGRESSION {regression}")
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
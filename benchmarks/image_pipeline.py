@@ -0,0 +1,195 @@
+"""
+Microbenchmarks for the local image work: decode, resize and encode
+
+Runs headless over a corpus of PNGs from generated_images/ (or --corpus):
+
+    decode/open_load            Image.open + load, as app.py does before st.image
+    utils/save_image_from_bytes  decode and PNG re-encode of every downloaded image
+    resize/<filter>/<box>       the carousels' fit-to-frame resize (embedded 500x400,
+                                fullscreen 700x400) with each resampling filter
+    encode/<format>             encoder settings for saving and re-encoding
+
+Each case reports milliseconds per image (median and p95 over --repeat passes),
+the peak of Python-level allocations while it ran (tracemalloc: bytes objects
+and buffers, not Pillow's pixel storage) and the output size where there is
+one. Baselines share benchmarks/baselines.json with bench.py.
+
+    python -m benchmarks.image_pipeline                  # run and compare
+    python -m benchmarks.image_pipeline --save-baseline
+    python -m benchmarks.image_pipeline --filter resize --repeat 5
+"""
+import argparse
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+from PIL import Image
+
+from benchmarks.bench import REPO_ROOT, compare, load_baselines, percentile, save_baselines
+
+# Frame sizes the carousels fall back to before Tk has laid them out
+CAROUSEL_BOXES = {"embedded": (500, 400), "fullscreen": (700, 400)}
+
+RESAMPLING_FILTERS = {
+    "nearest": Image.NEAREST,
+    "bilinear": Image.BILINEAR,
+    "bicubic": Image.BICUBIC,
+    "lanczos": Image.LANCZOS,
+}
+
+ENCODERS = {
+    "png": {"format": "PNG"},
+    "png-fast": {"format": "PNG", "compress_level": 1},
+    "png-max": {"format": "PNG", "compress_level": 9},
+    "png-optimize": {"format": "PNG", "optimize": True},
+    "webp-lossless": {"format": "WEBP", "lossless": True},
+    "jpeg-90": {"format": "JPEG", "quality": 90},
+}
+
+# Figures compared against the baseline, and whether higher is better
+COMPARED = {"ms_per_image": False, "peak_kb": False}
+
+# Allocation peaks below this are bookkeeping noise, not copies of image data
+PEAK_FLOOR_KB = 64
+
+
+def load_corpus(corpus_dir, limit):
+    """Read up to limit images (bytes) from corpus_dir, skipping the archive's own bookkeeping"""
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(corpus_dir):
+        dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames)
+                     if name.lower().endswith((".png", ".jpg", ".jpeg", ".webp")))
+    corpus = []
+    for path in paths[:limit]:
+        with open(path, 'rb') as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def decode(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+def fit(size, box):
+    """The carousels' scale-to-fit arithmetic (grok.py update_display/update_embedded_carousel)"""
+    width, height = size
+    scale = min(box[0] / max(width, 1), box[1] / max(height, 1))
+    return int(width * scale), int(height * scale)
+
+
+def encode(image, options):
+    if options["format"] == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    output = io.BytesIO()
+    image.save(output, **options)
+    return output.getvalue()
+
+
+def build_cases():
+    """Return (name, setup, run) triples; setup(data) prepares the input run() is timed on"""
+    from utils import save_image_from_bytes
+
+    cases = [
+        ("decode/open_load", lambda data: data, decode),
+        ("utils/save_image_from_bytes", lambda data: data, save_image_from_bytes),
+    ]
+    for filter_name, resample in RESAMPLING_FILTERS.items():
+        for box_name, box in CAROUSEL_BOXES.items():
+            cases.append((f"resize/{filter_name}/{box_name}", decode,
+                          lambda image, box=box, resample=resample: image.resize(fit(image.size, box), resample)))
+    for box_name, box in CAROUSEL_BOXES.items():
+        # Pillow's two-step resize: a cheap integer reduce first, then LANCZOS on the smaller image
+        cases.append((f"resize/lanczos-reducing-gap/{box_name}", decode,
+                      lambda image, box=box: image.resize(fit(image.size, box), Image.LANCZOS, reducing_gap=2.0)))
+    for encoder_name, options in ENCODERS.items():
+        cases.append((f"encode/{encoder_name}", decode, lambda image, options=options: encode(image, options)))
+    return cases
+
+
+def run_case(setup, run, corpus, repeat):
+    """Time run over the corpus repeat times; returns the figures for one case"""
+    inputs = [setup(data) for data in corpus]
+    run(inputs[0])  # Warm up lazily loaded codecs
+
+    timings = []
+    output_bytes = 0
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    try:
+        for _ in range(repeat):
+            for item in inputs:
+                started = time.perf_counter_ns()
+                result = run(item)
+                timings.append((time.perf_counter_ns() - started) / 1e6)
+                if isinstance(result, bytes):
+                    output_bytes += len(result)
+                del result
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "ms_per_image": percentile(timings, 0.5),
+        "p95_ms": percentile(timings, 0.95),
+        "peak_kb": peak / 1024,
+        "output_kb": output_bytes / 1024 / (repeat * len(inputs)) if output_bytes else None,
+    }
+
+
+def baseline_key(name, corpus):
+    return f"image:{name}:images={len(corpus)}:bytes={sum(len(data) for data in corpus)}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Image pipeline microbenchmarks")
+    parser.add_argument("--corpus", default=os.path.join(REPO_ROOT, "generated_images"))
+    parser.add_argument("--limit", type=int, default=12, help="Maximum number of corpus images")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per case")
+    parser.add_argument("--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    corpus = load_corpus(args.corpus, args.limit)
+    if not corpus:
+        print(f"No images found in {args.corpus}", file=sys.stderr)
+        return 2
+    print(f"Corpus: {len(corpus)} images, {sum(len(data) for data in corpus) / 1024 / 1024:.1f} MB from {args.corpus}")
+
+    baselines = load_baselines()
+    results = {}
+    status = 0
+    for name, setup, run in build_cases():
+        if args.filter not in name:
+            continue
+        result = results[name] = run_case(setup, run, corpus, args.repeat)
+        output = f" | out {result['output_kb']:.0f} KB" if result["output_kb"] else ""
+        print(f"{name:<38} {result['ms_per_image']:8.2f} ms/img (p95 {result['p95_ms']:.2f})"
+              f" | peak {result['peak_kb']:8.0f} KB{output}")
+
+        baseline = baselines.get(baseline_key(name, corpus))
+        if baseline is not None and not args.save_baseline:
+            floored = lambda figures: dict(figures, peak_kb=max(figures["peak_kb"], PEAK_FLOOR_KB))
+            regressions = compare(floored(result), floored(baseline), args.tolerance, COMPARED)
+            for regression in regressions:
+                print(f"{name}: REGRESSION {regression}")
+            if regressions:
+                status = 1
+
+    if args.save_baseline:
+        save_baselines({baseline_key(name, corpus): {figure: result[figure] for figure in COMPARED}
+                        for name, result in results.items()})
+        print("Saved baselines")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
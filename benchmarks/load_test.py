@@ -0,0 +1,243 @@
+"""
+Load test for app.py: many concurrent simulated sessions in one server process
+
+Each session is a streamlit.testing AppTest running the real script, so all
+sessions share the process-wide cached resources (job manager, run history,
+archive index) exactly as browser sessions on one server do. A session:
+
+    1. opens the page (first run)
+    2. types a prompt and clicks "Generate Images", optionally double-clicking
+    3. fires a rerun storm (--storm reruns back to back, like widget spam)
+    4. polls with a rerun every --poll seconds, as the results fragment does,
+       until every provider has answered
+
+AppTest installs a process-wide Runtime for the length of each script run,
+so runs from different sessions are serialized here; a session's background
+work (jobs, downloads, saving) still overlaps everything else. Rerun latency
+therefore includes the time spent queued behind other sessions' runs, which
+is the contention a single server process shows under a burst.
+
+Provider traffic goes to the mock server from benchmarks/mock_provider.py
+(or a cassette, with --cassette). The run works in a temporary directory so
+nothing is written to the real generated_images/.
+
+Reports time to first image and to a complete result, rerun latency, errors,
+peak RSS and RSS per session, peak thread count and server CPU use.
+
+    python -m benchmarks.load_test --sessions 20 --ramp 5
+    python -m benchmarks.load_test --sessions 50 --storm 20 --double-click --json results.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.bench import REPO_ROOT, ThreadSampler, percentile, start_mock_server
+from benchmarks.mock_provider import provider_environment
+
+APP_PATH = os.path.join(REPO_ROOT, "app.py")
+
+# AppTest can only run one script at a time per process
+_script_lock = threading.Lock()
+
+
+def current_rss_mb():
+    """Resident set size right now (Linux), falling back to the peak elsewhere"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def click(at, label):
+    next(button for button in at.button if button.label == label).click()
+    return at.run()
+
+
+def open_page():
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.run()
+    return at
+
+
+def run_session(index, args):
+    """Drive one simulated session; returns its figures"""
+    from streamlit.testing.v1 import AppTest
+
+    session = {"session": index, "reruns": 0, "rerun_s": [], "errors": [],
+               "first_image_s": None, "complete_s": None}
+
+    def rerun(action):
+        started = time.monotonic()
+        with _script_lock:
+            action()
+        session["rerun_s"].append(time.monotonic() - started)
+        session["reruns"] += 1
+        session["errors"].extend(str(exception.message) for exception in at.exception)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=args.rerun_timeout)
+    rerun(at.run)
+    if at.exception:
+        return session
+
+    started = time.monotonic()
+    at.text_area[0].input(f"{args.prompt} #{index}")
+    at.slider[0].set_value(args.images)
+    rerun(at.run)  # The browser reruns once the prompt field loses focus
+    rerun(lambda: click(at, "Generate Images"))
+    if args.double_click:
+        rerun(lambda: click(at, "Generate Images"))
+
+    for _ in range(args.storm):
+        rerun(at.run)
+
+    deadline = started + args.session_timeout
+    while time.monotonic() < deadline:
+        results = at.session_state.generated_images if "generated_images" in at.session_state else {}
+        if session["first_image_s"] is None and any(result.ok for result in results.values()):
+            session["first_image_s"] = time.monotonic() - started
+        if not at.session_state.loading:
+            session["complete_s"] = time.monotonic() - started
+            break
+        time.sleep(args.poll)
+        rerun(at.run)
+    else:
+        session["errors"].append("timed out waiting for results")
+    return session
+
+
+def summarize(sessions, elapsed, rss_before, rss_peak, threads_peak, cpu_seconds):
+    first = [session["first_image_s"] for session in sessions if session["first_image_s"] is not None]
+    complete = [session["complete_s"] for session in sessions if session["complete_s"] is not None]
+    reruns = [duration for session in sessions for duration in session["rerun_s"]]
+    return {
+        "sessions": len(sessions),
+        "elapsed_s": elapsed,
+        "first_image_p50_s": percentile(first, 0.5),
+        "first_image_p95_s": percentile(first, 0.95),
+        "complete_p50_s": percentile(complete, 0.5),
+        "complete_p95_s": percentile(complete, 0.95),
+        "rerun_p50_s": percentile(reruns, 0.5),
+        "rerun_p95_s": percentile(reruns, 0.95),
+        "reruns": len(reruns),
+        "failed_sessions": sum(1 for session in sessions if session["errors"]),
+        "peak_rss_mb": rss_peak,
+        "rss_per_session_mb": (rss_peak - rss_before) / len(sessions) if sessions else 0.0,
+        "peak_threads": threads_peak,
+        "cpu_cores": cpu_seconds / elapsed if elapsed else 0.0,
+    }
+
+
+def print_summary(summary, sessions):
+    def seconds(value):
+        return "-" if value is None else f"{value:.2f}s"
+    print(f"{summary['sessions']} sessions in {summary['elapsed_s']:.1f}s, {summary['reruns']} reruns")
+    print(f"  time to first image  p50 {seconds(summary['first_image_p50_s'])}  p95 {seconds(summary['first_image_p95_s'])}")
+    print(f"  time to all results  p50 {seconds(summary['complete_p50_s'])}  p95 {seconds(summary['complete_p95_s'])}")
+    print(f"  script rerun         p50 {seconds(summary['rerun_p50_s'])}  p95 {seconds(summary['rerun_p95_s'])}")
+    print(f"  memory               peak RSS {summary['peak_rss_mb']:.0f} MB, "
+          f"{summary['rss_per_session_mb']:.1f} MB per session")
+    print(f"  threads              peak {summary['peak_threads']}")
+    print(f"  server CPU           {summary['cpu_cores']:.2f} cores on average")
+    print(f"  failed sessions      {summary['failed_sessions']}")
+    for session in sessions:
+        for error in session["errors"][:3]:
+            print(f"    session {session['session']}: {error[:200]}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent session load test for app.py")
+    parser.add_argument("--sessions", type=int, default=10, help="Simulated sessions")
+    parser.add_argument("--ramp", type=float, default=0.0, help="Seconds over which sessions start")
+    parser.add_argument("--images", type=int, default=1, help="Images per provider slider value")
+    parser.add_argument("--storm", type=int, default=5, help="Back-to-back reruns after clicking Generate")
+    parser.add_argument("--double-click", action="store_true", help="Click Generate twice")
+    parser.add_argument("--poll", type=float, default=1.0, help="Seconds between polling reruns")
+    parser.add_argument("--prompt", default="A lighthouse on a cliff at dusk")
+    parser.add_argument("--rerun-timeout", type=float, default=60.0, help="Seconds allowed per script run")
+    parser.add_argument("--session-timeout", type=float, default=300.0, help="Seconds allowed per session")
+    parser.add_argument("--profiles", help="JSON file of per-provider mock profile overrides")
+    parser.add_argument("--time-scale", type=float, default=0.05, help="Multiply every mock latency by this")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cassette", help="Replay provider traffic from this cassette instead of the mock server")
+    parser.add_argument("--cassette-timing", type=float, default=1.0)
+    parser.add_argument("--json", help="Also write the summary and per-session figures to this file")
+    return parser.parse_args(argv)
+
+
+def run_load(args):
+    """Open the page once, then run the sessions; returns (summary, sessions)"""
+    # Load Streamlit and the app's modules first, so per-session memory excludes them
+    open_page()
+    rss_before = current_rss_mb()
+    rss_peak = [rss_before]
+    stop = threading.Event()
+
+    def sample_rss():
+        while not stop.wait(0.1):
+            rss_peak[0] = max(rss_peak[0], current_rss_mb())
+
+    rss_sampler = threading.Thread(target=sample_rss, daemon=True, name="load-rss-sampler")
+    rss_sampler.start()
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    try:
+        with ThreadSampler() as threads, ThreadPoolExecutor(max_workers=args.sessions) as executor:
+            futures = []
+            for index in range(args.sessions):
+                futures.append(executor.submit(run_session, index, args))
+                if args.ramp and index < args.sessions - 1:
+                    time.sleep(args.ramp / (args.sessions - 1))
+            sessions = [future.result() for future in futures]
+        elapsed = time.monotonic() - started
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+    finally:
+        stop.set()
+        rss_sampler.join()
+
+    cpu_seconds = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+    return summarize(sessions, elapsed, rss_before, rss_peak[0], threads.peak, cpu_seconds), sessions
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_path = os.path.abspath(args.json) if args.json else None
+
+    server, base_url = (None, None) if args.cassette else start_mock_server(args)
+    try:
+        environment = provider_environment(base_url or "")
+        if args.cassette:
+            environment = {name: value for name, value in environment.items() if "BASE_URL" not in name}
+            environment.update(IMAGEGENIE_CASSETTE=os.path.abspath(args.cassette),
+                               IMAGEGENIE_CASSETTE_MODE="replay",
+                               IMAGEGENIE_CASSETTE_TIMING=str(args.cassette_timing))
+        os.environ.update(environment)
+
+        # The app saves runs under ./generated_images; keep that out of the real archive
+        sys.path.insert(0, REPO_ROOT)
+        os.chdir(tempfile.mkdtemp(prefix="imagegenie-load-"))
+        summary, sessions = run_load(args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_summary(summary, sessions)
+    if output_path:
+        for session in sessions:
+            session["rerun_s"] = [round(duration, 4) for duration in session["rerun_s"]]
+        with open(output_path, 'w') as f:
+            json.dump({"settings": vars(args), "summary": summary, "sessions": sessions}, f, indent=2)
+    return 1 if summary["failed_sessions"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
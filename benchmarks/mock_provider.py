@@ -0,0 +1,305 @@
+"""
+Local stand-in for the image provider APIs, for offline benchmarks
+
+Serves the endpoints used by api_clients/* and the Replicate path in grok.py:
+
+    POST /v1/images/generations                     OpenAI (set OPENAI_BASE_URL=<base>/v1)
+    POST /v1beta/models/<model>:generateContent     Google Gemini API, base64 inline data
+    POST /v1beta/models/<model>:predict             Google Imagen predict API
+    POST /creations                                 Recraft
+    POST /api/v1/images/generations                 Ideogram
+    GET  /v1/models/<owner>/<name>                  Replicate model lookup (version pinning)
+    GET  /v1/models/<owner>/<name>/versions/<id>    Replicate version lookup (replicate.run with a pinned ref)
+    POST /v1/predictions, /v1/models/.../predictions  Replicate predictions, answered as finished
+    GET  /v1/predictions/<id>                       Replicate prediction polling
+    GET  /images/<provider>/<n>.png                 Generated image downloads
+
+Each provider has a profile: a lognormal latency (median and sigma, in
+seconds), an error rate and the size of the PNG it returns. Latencies and
+errors are drawn from a seeded generator, so runs are repeatable.
+
+Run standalone with: python -m benchmarks.mock_provider [--port 8765] [--profiles profiles.json]
+"""
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PROFILE = {"latency_median": 2.0, "latency_sigma": 0.4, "error_rate": 0.0, "width": 1024, "height": 1024}
+
+DEFAULT_PROFILES = {
+    "openai": {"latency_median": 8.0, "latency_sigma": 0.3},
+    "google": {"latency_median": 5.0, "latency_sigma": 0.3},
+    "recraft": {"latency_median": 6.0, "latency_sigma": 0.4},
+    "ideogram": {"latency_median": 7.0, "latency_sigma": 0.4},
+    "replicate": {"latency_median": 2.0, "latency_sigma": 0.5},
+    "download": {"latency_median": 0.15, "latency_sigma": 0.3},
+}
+
+
+def make_png(width, height, seed=0):
+    """A valid RGB PNG of noise: incompressible, so its size matches a real render's ballpark"""
+    rng = random.Random(seed)
+    row_bytes = width * 3
+    raw = b"".join(b"\0" + rng.randbytes(row_bytes) for _ in range(height))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b"")
+
+
+class MockProviders:
+    """Profiles, payload cache and counters shared by the request handlers"""
+    def __init__(self, profiles=None, time_scale=1.0, seed=0):
+        self.profiles = {}
+        for name in set(DEFAULT_PROFILES) | set(profiles or {}):
+            profile = dict(DEFAULT_PROFILE)
+            profile.update(DEFAULT_PROFILES.get(name, {}))
+            profile.update((profiles or {}).get(name, {}))
+            self.profiles[name] = profile
+        self.time_scale = time_scale
+        self._rng = random.Random(seed)
+        self._payloads = {}
+        self._predictions = {}
+        self._lock = threading.Lock()
+        self.requests = {}
+
+    def profile(self, provider):
+        return self.profiles.get(provider, DEFAULT_PROFILE)
+
+    def delay(self, provider):
+        """Sleep for one draw of the provider's latency; returns True if this request should fail"""
+        profile = self.profile(provider)
+        with self._lock:
+            latency = self._rng.lognormvariate(math.log(profile["latency_median"]), profile["latency_sigma"])
+            fail = self._rng.random() < profile["error_rate"]
+            self.requests[provider] = self.requests.get(provider, 0) + 1
+        time.sleep(latency * self.time_scale)
+        return fail
+
+    def payload(self, provider):
+        profile = self.profile(provider)
+        key = (profile["width"], profile["height"])
+        with self._lock:
+            if key not in self._payloads:
+                self._payloads[key] = make_png(*key, seed=len(self._payloads))
+            return self._payloads[key]
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "MockProvider/1.0"
+
+    @property
+    def providers(self):
+        return self.server.providers
+
+    def base_url(self):
+        return f"http://{self.headers.get('Host') or '127.0.0.1:%d' % self.server.server_address[1]}"
+
+    def image_urls(self, provider, count):
+        return [f"{self.base_url()}/images/{provider}/{uuid.uuid4().hex[:8]}.png" for _ in range(count)]
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            return json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        match = re.fullmatch(r"/images/(\w+)/[\w-]+\.png", path)
+        if match:
+            if self.providers.delay("download"):
+                self.send_json(503, {"error": "mock download failure"})
+                return
+            data = self.providers.payload(match.group(1))
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        match = re.fullmatch(r"/v1/predictions/(\w+)", path)
+        if match:
+            prediction = self.providers._predictions.get(match.group(1))
+            if prediction is None:
+                self.send_json(404, {"detail": "Not found"})
+            else:
+                self.send_json(200, prediction)
+            return
+
+        match = re.fullmatch(r"/v1/models/([\w.-]+)/([\w.-]+)/versions/(\w+)", path)
+        if match:
+            self.send_json(200, {"id": match.group(3), "created_at": "2025-01-01T00:00:00Z",
+                                 "cog_version": "0.9.0", "openapi_schema": {}})
+            return
+
+        match = re.fullmatch(r"/v1/models/([\w.-]+)/([\w.-]+)", path)
+        if match:
+            owner, name = match.groups()
+            version_id = uuid.uuid5(uuid.NAMESPACE_URL, f"{owner}/{name}").hex * 2
+            self.send_json(200, {
+                "url": f"https://replicate.com/{owner}/{name}",
+                "owner": owner,
+                "name": name,
+                "description": "Mock model",
+                "visibility": "public",
+                "run_count": 0,
+                "latest_version": {"id": version_id, "created_at": "2025-01-01T00:00:00Z",
+                                   "cog_version": "0.9.0", "openapi_schema": {}},
+            })
+            return
+
+        self.send_json(404, {"error": f"No mock for GET {path}"})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        body = self.read_json()
+
+        if path == "/v1/images/generations":
+            if self.providers.delay("openai"):
+                self.send_json(500, {"error": {"message": "mock failure", "type": "server_error"}})
+                return
+            urls = self.image_urls("openai", int(body.get("n", 1)))
+            self.send_json(200, {"created": int(time.time()), "data": [{"url": url} for url in urls]})
+
+        elif re.fullmatch(r"/v1beta/models/[\w.-]+:generateContent", path):
+            if self.providers.delay("google"):
+                self.send_json(500, {"error": {"code": 500, "message": "mock failure"}})
+                return
+            count = int(body.get("generation_config", {}).get("candidateCount", 1))
+            data = base64.b64encode(self.providers.payload("google")).decode("ascii")
+            self.send_json(200, {"candidates": [
+                {"content": {"parts": [{"inlineData": {"mimeType": "image/png", "data": data}}]}}
+                for _ in range(count)
+            ]})
+
+        elif re.fullmatch(r"/v1beta/models/[\w.-]+:predict", path):
+            if self.providers.delay("google"):
+                self.send_json(500, {"error": {"code": 500, "message": "mock failure"}})
+                return
+            count = int(body.get("parameters", {}).get("sampleCount", 1))
+            data = base64.b64encode(self.providers.payload("google")).decode("ascii")
+            self.send_json(200, {"predictions": [
+                {"mimeType": "image/png", "bytesBase64Encoded": data} for _ in range(count)
+            ]})
+
+        elif path == "/creations":
+            if self.providers.delay("recraft"):
+                self.send_json(500, {"error": "mock failure"})
+                return
+            self.send_json(200, {"url": self.image_urls("recraft", 1)[0]})
+
+        elif path == "/api/v1/images/generations":
+            if self.providers.delay("ideogram"):
+                self.send_json(500, {"error": "mock failure"})
+                return
+            urls = self.image_urls("ideogram", int(body.get("num_images", 1)))
+            self.send_json(200, {"generations": [{"url": url} for url in urls]})
+
+        elif path == "/v1/predictions" or re.fullmatch(r"/v1/models/[\w.-]+/[\w.-]+/predictions", path):
+            self.create_prediction(path, body)
+
+        else:
+            self.send_json(404, {"error": f"No mock for POST {path}"})
+
+    def create_prediction(self, path, body):
+        """Answer a Replicate prediction as already finished (as with "Prefer: wait")"""
+        failed = self.providers.delay("replicate")
+        model_input = body.get("input", {})
+        count = int(model_input.get("num_outputs", 1))
+        prediction_id = uuid.uuid4().hex[:20]
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        prediction = {
+            "id": prediction_id,
+            "model": path[len("/v1/models/"):-len("/predictions")] if path.startswith("/v1/models/") else "",
+            "version": body.get("version", ""),
+            "status": "failed" if failed else "succeeded",
+            "input": model_input,
+            "output": None if failed else self.image_urls("replicate", count),
+            "error": "mock failure" if failed else None,
+            "logs": "",
+            "metrics": {"predict_time": 0.0},
+            "created_at": now,
+            "started_at": now,
+            "completed_at": now,
+            "urls": {
+                "get": f"{self.base_url()}/v1/predictions/{prediction_id}",
+                "cancel": f"{self.base_url()}/v1/predictions/{prediction_id}/cancel",
+            },
+        }
+        self.providers._predictions[prediction_id] = prediction
+        self.send_json(201, prediction)
+
+
+def start_server(profiles=None, port=0, time_scale=1.0, seed=0):
+    """Start the mock server in a daemon thread; returns (server, base URL)"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    server.providers = MockProviders(profiles, time_scale=time_scale, seed=seed)
+    threading.Thread(target=server.serve_forever, daemon=True, name="mock-provider").start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def provider_environment(base_url):
+    """Environment variables pointing every client at the mock server"""
+    return {
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "GOOGLE_API_BASE_URL": base_url,
+        "RECRAFT_API_BASE_URL": base_url,
+        "IDEOGRAM_API_BASE_URL": base_url,
+        "REPLICATE_BASE_URL": base_url,
+        "OPENAI_API_KEY": "mock",
+        "GOOGLE_API_KEY": "mock",
+        "RECRAFT_API_KEY": "mock",
+        "IDEOGRAM_API_KEY": "mock",
+        "REPLICATE_API_TOKEN": "r8_mock",
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profiles", help="JSON file of per-provider profile overrides")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="Multiply every latency by this")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    profiles = None
+    if args.profiles:
+        with open(args.profiles) as f:
+            profiles = json.load(f)
+    server, base_url = start_server(profiles, args.port, args.time_scale, args.seed)
+    print(f"Mock providers listening on {base_url}", flush=True)
+    for name, value in provider_environment(base_url).items():
+        print(f"export {name}={value}")
+    sys.stdout.flush()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,175 @@
+"""
+Cold-start benchmark for both entry points
+
+Each measurement is a fresh interpreter (python -X importtime), so nothing is
+cached between runs:
+
+    app   Streamlit is imported first, as a running server already has it; then
+          the time of the first full script run of app.py (AppTest), which is
+          what a new session waits for on a cold autoscaled instance
+    grok  imports, ImageGeneratorApp construction and the first idle pass of
+          the Tk event loop (the window has been drawn); needs a display
+
+Both report the startup marks from startup.py and the slowest imports the
+entry point triggered. Baselines share benchmarks/baselines.json.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --entry app --repeat 5 --save-baseline
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench import REPO_ROOT, compare, load_baselines, percentile, save_baselines
+
+IMPORT_MARKER = "benchmark: entry point starts"
+
+APP_SCRIPT = f"""
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+print({IMPORT_MARKER!r}, file=sys.stderr, flush=True)
+started = time.monotonic()
+at = AppTest.from_file({os.path.join(REPO_ROOT, "app.py")!r}, default_timeout=120)
+at.run()
+first_run = time.monotonic() - started
+import startup
+print(json.dumps({{"first_run_s": first_run, "marks": startup.marks(),
+                  "errors": [str(e.message) for e in at.exception]}}))
+"""
+
+GROK_SCRIPT = f"""
+import json, os, sys, time
+import tkinter as tk
+print({IMPORT_MARKER!r}, file=sys.stderr, flush=True)
+started = time.monotonic()
+import grok
+imported = time.monotonic() - started
+root = tk.Tk()
+app = grok.ImageGeneratorApp(root)
+
+def painted():
+    import startup
+    print(json.dumps({{"import_s": imported, "first_paint_s": time.monotonic() - started,
+                      "marks": startup.marks()}}), flush=True)
+    os._exit(0)
+
+# Queued behind the app's own first-paint callback
+root.after_idle(painted)
+root.mainloop()
+"""
+
+# Figures compared against the baseline, per entry point (all lower is better)
+COMPARED = {
+    "app": {"first_run_s": False},
+    "grok": {"import_s": False, "first_paint_s": False},
+}
+
+
+def slowest_imports(stderr, count):
+    """Top-level imports after the marker from -X importtime output, slowest first"""
+    imports = []
+    started = False
+    for line in stderr.splitlines():
+        if line.startswith(IMPORT_MARKER):
+            started = True
+            continue
+        if not started or not line.startswith("import time:"):
+            continue
+        try:
+            _, cumulative_us, name = line.split("|")
+            cumulative = int(cumulative_us)
+        except ValueError:
+            continue  # The header line
+        # Nested imports are indented further; keep the ones the entry point itself ran
+        if not name.startswith("  "):
+            imports.append((cumulative / 1e6, name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def measure(entry, workdir):
+    """Run one cold start; returns (figures, slowest imports)"""
+    environment = dict(os.environ, HOME=workdir, PYTHONPATH=os.pathsep.join(
+        [REPO_ROOT] + [path for path in [os.environ.get("PYTHONPATH")] if path]))
+    environment.pop("IMAGEGENIE_CASSETTE", None)
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", APP_SCRIPT if entry == "app" else GROK_SCRIPT],
+        cwd=workdir, env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=300
+    )
+    lines = [line for line in child.stdout.splitlines() if line.startswith("{")]
+    if child.returncode != 0 or not lines:
+        tail = "\n".join(child.stderr.splitlines()[-5:])
+        raise RuntimeError(f"{entry} startup run failed (exit status {child.returncode}):\n{tail}")
+    return json.loads(lines[-1]), slowest_imports(child.stderr, 10)
+
+
+def display_available():
+    if sys.platform.startswith("linux") and not os.environ.get("DISPLAY") and not os.environ.get("WAYLAND_DISPLAY"):
+        return False
+    try:
+        import tkinter  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start benchmark")
+    parser.add_argument("--entry", choices=("app", "grok", "all"), default="all")
+    parser.add_argument("--repeat", type=int, default=3, help="Cold starts per entry point (median reported)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as the new baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    entries = ("app", "grok") if args.entry == "all" else (args.entry,)
+    baselines = load_baselines()
+    results = {}
+    status = 0
+
+    for entry in entries:
+        if entry == "grok" and not display_available():
+            print("grok: skipped, no display or tkinter")
+            continue
+
+        runs = []
+        imports = []
+        for _ in range(args.repeat):
+            # Fresh settings and archive directories, as on a new instance
+            with tempfile.TemporaryDirectory(prefix="imagegenie-startup-") as workdir:
+                figures, imports = measure(entry, workdir)
+            runs.append(figures)
+
+        result = results[entry] = {figure: percentile([run[figure] for run in runs], 0.5)
+                                   for figure in COMPARED[entry]}
+        marks = runs[-1]["marks"]
+        print(f"{entry}: " + ", ".join(f"{figure} {value:.3f}" for figure, value in result.items()))
+        print("  marks: " + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in sorted(marks.items(),
+                                                                                        key=lambda item: item[1])))
+        for errors in (run.get("errors") for run in runs):
+            for error in errors or []:
+                print(f"  script error: {error[:200]}")
+        print("  slowest imports:")
+        for seconds, name in imports:
+            print(f"    {seconds * 1000:8.1f} ms  {name}")
+
+        baseline = baselines.get(f"startup:{entry}")
+        if baseline is not None and not args.save_baseline:
+            regressions = compare(result, baseline, args.tolerance, COMPARED[entry])
+            for regression in regressions:
+                print(f"{entry}: REGRESSION {regression}")
+            if regressions:
+                status = 1
+
+    if args.save_baseline:
+        save_baselines({f"startup:{entry}": result for entry, result in results.items()})
+        print("Saved baselines")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
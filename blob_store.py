@@ -0,0 +1,420 @@
+import hashlib
+import io
+import json
+import os
+import queue
+import stat
+import sys
+import threading
+
+from file_lock import FileLock
+
+
+def fsync_directory(directory):
+    """Persist renames and new entries in directory (a no-op where directories can't be opened)"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class BlobStore:
+    """
+    Content-addressed storage for generated images
+
+    Image bytes are stored once under .blobs/<2 hex>/<sha256>, keyed by the hash
+    of the bytes the provider returned, so duplicates cost nothing. The
+    human-readable Model/prompt_ts.png paths are links to the blob: a relative
+    symlink where the platform allows it, otherwise a hard link, otherwise a
+    copy. An append-only manifest records which paths point at which blob and
+    how each blob is encoded; it is compacted when it accumulates mostly dead
+    lines.
+
+    Several stores share one tree (grok.py's, its sweeper's and app.py's run
+    history), so the manifest is the only source of reference counts: every
+    change takes an exclusive lock on manifest.lock and first reads the lines
+    other stores appended since, then appends its own.
+
+    With transcode set, a background worker re-encodes new blobs losslessly in
+    their own format (optimized PNG, lossless WebP), since the links' file
+    names promise that format, and keeps the result only if it is smaller and
+    decodes to exactly the same pixels; on_transcoded is then called (from the
+    worker thread) with the file paths whose bytes changed.
+    """
+    # Formats the transcoder re-encodes, and how
+    TRANSCODE_OPTIONS = {
+        "PNG": {"format": "PNG", "optimize": True},
+        "WEBP": {"format": "WEBP", "lossless": True, "quality": 100, "method": 6, "exact": True},
+    }
+
+    def __init__(self, root_dir, transcode=False, on_transcoded=None, dirname=".blobs"):
+        self.root_dir = root_dir
+        self.blob_dir = os.path.join(root_dir, dirname)
+        self.manifest_path = os.path.join(self.blob_dir, "manifest.jsonl")
+        self.transcode = transcode
+        self.on_transcoded = on_transcoded or (lambda filepaths: None)
+        self._paths = {}  # path -> digest
+        self._links = {}  # digest -> set of paths
+        self._encodings = {}  # digest -> (encoding, size in bytes)
+        self._manifest_offset = 0
+        self._manifest_inode = None
+        self._manifest_lines = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._worker = None
+
+        if not os.path.exists(self.blob_dir):
+            os.makedirs(self.blob_dir)
+        self.file_lock = FileLock(os.path.join(self.blob_dir, "manifest.lock"))
+        with self._lock, self.file_lock:
+            self._catch_up()
+
+        if transcode:
+            self._worker = threading.Thread(target=self._transcode_worker, daemon=True, name="blob-transcode")
+            self._worker.start()
+
+    def relative_path(self, filepath):
+        return os.path.relpath(filepath, self.root_dir).replace(os.sep, "/")
+
+    def blob_path(self, digest):
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def store(self, image_data, filepath):
+        """
+        Store image bytes and make filepath refer to them
+
+        Args:
+            image_data: Image bytes as returned by the provider
+            filepath: Human-readable path to create (replaced if it exists)
+
+        Returns:
+            tuple: (sha256 hex digest, True if the bytes were new to the store)
+        """
+        return self.store_many([(image_data, filepath)])[0]
+
+    def store_many(self, items, durable=False):
+        """
+        Store several images at once
+
+        Every new blob is written to a temporary file and renamed into place, so
+        a crash never leaves a truncated image behind. With durable=True the
+        whole batch is fsynced together: all blob files, then their directories,
+        then the link directories and the manifest, one sync per file or
+        directory rather than several per image.
+
+        Args:
+            items: List of (image bytes, human-readable file path)
+            durable: Flush the batch to stable storage before returning
+
+        Returns:
+            list: (sha256 hex digest, True if the bytes were new to the store) per item
+        """
+        hashed = [(hashlib.sha256(image_data).hexdigest(), image_data, filepath) for image_data, filepath in items]
+        results = []
+        new_digests = []
+        records = []
+
+        with self._lock, self.file_lock:
+            self._catch_up()
+            pending = {}  # tmp path -> blob path
+            for digest, image_data, _ in hashed:
+                blob_path = self.blob_path(digest)
+                if digest in self._encodings or os.path.exists(blob_path) or f"{blob_path}.tmp" in pending:
+                    continue
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(image_data)
+                    if durable:
+                        f.flush()
+                        os.fsync(f.fileno())
+                pending[tmp_path] = blob_path
+                new_digests.append(digest)
+                self._encodings[digest] = ("original", len(image_data))
+                records.append({"h": digest, "e": "original", "n": len(image_data)})
+
+            for tmp_path, blob_path in pending.items():
+                os.replace(tmp_path, blob_path)
+
+            unreported = set(new_digests)
+            replaced = set()
+            for digest, _, filepath in hashed:
+                self._link(self.blob_path(digest), filepath)
+                path = self.relative_path(filepath)
+                previous = self._forget(path)
+                if previous is not None and previous != digest:
+                    replaced.add(previous)
+                self._paths[path] = digest
+                self._links.setdefault(digest, set()).add(path)
+                records.append({"p": path, "h": digest})
+                results.append((digest, digest in unreported))
+                unreported.discard(digest)
+
+            if durable:
+                directories = {os.path.dirname(blob_path) for blob_path in pending.values()}
+                directories.update(os.path.dirname(filepath) or "." for _, _, filepath in hashed)
+                for directory in directories:
+                    fsync_directory(directory)
+            self._append(*records, durable=durable)
+
+            # Overwritten paths may have held the last reference to their old blob
+            for digest in replaced:
+                self._release(digest)
+
+        if self.transcode:
+            for digest in new_digests:
+                self._queue.put(digest)
+        return results
+
+    def adopt(self, filepath):
+        """Move an existing plain file into the store, leaving a link in its place"""
+        if os.path.islink(filepath) or self.relative_path(filepath) in self._paths:
+            return False
+        with open(filepath, 'rb') as f:
+            image_data = f.read()
+        self.store(image_data, filepath)
+        return True
+
+    def move(self, old_filepath, new_filepath):
+        """
+        Move a human-readable path, re-creating the link (relative symlinks can't just be renamed)
+
+        Returns:
+            bool: False if old_filepath isn't managed by the store
+        """
+        old_path = self.relative_path(old_filepath)
+        with self._lock, self.file_lock:
+            self._catch_up()
+            digest = self._paths.get(old_path)
+            if digest is None:
+                return False
+            self._link(self.blob_path(digest), new_filepath)
+            if os.path.lexists(old_filepath):
+                os.remove(old_filepath)
+            self._forget(old_path)
+            new_path = self.relative_path(new_filepath)
+            self._paths[new_path] = digest
+            self._links.setdefault(digest, set()).add(new_path)
+            self._append({"p": old_path, "d": 1}, {"p": new_path, "h": digest})
+        return True
+
+    def unlink(self, filepath):
+        """
+        Remove a human-readable path, deleting its blob once nothing refers to it
+
+        Returns:
+            int: Bytes freed on disk
+        """
+        path = self.relative_path(filepath)
+        with self._lock, self.file_lock:
+            self._catch_up()
+            try:
+                file_stat = os.lstat(filepath)
+            except FileNotFoundError:
+                file_stat = None
+            else:
+                os.remove(filepath)
+            digest = self._forget(path)
+            if digest is None:
+                # Not one of the store's links (saved before the store existed, say): the file was its own copy
+                if file_stat is not None and stat.S_ISREG(file_stat.st_mode) and file_stat.st_nlink == 1:
+                    return file_stat.st_size
+                return 0
+            self._append({"p": path, "d": 1})
+            return self._release(digest)
+
+    def stats(self):
+        """Logical bytes (sum over paths) versus bytes actually stored"""
+        with self._lock, self.file_lock:
+            self._catch_up()
+            stored = sum(size for _, size in self._encodings.values())
+            logical = sum(self._encodings.get(digest, (None, 0))[1] for digest in self._paths.values())
+            return {"paths": len(self._paths), "blobs": len(self._encodings),
+                    "logical_bytes": logical, "stored_bytes": stored}
+
+    def _release(self, digest):
+        """Delete digest's blob if no path refers to it any more (locks held); returns bytes freed"""
+        if self._links.get(digest):
+            return 0
+        self._links.pop(digest, None)
+        freed = 0
+        blob_path = self.blob_path(digest)
+        if os.path.exists(blob_path):
+            freed = os.path.getsize(blob_path)
+            os.remove(blob_path)
+        self._encodings.pop(digest, None)
+        self._append({"h": digest, "d": 1})
+        return freed
+
+    def _forget(self, path):
+        """Drop path from the in-memory maps (lock held); returns its old digest"""
+        digest = self._paths.pop(path, None)
+        if digest is not None:
+            self._links.get(digest, set()).discard(path)
+        return digest
+
+    def _link(self, blob_path, filepath):
+        """Point filepath at blob_path, replacing whatever is there"""
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        tmp_path = f"{filepath}.link"
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        try:
+            os.symlink(os.path.relpath(blob_path, os.path.dirname(filepath) or "."), tmp_path)
+        except (OSError, NotImplementedError):
+            try:
+                os.link(blob_path, tmp_path)
+            except OSError:
+                with open(blob_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                    dst.write(src.read())
+        os.replace(tmp_path, filepath)
+
+    def _catch_up(self):
+        """Apply manifest lines appended by other stores since the last read (both locks held)"""
+        try:
+            manifest_stat = os.stat(self.manifest_path)
+        except OSError:
+            return
+        if manifest_stat.st_ino != self._manifest_inode or manifest_stat.st_size < self._manifest_offset:
+            # New file, or compacted by another store; reload from the start
+            self._paths = {}
+            self._links = {}
+            self._encodings = {}
+            self._manifest_offset = 0
+            self._manifest_lines = 0
+            self._manifest_inode = manifest_stat.st_ino
+        if manifest_stat.st_size <= self._manifest_offset:
+            return
+        with open(self.manifest_path, 'rb') as f:
+            f.seek(self._manifest_offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Partial line from an interrupted write
+                self._manifest_offset += len(line)
+                self._manifest_lines += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                self._apply(record)
+
+    def _apply(self, record):
+        if "p" in record:
+            self._forget(record["p"])
+            if not record.get("d"):
+                self._paths[record["p"]] = record["h"]
+                self._links.setdefault(record["h"], set()).add(record["p"])
+        elif record.get("d"):
+            self._encodings.pop(record["h"], None)
+        else:
+            self._encodings[record["h"]] = (record["e"], record["n"])
+
+    def _append(self, *records, durable=False):
+        """Append manifest lines (both locks held, caught up), compacting the manifest when mostly dead"""
+        data = "".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records).encode("utf-8")
+        with open(self.manifest_path, 'ab') as f:
+            f.write(data)
+            if durable:
+                f.flush()
+                os.fsync(f.fileno())
+            if self._manifest_inode is None:
+                self._manifest_inode = os.fstat(f.fileno()).st_ino
+        self._manifest_offset += len(data)
+        self._manifest_lines += len(records)
+        if self._manifest_lines > 2 * (len(self._paths) + len(self._encodings)) + 1000:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the manifest with only live records (both locks held)"""
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for digest, (encoding, size) in self._encodings.items():
+                f.write(json.dumps({"h": digest, "e": encoding, "n": size}, separators=(",", ":")) + "\n")
+            for path, digest in self._paths.items():
+                f.write(json.dumps({"p": path, "h": digest}, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.manifest_path)
+        manifest_stat = os.stat(self.manifest_path)
+        self._manifest_inode = manifest_stat.st_ino
+        self._manifest_offset = manifest_stat.st_size
+        self._manifest_lines = len(self._encodings) + len(self._paths)
+
+    def _transcode_worker(self):
+        while True:
+            digest = self._queue.get()
+            try:
+                self._transcode(digest)
+            except Exception as e:
+                print(f"Error transcoding blob {digest}: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+    def _transcode(self, digest):
+        """Re-encode one blob losslessly if that makes it smaller"""
+        from PIL import Image, ImageChops
+
+        blob_path = self.blob_path(digest)
+        with open(blob_path, 'rb') as f:
+            original = f.read()
+
+        with Image.open(io.BytesIO(original)) as image:
+            # Stay in the blob's own format: the links' names (and everything that trusts them) say which
+            options = self.TRANSCODE_OPTIONS.get(image.format)
+            if options is None:
+                return
+            image.load()
+            output = io.BytesIO()
+            image.save(output, **options)
+            encoded = output.getvalue()
+            encoding = f"{image.format.lower()}-lossless"
+            if len(encoded) >= len(original):
+                return
+
+            # Keep the new encoding only if every pixel survived
+            with Image.open(io.BytesIO(encoded)) as decoded:
+                mode = "RGBA" if "A" in image.getbands() or "A" in decoded.getbands() else "RGB"
+                if ImageChops.difference(image.convert(mode), decoded.convert(mode)).getbbox() is not None:
+                    return
+
+        with self._lock, self.file_lock:
+            self._catch_up()
+            if digest not in self._encodings:
+                return  # Deleted meanwhile
+            tmp_path = f"{blob_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(encoded)
+                # Replacing bytes that are already safe on disk; don't risk them
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, blob_path)
+            filepaths = [os.path.join(self.root_dir, *path.split("/")) for path in self._links.get(digest, ())]
+            # Hard links and copies still hold the old bytes; re-point them
+            for filepath in filepaths:
+                if not os.path.islink(filepath):
+                    self._link(blob_path, filepath)
+            self._encodings[digest] = (encoding, len(encoded))
+            self._append({"h": digest, "e": encoding, "n": len(encoded)})
+        self.on_transcoded(filepaths)
+
+
+if __name__ == "__main__":
+    # Move an existing archive into the store: python blob_store.py [root_dir] [--transcode]
+    root_dir = next((arg for arg in sys.argv[1:] if not arg.startswith("--")), "generated_images")
+    store = BlobStore(root_dir, transcode="--transcode" in sys.argv[1:])
+    adopted = 0
+    for dirpath, dirnames, filenames in os.walk(root_dir):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        for filename in filenames:
+            if filename.lower().endswith((".png", ".jpg", ".jpeg", ".webp")):
+                adopted += store.adopt(os.path.join(dirpath, filename))
+    store._queue.join()
+    stats = store.stats()
+    print(f"Adopted {adopted} files: {stats['logical_bytes']} logical bytes in {stats['blobs']} blobs, "
+          f"{stats['stored_bytes']} bytes stored")
@@ -0,0 +1,317 @@
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that carry credentials; never written to a cassette
+SECRET_PARAMS = {"key", "api_key", "apikey", "token", "sig", "signature", "x-amz-signature", "x-goog-signature"}
+
+# Response headers that describe the wire encoding rather than the (decoded) body we store
+DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection", "set-cookie"}
+
+# Path segments that are ids (prediction ids, image hashes, ...) rather than routes
+_ID_SEGMENT = re.compile(r"^(?=.*\d)[\w.-]{8,}$")
+
+
+def redact_url(url):
+    """Return url with credential query parameters blanked"""
+    parts = urlsplit(url)
+    if not parts.query:
+        return url
+    query = [(name, "REDACTED" if name.lower() in SECRET_PARAMS else value)
+             for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def route_of(method, url):
+    """
+    Coarse request identity used when no exact match was recorded
+
+    Drops the host and query and replaces id-like path segments, so a poll of
+    another prediction or a download of another image replays a recorded one,
+    and traffic recorded against a local stand-in (see benchmarks/) replays
+    for the real hosts.
+    """
+    segments = ["*" if _ID_SEGMENT.match(segment) else segment for segment in urlsplit(url).path.split("/")]
+    return f"{method} {'/'.join(segments)}"
+
+
+class Cassette:
+    """
+    Records HTTP exchanges to disk and plays them back
+
+    Covers both HTTP stacks the app uses: requests (Google, Recraft and
+    Ideogram clients, image downloads) and httpx (the OpenAI and Replicate
+    SDKs), by patching their transports while installed.
+
+    A cassette is a directory holding interactions.jsonl, one line per
+    exchange ({"m", "u", "b" request body hash, "s", "r", "h", "d" response
+    body hash, "t" seconds}), and bodies/<sha256>, each distinct response body
+    stored once (zlib-compressed unless it is already-compressed image data).
+    Request headers are not stored and credential query parameters are
+    redacted.
+
+    On replay a request gets the next recorded response with the same method,
+    URL and body, or failing that the same route (see route_of), cycling
+    through the recordings. Each response is delayed by its recorded time
+    multiplied by timing (0 answers immediately).
+    """
+    MODES = ("record", "replay")
+
+    def __init__(self, path, mode="replay", timing=1.0):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {', '.join(self.MODES)}")
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.index_path = os.path.join(path, "interactions.jsonl")
+        self.body_dir = os.path.join(path, "bodies")
+        self._exact = {}  # (method, url, body hash) -> interactions
+        self._routes = {}  # route -> interactions
+        self._cursors = {}
+        self._stats = {"recorded": 0, "replayed": 0, "missed": 0}
+        self._lock = threading.Lock()
+        self._restore = []
+
+        if mode == "record":
+            os.makedirs(self.body_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            if self.mode == "replay":
+                raise FileNotFoundError(f"No cassette at {self.path}")
+            return
+        with open(self.index_path, 'r') as f:
+            for line in f:
+                try:
+                    interaction = json.loads(line)
+                except ValueError:
+                    continue  # Partial line from an interrupted recording
+                self._index(interaction)
+
+    def _index(self, interaction):
+        self._exact.setdefault((interaction["m"], interaction["u"], interaction["b"]), []).append(interaction)
+        self._routes.setdefault(route_of(interaction["m"], interaction["u"]), []).append(interaction)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, interactions=sum(len(entries) for entries in self._exact.values()))
+
+    @staticmethod
+    def _hash(data):
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return hashlib.sha256(data).hexdigest()
+
+    def _write_body(self, body, content_type):
+        digest = hashlib.sha256(body).hexdigest()
+        compress = not content_type.startswith("image/")
+        name = f"{digest}.z" if compress else digest
+        path = os.path.join(self.body_dir, name)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(body, 6) if compress else body)
+            os.replace(tmp_path, path)
+        return name
+
+    def _read_body(self, name):
+        with open(os.path.join(self.body_dir, name), 'rb') as f:
+            data = f.read()
+        return zlib.decompress(data) if name.endswith(".z") else data
+
+    def record(self, method, url, request_body, status, reason, headers, body, elapsed):
+        """Append one exchange; headers is a list of (name, value) pairs"""
+        headers = [(name, value) for name, value in headers if name.lower() not in DROPPED_HEADERS]
+        content_type = next((value for name, value in headers if name.lower() == "content-type"), "")
+        interaction = {
+            "m": method,
+            "u": redact_url(url),
+            "b": self._hash(request_body),
+            "s": status,
+            "r": reason or "",
+            "h": headers,
+            "d": self._write_body(body, content_type.lower()),
+            "t": round(elapsed, 4)
+        }
+        line = json.dumps(interaction) + "\n"
+        with self._lock:
+            with open(self.index_path, 'a') as f:
+                f.write(line)
+            self._index(interaction)
+            self._stats["recorded"] += 1
+
+    def match(self, method, url, request_body):
+        """
+        Return (status, reason, headers, body) recorded for a request, or None
+
+        Sleeps for the recorded response time scaled by timing before returning.
+        """
+        url = redact_url(url)
+        candidates = [(method, url, self._hash(request_body)), route_of(method, url)]
+        with self._lock:
+            for key, table in zip(candidates, (self._exact, self._routes)):
+                interactions = table.get(key)
+                if interactions:
+                    cursor = self._cursors.get(key, 0)
+                    self._cursors[key] = cursor + 1
+                    interaction = interactions[cursor % len(interactions)]
+                    self._stats["replayed"] += 1
+                    break
+            else:
+                self._stats["missed"] += 1
+                return None
+        if self.timing > 0 and interaction["t"] > 0:
+            time.sleep(interaction["t"] * self.timing)
+        return interaction["s"], interaction["r"], interaction["h"], self._read_body(interaction["d"])
+
+    def _miss_message(self, method, url):
+        return f"No response recorded in cassette {self.path} for {method} {redact_url(url)}"
+
+    def install(self):
+        """Patch the requests and httpx transports (whichever are installed) to use this cassette"""
+        if self._restore:
+            return self
+        try:
+            import requests.adapters
+            self._patch(requests.adapters.HTTPAdapter, "send", self._requests_send)
+        except ImportError:
+            pass
+        try:
+            import httpx
+            self._patch(httpx.HTTPTransport, "handle_request", self._httpx_handle_request)
+        except ImportError:
+            pass
+        return self
+
+    def uninstall(self):
+        for owner, name, original in reversed(self._restore):
+            setattr(owner, name, original)
+        self._restore = []
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.uninstall()
+        return False
+
+    def _patch(self, owner, name, make_replacement):
+        original = getattr(owner, name)
+        setattr(owner, name, make_replacement(original))
+        self._restore.append((owner, name, original))
+
+    def _requests_send(self, original):
+        import requests
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+        cassette = self
+
+        def send(adapter, request, stream=False, **kwargs):
+            if cassette.mode == "record":
+                started = time.monotonic()
+                response = original(adapter, request, stream=stream, **kwargs)
+                body = response.content
+                cassette.record(request.method, request.url, request.body, response.status_code,
+                                response.reason, list(response.headers.items()), body,
+                                time.monotonic() - started)
+                return response
+
+            recorded = cassette.match(request.method, request.url, request.body)
+            if recorded is None:
+                raise requests.exceptions.ConnectionError(cassette._miss_message(request.method, request.url),
+                                                          request=request)
+            status, reason, headers, body = recorded
+            response = requests.Response()
+            response.status_code = status
+            response.reason = reason
+            response.headers = CaseInsensitiveDict(headers)
+            response.encoding = get_encoding_from_headers(response.headers)
+            response.raw = io.BytesIO(body)
+            response._content = body
+            response._content_consumed = True
+            response.url = request.url
+            response.request = request
+            response.connection = adapter
+            return response
+        return send
+
+    def _httpx_handle_request(self, original):
+        import httpx
+        cassette = self
+
+        def handle_request(transport, request):
+            request_body = request.read()
+            if cassette.mode == "record":
+                started = time.monotonic()
+                response = original(transport, request)
+                try:
+                    body = response.read()
+                finally:
+                    response.close()
+                cassette.record(request.method, str(request.url), request_body, response.status_code,
+                                response.reason_phrase, response.headers.multi_items(), body,
+                                time.monotonic() - started)
+                headers = [(name, value) for name, value in response.headers.multi_items()
+                           if name.lower() not in DROPPED_HEADERS]
+                return httpx.Response(response.status_code, headers=headers, content=body, request=request,
+                                      extensions=response.extensions)
+
+            recorded = cassette.match(request.method, str(request.url), request_body)
+            if recorded is None:
+                raise httpx.ConnectError(cassette._miss_message(request.method, str(request.url)), request=request)
+            status, reason, headers, body = recorded
+            return httpx.Response(status, headers=headers, content=body, request=request,
+                                  extensions={"reason_phrase": reason.encode("ascii", "replace")})
+        return handle_request
+
+
+_installed = None
+
+
+def install_from_environment():
+    """
+    Install the cassette the environment asks for, once per process
+
+    IMAGEGENIE_CASSETTE=<directory> with IMAGEGENIE_CASSETTE_MODE=record or
+    replay (the default); IMAGEGENIE_CASSETTE_TIMING scales replayed response
+    times (1 = as recorded, 0 = immediately).
+
+    Returns:
+        Cassette: The installed cassette, or None
+    """
+    global _installed
+    path = os.environ.get("IMAGEGENIE_CASSETTE")
+    if _installed is not None or not path:
+        return _installed
+    try:
+        timing = float(os.environ.get("IMAGEGENIE_CASSETTE_TIMING", "1"))
+        _installed = Cassette(path, os.environ.get("IMAGEGENIE_CASSETTE_MODE", "replay"), timing).install()
+    except (OSError, ValueError) as e:
+        print(f"Could not use cassette {path}: {e}", file=sys.stderr)
+    return _installed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python cassettes.py <cassette directory>")
+        sys.exit(1)
+    cassette = Cassette(sys.argv[1])
+    routes = {}
+    for interactions in cassette._exact.values():
+        for interaction in interactions:
+            route = route_of(interaction["m"], interaction["u"])
+            routes[route] = routes.get(route, 0) + 1
+    body_bytes = sum(entry.stat().st_size for entry in os.scandir(cassette.body_dir))
+    print(f"{cassette.stats()['interactions']} interactions, {body_bytes / 1024 / 1024:.1f} MB of bodies")
+    for route, count in sorted(routes.items()):
+        print(f"{count:6d}  {route}")
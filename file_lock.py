@@ -0,0 +1,50 @@
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """
+    Exclusive lock on a lock file, held across processes
+
+    Guards files that several processes append to or rewrite (the blob
+    manifest, the thumbnail atlas): grok.py instances and the Streamlit app
+    share one archive. Each acquisition opens the lock file afresh, so two
+    FileLocks on the same path exclude each other within a process too; a
+    thread lock still has to guard the in-memory state.
+
+        with FileLock(path):
+            ...
+    """
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        except OSError:
+            self._file.close()
+            self._file = None
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._file.close()
+            self._file = None
+        return False
+
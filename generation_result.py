@@ -0,0 +1,170 @@
+import threading
+from io import BytesIO
+
+# File extension for each image MIME type providers return
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp"}
+
+
+class GenerationResult:
+    """
+    What one provider returned for one request, shared by every layer
+
+    The API clients build it, jobs hand the same object to the UI and to the
+    storage layer, and grok.py's carousels hold it, so image bytes exist once
+    per process. images holds bytes-like objects (bytes, or memoryviews over
+    one decoded buffer) and is never copied; urls lists images the provider
+    returned by reference until fetch() downloads them, once, for whichever
+    layer asks first. paths is filled in by whoever saves the images.
+
+    Decoding is lazy: image() opens a PIL image the first time it is asked
+    for and keeps it, so only consumers that draw pixels (the desktop
+    carousels) pay for it. Those keep results around for display only, so
+    once the bytes are saved they call release_encoded() and hold just the
+    decoded images.
+    """
+    __slots__ = ("provider", "model", "images", "urls", "paths", "error", "timings", "metadata",
+                 "_decoded", "_lock", "_source")
+
+    def __init__(self, provider, model=None, images=None, urls=None, paths=None, error=None, timings=None,
+                 metadata=None):
+        self.provider = provider
+        self.model = model
+        self.images = list(images or [])
+        self.urls = list(urls or [])
+        self.paths = list(paths or [])
+        self.error = error
+        self.timings = dict(timings or {})
+        self.metadata = dict(metadata or {})
+        self._decoded = {}
+        self._lock = threading.Lock()
+        self._source = None  # The result this one was copied from, while its URLs are not downloaded
+
+    @classmethod
+    def failure(cls, provider, model, error):
+        """A result carrying only an error message"""
+        return cls(provider, model, error=error)
+
+    @classmethod
+    def merge(cls, results):
+        """
+        Combine fan-out results for one provider into one result
+
+        Images and URLs are gathered in order (the objects, not copies). If
+        none of the results produced anything the first error is kept;
+        otherwise the errors of the requests that failed are listed in
+        metadata["errors"], so a partial result can say what is missing.
+        """
+        results = list(results)
+        first = results[0]
+        merged = cls(first.provider, first.model, metadata=first.metadata)
+        errors = []
+        for result in results:
+            if result.ok:
+                merged.images.extend(result.images)
+                merged.urls.extend(result.urls)
+            else:
+                errors.append(result.error)
+            for name, value in result.timings.items():
+                merged.timings[name] = max(merged.timings.get(name, 0), value)
+        if not merged.count:
+            merged.error = errors[0] if errors else "No image returned"
+        elif errors:
+            merged.metadata["errors"] = errors
+        return merged
+
+    def copy(self):
+        """
+        A shallow copy for another owner: the same image buffers and decoded
+        images, but its own lists and dicts to append to
+
+        Until the URLs are downloaded, fetch() on either downloads once for both.
+        """
+        clone = GenerationResult(self.provider, self.model, self.images, self.urls, self.paths, self.error,
+                                 self.timings, self.metadata)
+        clone._decoded = dict(self._decoded)
+        if self.urls and not self.images:
+            clone._source = self
+        return clone
+
+    def __repr__(self):
+        if self.error:
+            return f"GenerationResult({self.provider!r}, error={self.error[:80]!r})"
+        return f"GenerationResult({self.provider!r}, model={self.model!r}, images={len(self.images)}, " \
+               f"urls={len(self.urls)})"
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    @property
+    def count(self):
+        """Number of images, downloaded or not"""
+        return max(len(self.images), len(self.urls))
+
+    @property
+    def data(self):
+        """The first image's bytes, or None"""
+        return self.images[0] if self.images else None
+
+    @property
+    def url(self):
+        """The first image's URL, or None"""
+        return self.urls[0] if self.urls else None
+
+    @property
+    def mime_type(self):
+        """The images' MIME type, as the provider reported it in metadata (PNG unless stated)"""
+        return self.metadata.get("mime_type", "image/png")
+
+    @property
+    def extension(self):
+        """File extension matching mime_type"""
+        return EXTENSIONS.get(self.mime_type, ".png")
+
+    @property
+    def path(self):
+        """The first saved path, or None"""
+        return self.paths[0] if self.paths else None
+
+    def fetch(self):
+        """
+        Download the URL images if that has not happened yet and return images
+
+        Concurrent callers (the results fragment and the run history saver)
+        wait for one download instead of each fetching their own copy. Failed
+        downloads are None.
+        """
+        with self._lock:
+            if self.urls and not self.images:
+                if self._source is not None:
+                    self.images = list(self._source.fetch())
+                else:
+                    from utils import save_images_from_urls
+                    self.images = save_images_from_urls(self.urls)
+                self._source = None
+            return self.images
+
+    def image(self, index=0):
+        """The decoded PIL image at index, decoded on first use and kept"""
+        decoded = self._decoded.get(index)
+        if decoded is None:
+            from PIL import Image
+            data = self.fetch()[index]
+            decoded = Image.open(BytesIO(data))
+            decoded.load()
+            self._decoded[index] = decoded
+        return decoded
+
+    def release_encoded(self):
+        """
+        Drop the bytes of images that are already decoded; their files (paths) keep them
+
+        Those entries of images become None, so image() still returns the
+        decoded images and fetch() does not download them again.
+        """
+        with self._lock:
+            self.images = [None if index in self._decoded else data for index, data in enumerate(self.images)]
+
+    def set_image(self, index, image):
+        """Hand over an already decoded image for index, so image() does not decode it again"""
+        self._decoded[index] = image
@@ -2,23 +2,38 @@ import os
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
 import threading
-import replicate
-from PIL import Image, ImageTk, ImageDraw, ImageFilter
-import io
-import requests
-import re
+import queue
 import time
 import json
 import concurrent.futures
 from datetime import datetime
 import math
+from collections import OrderedDict
+
+from singleflight import SingleFlight, make_request_key, credential_fingerprint
+from prompt_cache import PromptCache
+from model_versions import ModelVersionCache
+from archive_index import ArchiveIndex
+from thumbnail_atlas import ThumbnailAtlas
+from archive_sync import ArchiveSync
+from blob_store import BlobStore
+from image_writer import ImageWriter
+from archive_gc import RetentionPolicy, ArchiveSweeper
+from archive_layout import ArchiveLayout
+from generation_result import GenerationResult
+from tracing import span, traced
+from metrics import RequestTracker, start_exporters
+from cassettes import install_from_environment as install_cassette
+from startup import mark as mark_startup
+
+mark_startup("grok", "imports")
 
 # Custom UI elements and themes
 from tkinter import font
 
 class ImageGeneratorApp:
     def __init__(self, root):
-        self.root = root
+        self._init_services(root)
         self.root.title("AI Image Generator")
         self.root.geometry("900x700")
         self.root.configure(bg="#f0f0f0")
@@ -63,24 +78,22 @@ class ImageGeneratorApp:
         self.generated_images = []
         self.image_widgets = []
         
-        # For tracking thread status
-        self.active_generations = {}
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
-        self.generation_timeout = 180  # 3 minutes timeout
-        
-        # Settings directory and file
-        self.settings_dir = os.path.join(os.path.expanduser('~'), '.imagegenie')
-        self.settings_file = os.path.join(self.settings_dir, 'settings.json')
-        
-        # Create output directory
-        self.output_dir = "generated_images"
-        if not os.path.exists(self.output_dir):
-            os.makedirs(self.output_dir)
-        
         # Create settings directory if it doesn't exist
         if not os.path.exists(self.settings_dir):
             os.makedirs(self.settings_dir)
         
+        # Prompt enhancement settings and memoized results
+        self.enhance_model = "anthropic/claude-3.7-sonnet"
+        self.enhance_temperature = 0.7
+        self.enhance_max_tokens = 1024  # An enhanced prompt is a paragraph, not an essay
+        self.enhancement_cache = PromptCache(os.path.join(self.settings_dir, 'enhanced_prompts.json'))
+        
+        # Prometheus endpoint/file for the provider metrics, if configured
+        start_exporters()
+        
+        # Record or replay provider HTTP traffic, if IMAGEGENIE_CASSETTE is set
+        install_cassette()
+        
         # Image carousel reference
         self.carousel = None
         self.carousel_images = []
@@ -97,6 +110,118 @@ class ImageGeneratorApp:
         self.create_widgets()
         self.load_saved_token()
         
+        # Keep the index and previews in step with files added or removed by other means
+        self.archive_sync = ArchiveSync(
+            self.output_dir,
+            self.archive_index,
+            self.thumbnail_atlas,
+            on_change=lambda paths: self.root.after(0, self._on_archive_changed),
+            log=lambda message: self.root.after(0, lambda: self.add_log(message))
+        )
+        
+        # Apply the retention policy from settings.json in the background
+        self.archive_sweeper = ArchiveSweeper(
+            self.archive_index,
+            RetentionPolicy.from_settings(self.load_settings()),
+            blob_store=self.blob_store,
+            thumbnail_atlas=self.thumbnail_atlas,
+            on_change=lambda paths: self.root.after(0, self._on_archive_changed),
+            log=lambda message: self.root.after(0, lambda: self.add_log(message))
+        )
+        
+        # Background services start once the window has been drawn
+        self.root.after_idle(self._after_first_paint)
+        mark_startup("grok", "init")
+    
+    @classmethod
+    def headless(cls, root, output_dir="generated_images", layout=None):
+        """
+        An app with the generation and storage services but no widgets
+
+        For scripts and benchmarks that drive the generation threads directly.
+        root only needs after(); the background archive services are not
+        started.
+        """
+        app = cls.__new__(cls)
+        app._init_services(root, output_dir, layout)
+        return app
+    
+    def _init_services(self, root, output_dir="generated_images", layout=None):
+        """Set up what generating and saving images needs, shared by the window and headless()"""
+        self.root = root
+        
+        # For tracking thread status
+        self.active_generations = {}
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=10)
+        self.generation_timeout = 180  # 3 minutes timeout
+        
+        # Coalesces identical in-flight Replicate requests
+        self.replicate_flights = SingleFlight()
+        
+        # Models that return several images from one prediction: input name and maximum
+        self.batch_output_params = {
+            "black-forest-labs/flux-schnell": ("num_outputs", 4),
+            "bytedance/sdxl-lightning-4step": ("num_outputs", 4),
+        }
+        
+        # Pinned model versions, shared by all worker threads
+        self.model_versions = ModelVersionCache(
+            log=lambda message: self.root.after(0, lambda: self.add_log(message))
+        )
+        
+        # Separate pool for image downloads, so batch workers never wait on their own pool
+        self.download_executor = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+        
+        # Settings directory and file
+        self.settings_dir = os.path.join(os.path.expanduser('~'), '.imagegenie')
+        self.settings_file = os.path.join(self.settings_dir, 'settings.json')
+        
+        # Create output directory
+        self.output_dir = output_dir
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        
+        # Metadata index of everything saved to the output directory
+        self.archive_index = ArchiveIndex(self.output_dir)
+        
+        # Where new images go: "flat" (Model/file) or "sharded" (Model/date/bucket/file),
+        # set by "archive_layout" in settings.json; existing files are found through the index
+        self.archive_layout = (ArchiveLayout(self.output_dir, layout) if layout
+                               else ArchiveLayout.from_settings(self.output_dir, self.load_settings()))
+        
+        # Packed previews of everything saved, for the gallery
+        self.thumbnail_atlas = ThumbnailAtlas(self.output_dir)
+        
+        # Image bytes are stored once per distinct content and re-encoded losslessly
+        # in the background; the per-model paths link to them
+        self.blob_store = BlobStore(self.output_dir, transcode=True, on_transcoded=self._on_blobs_transcoded)
+        
+        # Writes finished images in batches off the generation threads. Its thread
+        # never touches Tk: on_closing joins it on the main thread, so messages go
+        # through a queue the main loop drains
+        self.writer_messages = queue.Queue()
+        self.image_writer = ImageWriter(self.blob_store, log=self.writer_messages.put)
+        
+        # Enhanced prompt text -> the prompt it was enhanced from
+        self.original_prompts = {}
+    
+    def _after_first_paint(self):
+        """Start the work that doesn't need to hold up the window's first paint"""
+        mark_startup("grok", "first_paint")
+        self.archive_sync.start()
+        self.archive_sweeper.start()
+        self._drain_writer_messages()
+    
+    def _drain_writer_messages(self):
+        """Log what the image writer's thread reported, and check again shortly"""
+        while True:
+            try:
+                message = self.writer_messages.get_nowait()
+            except queue.Empty:
+                break
+            self.add_log(message)
+        self.root.after(200, self._drain_writer_messages)
+        
     def create_menu(self):
         """Create application menu bar"""
         menubar = tk.Menu(self.root)
@@ -119,6 +244,15 @@ class ImageGeneratorApp:
         # Show Status Log menu item
         file_menu.add_command(label="Show Status Log", command=self.show_status_log)
         
+        # Search past generations
+        file_menu.add_command(label="Search History...", command=self.show_search_dialog)
+        
+        # Browse the whole archive
+        file_menu.add_command(label="Browse Gallery...", command=self.show_gallery)
+        
+        # Limits on how much history is kept
+        file_menu.add_command(label="Archive Retention...", command=self.show_retention_dialog)
+        
         # Arena Mode menu item
         file_menu.add_command(label="Enter Arena Mode", command=self.enter_arena_mode)
         
@@ -593,6 +727,76 @@ class ImageGeneratorApp:
         except Exception as e:
             self.add_log(f"Error saving API token: {str(e)}")
     
+    def load_settings(self):
+        """Return the contents of settings.json, or {} if it is missing or unreadable"""
+        try:
+            with open(self.settings_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def show_retention_dialog(self):
+        """Show a dialog to configure how much of the archive is kept"""
+        policy = self.archive_sweeper.policy
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Archive Retention")
+        dialog.resizable(False, False)
+        dialog.transient(self.root)
+        dialog.grab_set()
+        
+        content_frame = ttk.Frame(dialog, padding=20)
+        content_frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(content_frame, text="Leave a field empty for no limit.").grid(row=0, column=0, columnspan=2, sticky=tk.W, pady=(0, 10))
+        
+        ttk.Label(content_frame, text="Maximum size (GB):").grid(row=1, column=0, sticky=tk.W, pady=2)
+        size_entry = ttk.Entry(content_frame, width=10)
+        size_entry.grid(row=1, column=1, sticky=tk.W, padx=(10, 0), pady=2)
+        if policy.max_bytes is not None:
+            size_entry.insert(0, f"{policy.max_bytes / 1024 ** 3:g}")
+        
+        ttk.Label(content_frame, text="Maximum age (days):").grid(row=2, column=0, sticky=tk.W, pady=2)
+        age_entry = ttk.Entry(content_frame, width=10)
+        age_entry.grid(row=2, column=1, sticky=tk.W, padx=(10, 0), pady=2)
+        if policy.max_age_days is not None:
+            age_entry.insert(0, f"{policy.max_age_days:g}")
+        
+        keep_starred_var = tk.BooleanVar(value=policy.keep_starred)
+        ttk.Checkbutton(content_frame, text="Always keep starred images (right-click in the gallery)",
+                        variable=keep_starred_var).grid(row=3, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        ttk.Label(content_frame, text=f"Archive size now: {self.archive_index.stored_bytes() / 1024 ** 3:.2f} GB").grid(
+            row=4, column=0, columnspan=2, sticky=tk.W, pady=(10, 0))
+        
+        def save():
+            try:
+                max_gb = float(size_entry.get()) if size_entry.get().strip() else None
+                max_age_days = float(age_entry.get()) if age_entry.get().strip() else None
+            except ValueError:
+                messagebox.showerror("Error", "Limits must be numbers", parent=dialog)
+                return
+            new_policy = RetentionPolicy(
+                max_bytes=int(max_gb * 1024 ** 3) if max_gb is not None else None,
+                max_age_days=max_age_days,
+                keep_starred=keep_starred_var.get()
+            )
+            try:
+                settings = self.load_settings()
+                settings['retention'] = new_policy.to_settings()
+                with open(self.settings_file, 'w') as f:
+                    json.dump(settings, f)
+            except Exception as e:
+                self.add_log(f"Error saving retention settings: {str(e)}")
+            self.archive_sweeper.set_policy(new_policy)
+            self.add_log("Archive retention settings updated")
+            dialog.destroy()
+        
+        button_frame = ttk.Frame(content_frame)
+        button_frame.grid(row=5, column=0, columnspan=2, sticky=tk.E, pady=(20, 0))
+        ttk.Button(button_frame, text="Save", command=save).pack(side=tk.RIGHT, padx=5)
+        ttk.Button(button_frame, text="Cancel", command=dialog.destroy).pack(side=tk.RIGHT, padx=5)
+    
     def load_saved_token(self):
         """Load the saved API token if available"""
         try:
@@ -620,6 +824,12 @@ class ImageGeneratorApp:
             if has_token and self.save_token_var.get():
                 self.token_is_set = True
                 self.token_frame.pack_forget()
+            
+            if has_token:
+                # Resolve model versions ahead of the first generation, once the window is up
+                os.environ["REPLICATE_API_TOKEN"] = self.token_entry.get().strip()
+                models = list(self.available_models.values())
+                self.root.after_idle(lambda: self.model_versions.prefetch(models))
                 
         except Exception as e:
             self.add_log(f"Error loading saved API token: {str(e)}")
@@ -668,7 +878,7 @@ class ImageGeneratorApp:
         self.embedded_counter_label.config(text="")
         
         if self.carousel and self.carousel.winfo_exists():
-            self.carousel.images = []
+            self.carousel.images = self.carousel_images
             self.carousel.current_index = 0
             self.carousel.update_display()
         
@@ -682,6 +892,7 @@ class ImageGeneratorApp:
         
         futures = []
         for idx, (model_name, model_id) in enumerate(selected_models):
+            generations = []
             for image_idx in range(images_per_model):
                 if self.arena_mode:
                     display_name = f"Image {idx + 1}"
@@ -694,22 +905,42 @@ class ImageGeneratorApp:
                 
                 self.add_log(f"Queuing model: {generation_name}")
                 self.active_generations[generation_name] = "queued"
-                
-                future = self.executor.submit(
-                    self._generate_image_thread, 
-                    api_token, 
-                    prompt, 
-                    generation_name, 
-                    model_id, 
-                    idx * images_per_model + image_idx, 
-                    generation_complete,
-                    display_name
-                )
-                futures.append(future)
+                generations.append((generation_name, display_name))
+            
+            batch_param, max_batch_size = self.get_batch_output_param(model_id)
+            if batch_param and len(generations) > 1:
+                # One prediction per batch of up to max_batch_size images
+                for start in range(0, len(generations), max_batch_size):
+                    future = self.executor.submit(
+                        self._generate_batch_thread,
+                        api_token,
+                        prompt,
+                        model_name,
+                        model_id,
+                        batch_param,
+                        generations[start:start + max_batch_size],
+                        generation_complete
+                    )
+                    futures.append(future)
+            else:
+                for image_idx, (generation_name, display_name) in enumerate(generations):
+                    future = self.executor.submit(
+                        self._generate_image_thread, 
+                        api_token, 
+                        prompt, 
+                        generation_name, 
+                        model_id, 
+                        idx * images_per_model + image_idx, 
+                        generation_complete,
+                        display_name
+                    )
+                    futures.append(future)
         
         self.root.after(1000, self._check_generation_status, futures, generation_complete)
     
+    @traced("grok.generate_image")
     def _generate_image_thread(self, api_token, prompt, generation_name, model_id, position, complete_event, display_name):
+        import requests
         try:
             self.root.after(0, lambda: self.add_log(f"Starting generation with {generation_name}..."))
             self.active_generations[generation_name] = "running"
@@ -718,10 +949,18 @@ class ImageGeneratorApp:
             if "(" in generation_name and ")" in generation_name:
                 base_model_name = generation_name.split("(")[0].strip()
             
-            output = replicate.run(
-                model_id,
-                input={"prompt": prompt}
-            )
+            # Each requested variant is its own request; only true duplicates share a call
+            request_key = make_request_key("replicate", model_id, prompt, {
+                "variant": generation_name,
+                "credential": credential_fingerprint(api_token)
+            })
+            started = time.monotonic()
+            with span("grok.remote", model=generation_name):
+                output = self.replicate_flights.do(
+                    request_key,
+                    lambda: self._run_replicate(model_id, {"prompt": prompt})
+                )
+            generated = time.monotonic()
             
             if self.active_generations.get(generation_name) == "canceled":
                 self.root.after(0, lambda: self.add_log(f"Generation with {generation_name} was canceled"))
@@ -734,28 +973,31 @@ class ImageGeneratorApp:
             
             self.root.after(0, lambda: self.add_log(f"Downloading image from {generation_name}..."))
             
-            response = requests.get(image_url, timeout=30)
+            with span("grok.download", model=generation_name) as download_span:
+                response = requests.get(image_url, timeout=30)
+                download_span.set(status=response.status_code, bytes=len(response.content))
             if response.status_code == 200:
-                image_data = response.content
-                
-                model_dir = os.path.join(self.output_dir, base_model_name.replace(" ", "_"))
-                if not os.path.exists(model_dir):
-                    os.makedirs(model_dir)
-                
-                sanitized_prompt = re.sub(r'[^\w\s-]', '', prompt)
-                sanitized_prompt = re.sub(r'[\s-]+', '_', sanitized_prompt)
-                sanitized_prompt = sanitized_prompt[:50]
-                
-                timestamp = int(time.time())
-                filename = f"{sanitized_prompt}_{timestamp}.png"
-                filepath = os.path.join(model_dir, filename)
+                downloaded = time.monotonic()
+                result = GenerationResult(
+                    "replicate", display_name,
+                    images=[response.content],
+                    urls=[image_url],
+                    timings={
+                        "generation_ms": (generated - started) * 1000,
+                        "download_ms": (downloaded - generated) * 1000,
+                        "total_ms": (downloaded - started) * 1000
+                    },
+                    metadata={"model_id": model_id, "generation": generation_name}
+                )
                 
-                with open(filepath, 'wb') as f:
-                    f.write(image_data)
+                with span("grok.decode", model=generation_name):
+                    # Decode here rather than on the UI thread when the carousel first shows it
+                    result.image()
                 
-                image = Image.open(io.BytesIO(image_data))
+                with span("grok.save", model=generation_name):
+                    filepath = self._save_image(result, prompt, base_model_name)
                 
-                self.root.after(0, lambda: self.add_to_carousel(image, display_name, filepath, generation_name))
+                self.root.after(0, lambda: self.add_to_carousel(result))
                 
                 self.root.after(0, lambda: self.add_log(f"Image generated by {generation_name} and saved at {filepath}"))
             else:
@@ -780,6 +1022,176 @@ class ImageGeneratorApp:
             if all(status in ["completed", "canceled"] for status in self.active_generations.values()):
                 complete_event.set()
     
+    def _run_replicate(self, model_id, model_input):
+        """Run one prediction on the pinned model version, recording it in the provider metrics"""
+        import replicate
+        with RequestTracker("replicate", model_id) as request:
+            output = replicate.run(self.model_versions.resolve(model_id), input=model_input)
+            if output:
+                request.images = len(output) if isinstance(output, list) else 1
+            else:
+                request.fail()
+            return output
+    
+    def get_batch_output_param(self, model_id):
+        """Return (input name, maximum) for models with native multi-image output, else (None, 1)"""
+        base_model_id = model_id.split(":")[0]
+        return self.batch_output_params.get(base_model_id, (None, 1))
+    
+    def _save_image(self, result, prompt, base_model_name, suffix=""):
+        """
+        Queue a result's image for saving under the model's output directory and return the file path
+
+        The file is written by the background image writer straight from the
+        result's bytes; it is indexed and added to the thumbnail atlas once it
+        is safely on disk. The path is also recorded in result.paths, and the
+        result keeps only the decoded image from then on: the carousels never
+        need the bytes again.
+        """
+        image_data = result.data
+        image = result.image()
+        model_id = result.metadata.get("model_id")
+        timings = result.timings
+        params = result.metadata.get("params")
+        timestamp = int(time.time())
+        filename = self.archive_layout.filename_for(prompt, timestamp, suffix)
+        filepath = self.archive_layout.path_for(base_model_name.replace(" ", "_"), filename, timestamp)
+        original_prompt = self.original_prompts.get(prompt)
+        
+        def on_written(digest, is_new):
+            if not is_new:
+                self.writer_messages.put(f"Duplicate image; {filename} shares storage with an earlier one")
+            
+            try:
+                self.archive_index.add_image(
+                    filepath,
+                    image_data,
+                    base_model_name,
+                    prompt,
+                    model_id=model_id,
+                    provider="replicate",
+                    original_prompt=original_prompt,
+                    params=params,
+                    timings=timings,
+                    size=image.size if image is not None else None,
+                    created_at=timestamp
+                )
+            except Exception as e:
+                self.writer_messages.put(f"Error indexing {filepath}: {str(e)}")
+            
+            if image is not None:
+                try:
+                    self.thumbnail_atlas.add(self.archive_index.relative_path(filepath), image,
+                                             mtime=os.path.getmtime(filepath))
+                except Exception as e:
+                    self.writer_messages.put(f"Error adding preview for {filepath}: {str(e)}")
+        
+        self.image_writer.submit(image_data, filepath, callback=on_written)
+        result.paths.append(filepath)
+        result.release_encoded()
+        return filepath
+    
+    def _on_blobs_transcoded(self, filepaths):
+        """Bring index sizes and previews up to date after the blob store re-encoded files"""
+        for filepath in filepaths:
+            try:
+                self.archive_index.refresh_file(filepath)
+                self.thumbnail_atlas.add_file(self.archive_index.relative_path(filepath), filepath)
+            except Exception as e:
+                error_msg = f"Error refreshing {filepath}: {str(e)}"
+                self.root.after(0, lambda msg=error_msg: self.add_log(msg))
+    
+    def _download_image(self, image_url):
+        """Download one output image, returning (bytes, None) or (None, error message)"""
+        import requests
+        try:
+            response = requests.get(image_url, timeout=30)
+            if response.status_code == 200:
+                return response.content, None
+            return None, f"HTTP {response.status_code}"
+        except requests.exceptions.Timeout:
+            return None, "timeout"
+        except requests.exceptions.RequestException as e:
+            return None, str(e)
+    
+    @traced("grok.generate_batch")
+    def _generate_batch_thread(self, api_token, prompt, model_name, model_id, batch_param, generations, complete_event):
+        """Generate several images with a single prediction and download them in parallel"""
+        batch_name = f"{model_name} ({len(generations)} images)"
+        try:
+            self.root.after(0, lambda: self.add_log(f"Starting batched generation with {batch_name}..."))
+            for generation_name, _ in generations:
+                self.active_generations[generation_name] = "running"
+            
+            request_key = make_request_key("replicate", model_id, prompt, {
+                "variant": [generation_name for generation_name, _ in generations],
+                batch_param: len(generations),
+                "credential": credential_fingerprint(api_token)
+            })
+            started = time.monotonic()
+            with span("grok.remote", model=model_name, images=len(generations)):
+                output = self.replicate_flights.do(
+                    request_key,
+                    lambda: self._run_replicate(model_id, {"prompt": prompt, batch_param: len(generations)})
+                )
+            generated = time.monotonic()
+            
+            if not output:
+                raise ValueError("Model returned empty result")
+            
+            image_urls = list(output) if isinstance(output, list) else [output]
+            if len(image_urls) < len(generations):
+                self.root.after(0, lambda: self.add_log(
+                    f"{batch_name} returned {len(image_urls)} of {len(generations)} images"))
+            
+            self.root.after(0, lambda: self.add_log(f"Downloading {len(image_urls)} images from {batch_name}..."))
+            with span("grok.download", model=model_name, images=len(image_urls)):
+                downloads = list(self.download_executor.map(self._download_image, image_urls[:len(generations)]))
+            downloaded = time.monotonic()
+            timings = {
+                "generation_ms": (generated - started) * 1000,
+                "download_ms": (downloaded - generated) * 1000,
+                "total_ms": (downloaded - started) * 1000
+            }
+            
+            for image_idx, ((generation_name, display_name), (image_data, error)) in enumerate(zip(generations, downloads)):
+                if self.active_generations.get(generation_name) == "canceled":
+                    self.root.after(0, lambda name=generation_name: self.add_log(f"Generation with {name} was canceled"))
+                    continue
+                
+                if error:
+                    self.root.after(0, lambda name=generation_name, error=error: self.add_log(
+                        f"Error downloading image from {name}: {error}"))
+                    continue
+                
+                result = GenerationResult(
+                    "replicate", display_name,
+                    images=[image_data],
+                    urls=[image_urls[image_idx]],
+                    timings=timings,
+                    metadata={"model_id": model_id, "generation": generation_name,
+                              "params": {batch_param: len(generations)}}
+                )
+                with span("grok.decode", model=generation_name):
+                    result.image()
+                with span("grok.save", model=generation_name):
+                    filepath = self._save_image(result, prompt, model_name, suffix=f"_{image_idx + 1}")
+                
+                self.root.after(0, lambda result=result: self.add_to_carousel(result))
+                self.root.after(0, lambda name=generation_name, filepath=filepath: self.add_log(
+                    f"Image generated by {name} and saved at {filepath}"))
+        
+        except Exception as e:
+            error_msg = f"Failed to generate images with {batch_name}: {str(e)}"
+            self.root.after(0, lambda: self.add_log(error_msg))
+        finally:
+            for generation_name, _ in generations:
+                if self.active_generations.get(generation_name) != "canceled":
+                    self.active_generations[generation_name] = "completed"
+            
+            if all(status in ["completed", "canceled"] for status in self.active_generations.values()):
+                complete_event.set()
+    
     def _check_generation_status(self, futures, complete_event):
         """Check the status of image generation threads and update UI"""
         active_count = sum(1 for status in self.active_generations.values() if status in ["queued", "running"])
@@ -795,6 +1207,12 @@ class ImageGeneratorApp:
             self.progress_var.set(f"Generation complete: {completed_count}/{total_count} images generated, {canceled_count} canceled")
             self.re_enable_generate_button()
             
+            flight_stats = self.replicate_flights.stats()
+            self.add_log(f"Replicate requests: {flight_stats['executed']} sent, {flight_stats['coalesced']} coalesced")
+            
+            version_stats = self.model_versions.stats()
+            self.add_log(f"Model versions: {version_stats['hits']} cache hits, {version_stats['misses']} lookups, {version_stats['refreshes']} background refreshes")
+            
             if self.arena_mode and self.carousel_images:
                 self.show_voting_interface()
             elif self.carousel_images:
@@ -822,7 +1240,7 @@ class ImageGeneratorApp:
         list_frame = ttk.Frame(voting_window)
         list_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
-        self.ranking_list = [display_name for _, display_name, _ in self.carousel_images]
+        self.ranking_list = [result.model for result in self.carousel_images]
         
         self.listbox = tk.Listbox(list_frame, font=("Helvetica", 12), height=10)
         for item in self.ranking_list:
@@ -910,30 +1328,32 @@ class ImageGeneratorApp:
         self.add_log("Canceled all active generations")
         self.re_enable_generate_button()
     
-    def add_to_carousel(self, image, model_name, filepath, identifier=None):
-        """Add an image to the carousel collection"""
-        existing_indices = [i for i, (_, name, _) in enumerate(self.carousel_images) if name == model_name]
+    def add_to_carousel(self, result):
+        """
+        Add a GenerationResult to the carousel collection
+
+        The fullscreen carousel shows the same list, so it only needs redrawing.
+        """
+        model_name = result.model
+        existing_indices = [i for i, existing in enumerate(self.carousel_images) if existing.model == model_name]
         
         if existing_indices:
             index = existing_indices[0]
-            self.carousel_images[index] = (image, model_name, filepath)
+            self.carousel_images[index] = result
             
             if self.embedded_current_index == index:
                 self.update_embedded_carousel()
             
-            if self.carousel and self.carousel.winfo_exists():
-                self.carousel.images[index] = (image, model_name, filepath)
-                if self.carousel.current_index == index:
-                    self.carousel.update_display()
+            if self.carousel and self.carousel.winfo_exists() and self.carousel.current_index == index:
+                self.carousel.update_display()
                     
             self.add_log(f"Updated existing image for {model_name}")
         else:
-            self.carousel_images.append((image, model_name, filepath))
+            self.carousel_images.append(result)
             self.embedded_current_index = len(self.carousel_images) - 1
             self.update_embedded_carousel()
             
             if self.carousel and self.carousel.winfo_exists():
-                self.carousel.add_image(image, model_name, filepath)
                 self.carousel.current_index = self.embedded_current_index
                 self.carousel.update_display()
                 
@@ -949,6 +1369,11 @@ class ImageGeneratorApp:
             if self.carousel and self.carousel.winfo_exists():
                 self.carousel.destroy()
             self.executor.shutdown(wait=False)
+            self.download_executor.shutdown(wait=False)
+            # Don't lose images that finished but aren't on disk yet
+            self.image_writer.close()
+            self.archive_sync.stop()
+            self.archive_sweeper.stop()
             self.root.destroy()
         except:
             self.root.destroy()
@@ -1028,8 +1453,10 @@ class ImageGeneratorApp:
         
         self.embedded_current_index = 0
     
+    @traced("grok.render_embedded")
     def update_embedded_carousel(self):
         """Update the embedded carousel with the current image"""
+        from PIL import Image, ImageTk
         if not self.carousel_images:
             self.embedded_model_label.config(text="No images yet")
             self.embedded_counter_label.config(text="")
@@ -1038,7 +1465,8 @@ class ImageGeneratorApp:
             
         self.fullscreen_button.config(state=tk.NORMAL)
         
-        image, model_name, filepath = self.carousel_images[self.embedded_current_index]
+        result = self.carousel_images[self.embedded_current_index]
+        image, model_name = result.image(), result.model
         
         max_width = self.embedded_image_frame.winfo_width() - 40
         max_height = self.embedded_image_frame.winfo_height() - 40
@@ -1154,6 +1582,88 @@ class ImageGeneratorApp:
         )
         close_button.pack(side=tk.RIGHT, padx=5)
     
+    def _on_archive_changed(self):
+        """Redraw the gallery after the archive changed on disk"""
+        if hasattr(self, 'gallery') and self.gallery and self.gallery.winfo_exists():
+            self.gallery.refresh(keep_position=True)
+    
+    def show_gallery(self):
+        """Show the thumbnail gallery over all saved generations"""
+        if hasattr(self, 'gallery') and self.gallery and self.gallery.winfo_exists():
+            self.gallery.lift()
+            return
+        self.gallery = GalleryBrowser(self.root, self.archive_index, self.thumbnail_atlas)
+    
+    def show_search_dialog(self):
+        """Show a dialog for full-text search over all saved generations"""
+        if hasattr(self, 'search_window') and self.search_window and self.search_window.winfo_exists():
+            self.search_window.lift()
+            return
+        
+        self.search_window = tk.Toplevel(self.root)
+        self.search_window.title("Search History")
+        self.search_window.geometry("600x450")
+        self.search_window.minsize(400, 300)
+        
+        search_frame = ttk.Frame(self.search_window, padding=10)
+        search_frame.pack(fill=tk.BOTH, expand=True)
+        
+        ttk.Label(search_frame, text="Search prompts:").pack(anchor=tk.W)
+        
+        query_var = tk.StringVar()
+        query_entry = ttk.Entry(search_frame, textvariable=query_var)
+        query_entry.pack(fill=tk.X, pady=5)
+        query_entry.focus_set()
+        
+        results_list = tk.Listbox(search_frame, font=("Helvetica", 10))
+        results_list.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        status_var = tk.StringVar(value="")
+        ttk.Label(search_frame, textvariable=status_var, font=("Helvetica", 9)).pack(anchor=tk.W)
+        
+        results = []
+        pending = {"after_id": None}
+        
+        def run_search():
+            pending["after_id"] = None
+            started = time.monotonic()
+            results[:] = self.archive_index.search(query_var.get())
+            elapsed_ms = (time.monotonic() - started) * 1000
+            
+            results_list.delete(0, tk.END)
+            for row in results:
+                created = datetime.fromtimestamp(row['created_at']).strftime("%Y-%m-%d %H:%M")
+                results_list.insert(tk.END, f"[{row['model_name']}] {created}  {row['prompt'][:90]}")
+            status_var.set(f"{len(results)} result(s) in {elapsed_ms:.1f} ms" if query_var.get().strip() else "")
+        
+        def on_query_changed(*args):
+            # Debounce so typing doesn't run a query per keystroke
+            if pending["after_id"]:
+                self.search_window.after_cancel(pending["after_id"])
+            pending["after_id"] = self.search_window.after(150, run_search)
+        
+        def open_selected(event=None):
+            from PIL import Image
+            selection = results_list.curselection()
+            if not selection:
+                return
+            row = results[selection[0]]
+            filepath = self.archive_index.absolute_path(row['path'])
+            try:
+                image = Image.open(filepath)
+                image.load()
+            except Exception as e:
+                messagebox.showerror("Error", f"Could not open {filepath}: {str(e)}", parent=self.search_window)
+                return
+            result = GenerationResult(row['provider'], row['model_name'], paths=[filepath])
+            result.set_image(0, image)
+            carousel = ImageCarousel(self.root, [result])
+            carousel.title(row['prompt'][:80])
+        
+        query_var.trace_add("write", on_query_changed)
+        results_list.bind("<Double-Button-1>", open_selected)
+        results_list.bind("<Return>", open_selected)
+    
     def on_log_window_close(self):
         """Handle log window closing"""
         if hasattr(self, 'log_window'):
@@ -1192,6 +1702,12 @@ class ImageGeneratorApp:
             messagebox.showerror("Error", "Please enter your Replicate API token")
             return
         
+        cached_prompt = self.enhancement_cache.get(original_prompt, self.enhance_model, self.enhance_temperature)
+        if cached_prompt:
+            self.add_log("Using cached prompt enhancement")
+            self._display_enhanced_prompt(cached_prompt)
+            return
+        
         os.environ["REPLICATE_API_TOKEN"] = api_token
         
         self.progress_var.set("Enhancing prompt...")
@@ -1200,6 +1716,7 @@ class ImageGeneratorApp:
     
     def _enhance_prompt_thread(self, original_prompt):
         """Run prompt enhancement in a separate thread"""
+        import replicate
         try:
             self.root.after(0, lambda: self.add_log(f"Starting prompt enhancement with text: '{original_prompt}'"))
             
@@ -1220,24 +1737,28 @@ class ImageGeneratorApp:
             
             self.root.after(0, lambda: self.add_log("Calling Claude API via Replicate..."))
             
-            output = replicate.run(
-                "anthropic/claude-3.7-sonnet",
+            self.root.after(0, self._begin_enhanced_prompt_stream)
+            
+            # Stream tokens into the suggestion box as they arrive
+            enhanced_prompt = ""
+            for event in replicate.stream(
+                self.enhance_model,
                 input={
                     "system": system_prompt,
                     "prompt": user_prompt,
-                    "temperature": 0.7,
-                    "max_tokens": 10500
+                    "temperature": self.enhance_temperature,
+                    "max_tokens": self.enhance_max_tokens
                 }
-            )
+            ):
+                chunk = str(event)
+                if chunk:
+                    enhanced_prompt += chunk
+                    self.root.after(0, lambda chunk=chunk: self._append_enhanced_prompt(chunk))
             
-            enhanced_prompt = ""
-            if hasattr(output, '__iter__') and not isinstance(output, str):
-                for item in output:
-                    enhanced_prompt += item
+            enhanced_prompt = enhanced_prompt.strip()
+            if enhanced_prompt:
+                self.enhancement_cache.put(original_prompt, self.enhance_model, self.enhance_temperature, enhanced_prompt)
             else:
-                enhanced_prompt = str(output)
-            
-            if not enhanced_prompt.strip():
                 enhanced_prompt = "Could not enhance the prompt. Please try again or use the original prompt."
                 self.root.after(0, lambda: self.add_log("Warning: Received empty response from API"))
             
@@ -1249,6 +1770,16 @@ class ImageGeneratorApp:
             self.root.after(0, lambda: self.progress_var.set(""))
             self.root.after(0, lambda: messagebox.showerror("Error", error_msg))
     
+    def _begin_enhanced_prompt_stream(self):
+        """Show an empty suggestion box that streamed tokens are appended to"""
+        self.enhanced_prompt_text.delete("1.0", tk.END)
+        self.enhanced_prompt_frame.pack(fill=tk.X, pady=(5, 0), after=self.prompt_text)
+    
+    def _append_enhanced_prompt(self, chunk):
+        """Append a streamed chunk of the enhanced prompt"""
+        self.enhanced_prompt_text.insert(tk.END, chunk)
+        self.enhanced_prompt_text.see(tk.END)
+    
     def _display_enhanced_prompt(self, enhanced_prompt):
         """Display the enhanced prompt in the UI"""
         self.progress_var.set("")
@@ -1263,6 +1794,9 @@ class ImageGeneratorApp:
     def use_enhanced_prompt(self):
         """Replace the original prompt with the enhanced version"""
         enhanced_prompt = self.enhanced_prompt_text.get("1.0", tk.END).strip()
+        original_prompt = self.prompt_text.get("1.0", tk.END).strip()
+        if original_prompt and original_prompt != enhanced_prompt:
+            self.original_prompts[enhanced_prompt] = original_prompt
         
         self.prompt_text.delete("1.0", tk.END)
         self.prompt_text.insert(tk.END, enhanced_prompt)
@@ -1458,7 +1992,7 @@ class ImageCarousel(tk.Toplevel):
             self.accent_color = "#FF8C00"
             self.button_text_color = "#000000"
         
-        self.images = images or []
+        self.images = images if images is not None else []
         self.current_index = 0
         
         self.configure(bg=self.bg_color)
@@ -1537,14 +2071,17 @@ class ImageCarousel(tk.Toplevel):
         
         self.nav_frame.grid_columnconfigure(1, weight=1)
         
+    @traced("grok.render_carousel")
     def update_display(self):
         """Update the display with the current image"""
+        from PIL import Image, ImageTk
         if not self.images:
             self.model_label.config(text="No images to display")
             self.counter_label.config(text="")
             return
         
-        image, model_name, filepath = self.images[self.current_index]
+        result = self.images[self.current_index]
+        image, model_name = result.image(), result.model
         
         max_width = self.image_frame.winfo_width() - 40
         max_height = self.image_frame.winfo_height() - 40
@@ -1575,9 +2112,9 @@ class ImageCarousel(tk.Toplevel):
         self.left_btn.config(state=tk.NORMAL if self.current_index > 0 else tk.DISABLED)
         self.right_btn.config(state=tk.NORMAL if self.current_index < len(self.images) - 1 else tk.DISABLED)
     
-    def add_image(self, image, model_name, filepath):
-        """Add a new image to the carousel"""
-        self.images.append((image, model_name, filepath))
+    def add_image(self, result):
+        """Add a GenerationResult to the carousel"""
+        self.images.append(result)
         if len(self.images) == 1:
             self.update_display()
     
@@ -1603,13 +2140,281 @@ class ImageCarousel(tk.Toplevel):
         self.current_index = 0
         self.update_display()
 
-    def replace_image(self, index, image, model_name, filepath):
-        """Replace an image at the specified index"""
+    def replace_image(self, index, result):
+        """Replace the GenerationResult at the specified index"""
         if 0 <= index < len(self.images):
-            self.images[index] = (image, model_name, filepath)
+            self.images[index] = result
             if self.current_index == index:
                 self.update_display()
 
+class GalleryBrowser(tk.Toplevel):
+    """
+    A virtualized thumbnail grid over the generation archive
+
+    Only the rows in view have canvas items and PhotoImages; rows are fetched
+    from the archive index page by page. Previews come straight from the
+    thumbnail atlas; images missing from it are decoded once on a background
+    pool and added. Recently shown previews are kept in a bounded LRU cache.
+    """
+    CELL_WIDTH = 150
+    CELL_HEIGHT = 170
+    DATE_FILTERS = {
+        "All time": None,
+        "Last 24 hours": 24 * 3600,
+        "Last 7 days": 7 * 24 * 3600,
+        "Last 30 days": 30 * 24 * 3600,
+    }
+
+    def __init__(self, parent, archive_index, thumbnail_atlas, max_cached_thumbnails=300):
+        super().__init__(parent)
+        
+        self.title("Gallery")
+        self.geometry("900x650")
+        self.minsize(400, 300)
+        
+        self.archive_index = archive_index
+        self.thumbnail_atlas = thumbnail_atlas
+        self.thumb_size = thumbnail_atlas.size
+        self.max_cached_thumbnails = max_cached_thumbnails
+        self.thumbnails = OrderedDict()  # path -> PIL thumbnail, least recently used first
+        self.photos = {}  # path -> PhotoImage, visible cells only
+        self.pending = set()
+        self.visible_paths = set()
+        self.visible_rows = []
+        self.cells = []  # pooled (image item, text item) pairs
+        self.scroll_offset = 0
+        self.total = 0
+        self.loader = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        
+        self.create_widgets()
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        self.refresh()
+    
+    def create_widgets(self):
+        """Create the filter bar and the scrolling canvas"""
+        filter_frame = ttk.Frame(self, padding=(10, 10, 10, 0))
+        filter_frame.pack(fill=tk.X)
+        
+        ttk.Label(filter_frame, text="Model:").pack(side=tk.LEFT)
+        self.model_var = tk.StringVar(value="All models")
+        self.model_combo = ttk.Combobox(filter_frame, textvariable=self.model_var, state="readonly", width=25)
+        self.model_combo.pack(side=tk.LEFT, padx=(5, 15))
+        self.model_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh())
+        
+        ttk.Label(filter_frame, text="Date:").pack(side=tk.LEFT)
+        self.date_var = tk.StringVar(value="All time")
+        date_combo = ttk.Combobox(filter_frame, textvariable=self.date_var, state="readonly", width=15,
+                                  values=list(self.DATE_FILTERS))
+        date_combo.pack(side=tk.LEFT, padx=5)
+        date_combo.bind("<<ComboboxSelected>>", lambda e: self.refresh())
+        
+        self.count_var = tk.StringVar(value="")
+        ttk.Label(filter_frame, textvariable=self.count_var).pack(side=tk.RIGHT)
+        
+        grid_frame = ttk.Frame(self, padding=10)
+        grid_frame.pack(fill=tk.BOTH, expand=True)
+        
+        self.scrollbar = ttk.Scrollbar(grid_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.canvas = tk.Canvas(grid_frame, bg="#ffffff", highlightthickness=0)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        self.canvas.bind("<Configure>", lambda e: self.render())
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda e: self.scroll_by(-self.CELL_HEIGHT // 2))
+        self.canvas.bind("<Button-5>", lambda e: self.scroll_by(self.CELL_HEIGHT // 2))
+        self.canvas.bind("<Button-1>", self.on_click)
+        # Right-click stars an image so archive cleanup keeps it
+        self.canvas.bind("<Button-3>", self.on_toggle_star)
+        self.canvas.bind("<Button-2>", self.on_toggle_star)
+    
+    def filters(self):
+        """Return (model_name, since) for the current filter selection"""
+        model_name = self.model_var.get()
+        if model_name == "All models":
+            model_name = None
+        max_age = self.DATE_FILTERS.get(self.date_var.get())
+        since = time.time() - max_age if max_age else None
+        return model_name, since
+    
+    def refresh(self, keep_position=False):
+        """Re-read the model list and result count; jumps back to the top unless keep_position"""
+        self.model_combo.configure(values=["All models"] + self.archive_index.model_names())
+        model_name, since = self.filters()
+        self.total = self.archive_index.count(model_name=model_name, since=since)
+        self.count_var.set(f"{self.total} images")
+        if not keep_position:
+            self.scroll_offset = 0
+        self.render()
+    
+    def columns(self):
+        return max(1, self.canvas.winfo_width() // self.CELL_WIDTH)
+    
+    def content_height(self):
+        return math.ceil(self.total / self.columns()) * self.CELL_HEIGHT
+    
+    def render(self):
+        """Lay out the cells for the rows currently in view"""
+        view_height = max(1, self.canvas.winfo_height())
+        columns = self.columns()
+        content_height = self.content_height()
+        self.scroll_offset = max(0, min(self.scroll_offset, content_height - view_height))
+        
+        first_row = self.scroll_offset // self.CELL_HEIGHT
+        last_row = (self.scroll_offset + view_height) // self.CELL_HEIGHT
+        first_index = first_row * columns
+        visible_count = (last_row - first_row + 1) * columns
+        
+        model_name, since = self.filters()
+        self.visible_rows = self.archive_index.query(
+            model_name=model_name, since=since, limit=visible_count, offset=first_index
+        ) if self.total else []
+        self.visible_paths = {row['path'] for row in self.visible_rows}
+        
+        # Release PhotoImages that scrolled out of view
+        for path in list(self.photos):
+            if path not in self.visible_paths:
+                del self.photos[path]
+        
+        while len(self.cells) < len(self.visible_rows):
+            image_item = self.canvas.create_image(0, 0, anchor=tk.N)
+            text_item = self.canvas.create_text(0, 0, anchor=tk.N, width=self.CELL_WIDTH - 10,
+                                                font=("Helvetica", 9), fill="#333333")
+            self.cells.append((image_item, text_item))
+        
+        for i, (image_item, text_item) in enumerate(self.cells):
+            if i >= len(self.visible_rows):
+                self.canvas.itemconfigure(image_item, state=tk.HIDDEN)
+                self.canvas.itemconfigure(text_item, state=tk.HIDDEN)
+                continue
+            
+            row = self.visible_rows[i]
+            x = (i % columns) * self.CELL_WIDTH + self.CELL_WIDTH // 2
+            y = (first_row + i // columns) * self.CELL_HEIGHT - self.scroll_offset + 5
+            
+            self.canvas.coords(image_item, x, y)
+            self.canvas.coords(text_item, x, y + self.thumb_size + 4)
+            self.canvas.itemconfigure(image_item, image=self.photo_for(row['path']) or "", state=tk.NORMAL)
+            label = f"\u2605 {row['model_name']}" if row['starred'] else row['model_name']
+            self.canvas.itemconfigure(text_item, text=label, state=tk.NORMAL)
+        
+        if content_height > 0:
+            self.scrollbar.set(self.scroll_offset / content_height,
+                               min(1.0, (self.scroll_offset + view_height) / content_height))
+        else:
+            self.scrollbar.set(0, 1)
+    
+    def photo_for(self, path):
+        """Return the PhotoImage for a visible path, requesting the thumbnail if it isn't loaded"""
+        from PIL import ImageTk
+        if path in self.photos:
+            return self.photos[path]
+        thumbnail = self.thumbnails.get(path)
+        if thumbnail is None:
+            # Atlas reads are a memory slice, cheap enough for the UI thread
+            thumbnail = self.thumbnail_atlas.get(path)
+            if thumbnail is not None:
+                self._cache_thumbnail(path, thumbnail)
+        if thumbnail is None:
+            if path not in self.pending:
+                self.pending.add(path)
+                self.loader.submit(self._load_thumbnail, path)
+            return None
+        self.thumbnails.move_to_end(path)
+        self.photos[path] = ImageTk.PhotoImage(thumbnail)
+        return self.photos[path]
+    
+    def _load_thumbnail(self, path):
+        """Add an image missing from the atlas, on the loader pool"""
+        from PIL import Image
+        thumbnail = None
+        # Skip work for cells that scrolled away while queued
+        if path in self.visible_paths:
+            if self.thumbnail_atlas.add_file(path, self.archive_index.absolute_path(path)):
+                thumbnail = self.thumbnail_atlas.get(path)
+            else:
+                thumbnail = Image.new("RGB", (self.thumb_size, self.thumb_size), "#dddddd")
+        try:
+            self.after(0, self._on_thumbnail_loaded, path, thumbnail)
+        except (RuntimeError, tk.TclError):
+            pass  # Window closed
+    
+    def _on_thumbnail_loaded(self, path, thumbnail):
+        self.pending.discard(path)
+        if thumbnail is None or not self.winfo_exists():
+            return
+        self._cache_thumbnail(path, thumbnail)
+        # Fill in just the cell showing this path
+        for i, row in enumerate(self.visible_rows):
+            if row['path'] == path and i < len(self.cells):
+                self.canvas.itemconfigure(self.cells[i][0], image=self.photo_for(path))
+    
+    def _cache_thumbnail(self, path, thumbnail):
+        self.thumbnails[path] = thumbnail
+        self.thumbnails.move_to_end(path)
+        while len(self.thumbnails) > self.max_cached_thumbnails:
+            self.thumbnails.popitem(last=False)
+    
+    def scroll_by(self, pixels):
+        self.scroll_offset += pixels
+        self.render()
+    
+    def on_mousewheel(self, event):
+        self.scroll_by(-int(event.delta / 120 * self.CELL_HEIGHT / 2) if abs(event.delta) >= 120 else -event.delta * 10)
+    
+    def on_scrollbar(self, action, value, unit=None):
+        """Translate scrollbar commands into a pixel offset"""
+        view_height = max(1, self.canvas.winfo_height())
+        if action == tk.MOVETO:
+            self.scroll_offset = int(float(value) * self.content_height())
+        elif action == tk.SCROLL:
+            step = view_height if unit == tk.PAGES else self.CELL_HEIGHT // 2
+            self.scroll_offset += int(value) * step
+        self.render()
+    
+    def row_at(self, event):
+        """Return the index row under a mouse event, or None"""
+        columns = self.columns()
+        column = event.x // self.CELL_WIDTH
+        if column >= columns:
+            return None
+        index = ((event.y + self.scroll_offset) // self.CELL_HEIGHT) * columns + column
+        first_index = (self.scroll_offset // self.CELL_HEIGHT) * columns
+        if not 0 <= index - first_index < len(self.visible_rows):
+            return None
+        return self.visible_rows[index - first_index]
+    
+    def on_toggle_star(self, event):
+        row = self.row_at(event)
+        if row is None:
+            return
+        self.archive_index.set_starred(self.archive_index.absolute_path(row['path']), not row['starred'])
+        self.render()
+    
+    def on_click(self, event):
+        """Open the clicked image in a carousel"""
+        from PIL import Image
+        row = self.row_at(event)
+        if row is None:
+            return
+        filepath = self.archive_index.absolute_path(row['path'])
+        try:
+            image = Image.open(filepath)
+            image.load()
+        except Exception as e:
+            messagebox.showerror("Error", f"Could not open {filepath}: {str(e)}", parent=self)
+            return
+        result = GenerationResult(row['provider'], row['model_name'], paths=[filepath])
+        result.set_image(0, image)
+        carousel = ImageCarousel(self, [result])
+        carousel.title(row['prompt'][:80])
+    
+    def on_close(self):
+        self.loader.shutdown(wait=False, cancel_futures=True)
+        self.destroy()
+
 class MultiSelectDropdown(ttk.Frame):
     """A custom dropdown widget that allows multiple selections"""
     def __init__(self, parent, options=None, width=30, placeholder="Select items...", 
@@ -0,0 +1,114 @@
+import queue
+import threading
+
+from tracing import span
+
+
+class ImageWriter:
+    """
+    Background writer that takes finished images off the generation threads
+
+    Images are queued with submit() and written by one thread through the blob
+    store in batches: whatever is waiting (up to batch_size) is written to
+    temporary files, fsynced together and renamed into place, so a crash never
+    leaves a truncated file and a burst of images costs one round of syncs.
+    Each item's callback runs on the writer thread once its file is in place.
+    close() joins that thread, so callbacks and log must not wait on the thread
+    that calls close() (a GUI's main loop, say); hand messages over through a
+    queue instead.
+    """
+    def __init__(self, blob_store, batch_size=32, batch_delay=0.05, durable=True, log=None):
+        self.blob_store = blob_store
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.durable = durable
+        self.log = log or (lambda message: None)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._stats = {"written": 0, "batches": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True, name="image-writer")
+        self._thread.start()
+
+    def submit(self, image_data, filepath, callback=None, on_error=None):
+        """
+        Queue image bytes to be written to filepath
+
+        Args:
+            image_data: Image bytes
+            filepath: Destination path; callers are expected to make it unique
+            callback: Optional callable(digest, is_new) run after the file is written
+            on_error: Optional callable(exception) run instead if the file could not be written
+        """
+        if self._closed:
+            raise RuntimeError("Image writer is closed")
+        self._queue.put((image_data, filepath, callback, on_error))
+
+    def flush(self):
+        """Block until everything submitted so far is on disk"""
+        self._queue.join()
+
+    def close(self):
+        """Write what is queued, then stop the writer thread"""
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+
+    def stats(self):
+        return dict(self._stats, queued=self._queue.qsize())
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            batch = [item]
+            stop = False
+            # Give a burst of completions a moment to arrive so they share one sync
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=self.batch_delay)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            with span("writer.write_batch", images=len(batch)):
+                results = self.blob_store.store_many(
+                    [(image_data, filepath) for image_data, filepath, _, _ in batch], durable=self.durable)
+        except Exception as e:
+            # Fall back to one at a time so one bad path doesn't lose the rest
+            if len(batch) > 1:
+                for item in batch:
+                    self._write([item])
+                return
+            self._stats["errors"] += 1
+            self.log(f"Error saving {batch[0][1]}: {str(e)}")
+            on_error = batch[0][3]
+            if on_error is not None:
+                try:
+                    on_error(e)
+                except Exception as callback_error:
+                    self.log(f"Error after failing to save {batch[0][1]}: {str(callback_error)}")
+            return
+
+        self._stats["written"] += len(batch)
+        self._stats["batches"] += 1
+        for (_, filepath, callback, _), (digest, is_new) in zip(batch, results):
+            if callback is None:
+                continue
+            try:
+                callback(digest, is_new)
+            except Exception as e:
+                self.log(f"Error after saving {filepath}: {str(e)}")
@@ -0,0 +1,152 @@
+import hashlib
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_result import GenerationResult
+
+
+def make_job_key(prompt, providers, credentials=None, params=None):
+    """
+    Build a deduplication key for a generation job
+
+    Args:
+        prompt: Text prompt for image generation
+        providers: Iterable of provider display names
+        credentials: Optional iterable of API keys, hashed into the key so that
+            sessions using different accounts never share a job
+        params: Optional dict of generation settings that change the output
+
+    Returns:
+        str: Hex digest identifying the job
+    """
+    normalized_prompt = " ".join(prompt.split())
+    digest = hashlib.sha256()
+    digest.update(normalized_prompt.encode("utf-8"))
+    for provider in sorted(providers):
+        digest.update(b"\0" + provider.encode("utf-8"))
+    for credential in credentials or []:
+        digest.update(b"\1" + (credential or "").encode("utf-8"))
+    for name, value in sorted((params or {}).items()):
+        digest.update(f"\2{name}={value}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class GenerationJob:
+    """A background generation job whose results fill in as providers finish"""
+    def __init__(self, key, prompt, providers, params=None):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.prompt = prompt
+        self.providers = list(providers)
+        self.params = dict(params or {})
+        self.created_at = time.time()
+        self.finished_at = None
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def set_result(self, provider, result):
+        """Record the GenerationResult of one provider"""
+        with self._lock:
+            self._results[provider] = result
+            if len(self._results) == len(self.providers):
+                self.finished_at = time.time()
+
+    def results(self):
+        """Return a snapshot of the results received so far, in provider order"""
+        with self._lock:
+            return {name: self._results[name] for name in self.providers if name in self._results}
+
+    @property
+    def done(self):
+        with self._lock:
+            return len(self._results) == len(self.providers)
+
+    @property
+    def progress(self):
+        """Fraction of providers that have returned a result"""
+        if not self.providers:
+            return 1.0
+        with self._lock:
+            return len(self._results) / len(self.providers)
+
+
+class JobManager:
+    """
+    Runs generation jobs on a shared thread pool, outside the script run
+
+    Jobs are looked up by id so they survive reruns, and identical in-flight
+    submissions are coalesced onto the existing job. on_result, if given, is
+    called as on_result(job, provider, result) on the worker thread as each
+    provider finishes; it should hand off anything slow.
+    """
+    def __init__(self, max_workers=8, max_finished_jobs=64, on_result=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self.max_finished_jobs = max_finished_jobs
+        self.on_result = on_result
+        self._jobs = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def submit(self, prompt, generators, credentials=None, params=None):
+        """
+        Submit a generation job, reusing an identical job that is still running
+
+        Args:
+            prompt: Text prompt for image generation
+            generators: List of (provider name, zero-argument callable) tuples
+            credentials: Optional iterable of API keys used by the generators
+            params: Optional dict of generation settings shared by the generators
+
+        Returns:
+            GenerationJob: The new or already running job
+        """
+        providers = [name for name, _ in generators]
+        key = make_job_key(prompt, providers, credentials, params)
+
+        with self._lock:
+            job_id = self._inflight.get(key)
+            if job_id in self._jobs and not self._jobs[job_id].done:
+                return self._jobs[job_id]
+
+            job = GenerationJob(key, prompt, providers, params)
+            self._jobs[job.id] = job
+            self._inflight[key] = job.id
+            self._prune_finished()
+
+        for name, generator in generators:
+            self.executor.submit(self._run, job, name, generator)
+
+        return job
+
+    def get(self, job_id):
+        """Return the job with the given id, or None if it is unknown or pruned"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, name, generator):
+        try:
+            result = generator()
+        except Exception as e:
+            result = GenerationResult.failure(name, None, str(e))
+        job.set_result(name, result)
+        if self.on_result is not None:
+            try:
+                self.on_result(job, name, result)
+            except Exception:
+                pass  # A failed hook must not take the job down
+
+        if job.done:
+            with self._lock:
+                if self._inflight.get(job.key) == job.id:
+                    del self._inflight[job.key]
+
+    def _prune_finished(self):
+        """Drop the oldest finished jobs beyond the retention limit (lock held)"""
+        finished = [job for job in self._jobs.values() if job.done]
+        if len(finished) <= self.max_finished_jobs:
+            return
+        finished.sort(key=lambda job: job.finished_at or job.created_at)
+        for job in finished[:len(finished) - self.max_finished_jobs]:
+            del self._jobs[job.id]
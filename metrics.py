@@ -0,0 +1,317 @@
+import bisect
+import functools
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from generation_result import GenerationResult
+
+# Request latencies in seconds; image generation runs from ~1 s to a couple of minutes
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 45, 60, 90, 120)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution; quantiles are interpolated within a bucket, as Prometheus does"""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels):
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def quantile(self, q, **labels):
+        """Estimate the q-quantile (0..1), or None if nothing was observed"""
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            counts = list(entry[0]) if entry else None
+        if not counts or not sum(counts):
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]  # Above the last bucket; report its bound
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """A set of named metrics that renders to the Prometheus text format"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=()):
+        return self._get(Gauge, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets=buckets)
+
+    def render_prometheus(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(line for metric in metrics for line in metric.render()) + "\n"
+
+
+registry = MetricsRegistry()
+
+provider_requests = registry.counter(
+    "imagegenie_provider_requests_total", "Provider requests by outcome", ("provider", "model", "outcome"))
+provider_latency = registry.histogram(
+    "imagegenie_provider_request_seconds", "Provider request latency", ("provider", "model"))
+provider_inflight = registry.gauge(
+    "imagegenie_provider_inflight_requests", "Provider requests currently running", ("provider", "model"))
+provider_images = registry.counter(
+    "imagegenie_provider_images_total", "Images returned by providers", ("provider", "model"))
+
+# Completion times per (provider, model), for recent-throughput figures in the UI
+_completions = {}
+_completions_lock = threading.Lock()
+
+
+class RequestTracker:
+    """
+    Context manager recording one provider request in the shared metrics
+
+    Exceptions count as errors; call fail() for failures reported as values.
+    """
+    def __init__(self, provider, model):
+        self.provider = provider
+        self.model = model
+        self.outcome = "ok"
+        self.images = 0
+
+    def fail(self):
+        self.outcome = "error"
+
+    def __enter__(self):
+        provider_inflight.inc(provider=self.provider, model=self.model)
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        finished = time.monotonic()
+        if exc_type is not None:
+            self.outcome = "error"
+        provider_inflight.dec(provider=self.provider, model=self.model)
+        provider_latency.observe(finished - self.started, provider=self.provider, model=self.model)
+        provider_requests.inc(provider=self.provider, model=self.model, outcome=self.outcome)
+        if self.images:
+            provider_images.inc(self.images, provider=self.provider, model=self.model)
+        with _completions_lock:
+            _completions.setdefault((self.provider, self.model), deque(maxlen=10000)).append(finished)
+        return False
+
+
+def measured(provider, model):
+    """Decorator for api_clients functions: records latency, outcome and images returned"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with RequestTracker(provider, model) as request:
+                result = fn(*args, **kwargs)
+                if isinstance(result, GenerationResult):
+                    result.timings.setdefault("request_ms", (time.monotonic() - request.started) * 1000)
+                    if not result.ok:
+                        request.fail()
+                    else:
+                        request.images = result.count or 1
+                return result
+        return wrapper
+    return decorator
+
+
+def provider_summary(window=300):
+    """
+    Per (provider, model) figures for a diagnostics view
+
+    Returns:
+        list: Dicts with requests, errors, error rate, p50/p95 seconds, in-flight
+            count and requests per minute over the last window seconds
+    """
+    now = time.monotonic()
+    keys = set()
+    with provider_latency._lock:
+        keys.update(provider_latency._values)
+    with provider_inflight._lock:
+        keys.update(provider_inflight._values)
+
+    rows = []
+    for provider, model in sorted(keys):
+        labels = {"provider": provider, "model": model}
+        errors = provider_requests.value(outcome="error", **labels)
+        total = errors + provider_requests.value(outcome="ok", **labels)
+        with _completions_lock:
+            recent = sum(1 for finished in _completions.get((provider, model), ()) if now - finished <= window)
+        rows.append({
+            "provider": provider,
+            "model": model,
+            "requests": total,
+            "errors": errors,
+            "error_rate": errors / total if total else 0.0,
+            "p50_s": provider_latency.quantile(0.5, **labels),
+            "p95_s": provider_latency.quantile(0.95, **labels),
+            "in_flight": provider_inflight.value(**labels),
+            "per_minute": recent * 60 / window,
+        })
+    return rows
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host="127.0.0.1"):
+    """Serve /metrics in the Prometheus text format from a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-http").start()
+    return server
+
+
+def write_prometheus_file(path):
+    """Write the current metrics atomically (for a node_exporter textfile collector)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def start_exporters(interval=15):
+    """
+    Start whichever exporters the environment asks for
+
+    IMAGEGENIE_METRICS_PORT serves http://127.0.0.1:<port>/metrics;
+    IMAGEGENIE_METRICS_FILE rewrites that file every interval seconds.
+    """
+    port = os.environ.get("IMAGEGENIE_METRICS_PORT")
+    if port:
+        try:
+            start_http_server(int(port))
+        except (OSError, ValueError) as e:
+            print(f"Could not start metrics endpoint on port {port}: {e}", file=sys.stderr)
+
+    path = os.environ.get("IMAGEGENIE_METRICS_FILE")
+    if path:
+        def run():
+            while True:
+                try:
+                    write_prometheus_file(path)
+                except OSError as e:
+                    print(f"Could not write metrics to {path}: {e}", file=sys.stderr)
+                time.sleep(interval)
+        threading.Thread(target=run, daemon=True, name="metrics-file").start()
@@ -0,0 +1,114 @@
+import threading
+import time
+
+
+def resolve_latest_version(model_id):
+    """
+    Look up the latest version of a Replicate model
+
+    Args:
+        model_id: Unpinned model id ("owner/name")
+
+    Returns:
+        str: Version id, or None for models that are not versioned (official models)
+    """
+    import replicate
+
+    model = replicate.models.get(model_id)
+    latest_version = getattr(model, 'latest_version', None)
+    return latest_version.id if latest_version else None
+
+
+class ModelVersionCache:
+    """
+    Resolves unpinned "owner/name" model ids to pinned "owner/name:version" ids
+
+    Each model is resolved once and shared by all worker threads. Entries expire
+    after ttl seconds; an expired entry is still served while a background thread
+    refreshes it, so only the very first lookup of a model pays the round trip.
+    Failed or unversioned lookups fall back to the unpinned id.
+    """
+    def __init__(self, resolver=resolve_latest_version, ttl=3600, failure_ttl=60, log=None):
+        self.resolver = resolver
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.log = log or (lambda message: None)
+        self._entries = {}  # model_id -> (version or None, expires_at)
+        self._refreshing = set()
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "refreshes": 0}
+
+    def resolve(self, model_id):
+        """Return the pinned id for model_id, or model_id itself if it can't be pinned"""
+        if ":" in model_id:
+            return model_id
+
+        with self._lock:
+            entry = self._entries.get(model_id)
+            if entry is not None:
+                self._stats["hits"] += 1
+                version, expires_at = entry
+                if expires_at <= time.monotonic() and model_id not in self._refreshing:
+                    self._refreshing.add(model_id)
+                    threading.Thread(target=self._refresh, args=(model_id,), daemon=True).start()
+                return self._pin(model_id, version)
+            model_lock = self._model_locks.setdefault(model_id, threading.Lock())
+
+        # Only one thread resolves a given model; the others wait for its answer
+        with model_lock:
+            with self._lock:
+                entry = self._entries.get(model_id)
+                if entry is not None:
+                    self._stats["hits"] += 1
+                    return self._pin(model_id, entry[0])
+                self._stats["misses"] += 1
+            return self._pin(model_id, self._lookup(model_id))
+
+    def prefetch(self, model_ids):
+        """Resolve models in a background thread so the first generation doesn't wait"""
+        def run():
+            for model_id in model_ids:
+                self.resolve(model_id)
+        threading.Thread(target=run, daemon=True).start()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, cached=len(self._entries))
+
+    def _lookup(self, model_id):
+        """Ask the resolver for the current version and store the result"""
+        started = time.monotonic()
+        try:
+            version = self.resolver(model_id)
+            ttl = self.ttl
+        except Exception as e:
+            # Keep serving the previously resolved version, if any, and retry soon
+            with self._lock:
+                previous = self._entries.get(model_id)
+            version = previous[0] if previous else None
+            ttl = self.failure_ttl
+            self.log(f"Could not resolve version of {model_id}: {str(e)}")
+        else:
+            elapsed_ms = (time.monotonic() - started) * 1000
+            if version:
+                self.log(f"Pinned {model_id} to version {version[:12]} ({elapsed_ms:.0f} ms, cached for {ttl // 60} min)")
+            else:
+                self.log(f"{model_id} is not versioned; using it unpinned")
+
+        with self._lock:
+            self._entries[model_id] = (version, time.monotonic() + ttl)
+        return version
+
+    def _refresh(self, model_id):
+        try:
+            with self._lock:
+                self._stats["refreshes"] += 1
+            self._lookup(model_id)
+        finally:
+            with self._lock:
+                self._refreshing.discard(model_id)
+
+    @staticmethod
+    def _pin(model_id, version):
+        return f"{model_id}:{version}" if version else model_id
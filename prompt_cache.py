@@ -0,0 +1,62 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class PromptCache:
+    """
+    Least-recently-used cache of prompt enhancements, persisted to a JSON file
+
+    Entries are keyed by (original prompt, model, temperature). The file is
+    rewritten atomically on every store, so a crash never leaves it truncated.
+    """
+    def __init__(self, path, max_entries=256):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    @staticmethod
+    def make_key(prompt, model, temperature):
+        return json.dumps([prompt.strip(), model, float(temperature)])
+
+    def get(self, prompt, model, temperature):
+        """Return the cached enhancement, or None"""
+        key = self.make_key(prompt, model, temperature)
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, prompt, model, temperature, enhanced_prompt):
+        """Store an enhancement, evicting the least recently used entries beyond max_entries"""
+        key = self.make_key(prompt, model, temperature)
+        with self._lock:
+            self._entries[key] = enhanced_prompt
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+            # Stored oldest first, so insertion order restores recency
+            for key, value in entries[-self.max_entries:]:
+                self._entries[key] = value
+        except (OSError, ValueError, TypeError):
+            self._entries.clear()
+
+    def _save(self):
+        """Write the cache to disk (lock held)"""
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._entries.items()), f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,274 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from archive_index import ArchiveIndex, image_size
+from archive_layout import ArchiveLayout
+from blob_store import BlobStore
+from generation_result import EXTENSIONS, GenerationResult
+from image_writer import ImageWriter
+
+# The desktop app's settings; "archive_layout" there decides where new images go for both apps
+SETTINGS_PATH = os.path.join(os.path.expanduser('~'), '.imagegenie', 'settings.json')
+
+
+def load_settings(path=SETTINGS_PATH):
+    """Return the contents of settings.json, or {} if it is missing or unreadable"""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def rename_paths(root_dir, renamed, dirname=".runs"):
+    """
+    Point run manifests at images that moved within the archive
+
+    Args:
+        root_dir: Archive root
+        renamed: Old relative path -> new relative path
+
+    Returns:
+        int: Number of manifests rewritten
+    """
+    runs_dir = os.path.join(root_dir, dirname)
+    rewritten = 0
+    if not renamed or not os.path.isdir(runs_dir):
+        return 0
+    for day in sorted(os.listdir(runs_dir)):
+        day_dir = os.path.join(runs_dir, day)
+        if not os.path.isdir(day_dir):
+            continue
+        for name in sorted(os.listdir(day_dir)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(day_dir, name)
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            changed = False
+            for entry in manifest.get('results', {}).values():
+                paths = entry.get('paths')
+                if paths and any(p in renamed for p in paths):
+                    entry['paths'] = [renamed.get(p, p) for p in paths]
+                    changed = True
+            if changed:
+                tmp_path = f"{path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(manifest, f)
+                os.replace(tmp_path, path)
+                rewritten += 1
+    return rewritten
+
+
+class RunHistory:
+    """
+    Saves generation runs from app.py into the shared archive and reads them back
+
+    Each provider result is handed to record() as it arrives and saved on a
+    background pool: returned bytes are written as they are, returned URLs are
+    downloaded first (through GenerationResult.fetch(), so the page showing
+    the same result reuses that download). Images go through the same blob store, layout and index as
+    the desktop app. Every run also gets a JSON manifest under .runs/<date>/
+    listing the saved paths (or error) per provider, and a line in
+    .runs/history.jsonl once all of its providers are saved.
+
+    New images follow the archive layout chosen in the desktop app's
+    settings.json unless layout is given.
+    """
+    def __init__(self, root_dir="generated_images", archive_index=None, layout=None, max_workers=4,
+                 dirname=".runs"):
+        self.root_dir = root_dir
+        self.runs_dir = os.path.join(root_dir, dirname)
+        self.history_path = os.path.join(self.runs_dir, "history.jsonl")
+        self.archive_index = archive_index or ArchiveIndex(root_dir)
+        self.layout = ArchiveLayout(root_dir, layout) if layout else ArchiveLayout.from_settings(root_dir, load_settings())
+        self.writer = ImageWriter(BlobStore(root_dir), log=lambda message: print(message, file=sys.stderr))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="run-history")
+        self._runs = {}  # job id -> manifest of runs still being saved
+        self._pending = {}  # job id -> images submitted to the writer and not yet written (or failed)
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.runs_dir):
+            os.makedirs(self.runs_dir)
+
+    def record(self, job, provider, result):
+        """Queue one provider's result for saving; cheap enough to call from the job thread"""
+        self.executor.submit(self._save_result, job, provider, result)
+
+    def manifest_path(self, job_id, created_at):
+        day = time.strftime("%Y-%m-%d", time.localtime(created_at))
+        return os.path.join(self.runs_dir, day, f"{job_id}.json")
+
+    def recent(self, limit=20):
+        """Return summaries of the most recent completed runs, newest first"""
+        runs = deque(maxlen=limit)
+        try:
+            with open(self.history_path, 'r') as f:
+                for line in f:
+                    try:
+                        runs.append(json.loads(line))
+                    except ValueError:
+                        continue
+        except OSError:
+            pass
+        return list(reversed(runs))
+
+    def load(self, run):
+        """
+        Read a run's images back from the archive
+
+        Args:
+            run: A summary returned by recent()
+
+        Returns:
+            dict: Provider name -> GenerationResult, with the archive paths it was read from
+        """
+        with open(os.path.join(self.runs_dir, *run['manifest'].split("/")), 'r') as f:
+            manifest = json.load(f)
+
+        results = {}
+        for provider in manifest['providers']:
+            entry = manifest['results'].get(provider, {'error': "Not saved"})
+            if 'error' in entry:
+                results[provider] = GenerationResult.failure(provider, None, entry['error'])
+                continue
+            result = results[provider] = GenerationResult(provider)
+            if entry.get('errors'):
+                result.metadata['errors'] = entry['errors']
+            for path in entry['paths']:
+                try:
+                    with open(self.archive_index.absolute_path(path), 'rb') as f:
+                        result.images.append(f.read())
+                    result.paths.append(path)
+                except OSError:
+                    continue
+            if not result.images:
+                results[provider] = GenerationResult.failure(provider, None, "Saved images are no longer in the archive")
+                continue
+            # The saved file names carry the format
+            extension = os.path.splitext(result.paths[0])[1].lower()
+            result.metadata['mime_type'] = next(
+                (mime_type for mime_type, known in EXTENSIONS.items() if known == extension), "image/png")
+        return results
+
+    def _save_result(self, job, provider, result):
+        try:
+            entry = self._save_images(job, provider, result)
+        except Exception as e:
+            entry = {'error': f"Not saved: {str(e)}"}
+
+        with self._lock:
+            manifest = self._runs.setdefault(job.id, {
+                'id': job.id,
+                'prompt': job.prompt,
+                'created_at': job.created_at,
+                'params': job.params,
+                'providers': job.providers,
+                'results': {}
+            })
+            manifest['results'][provider] = entry
+            try:
+                self._write_manifest(manifest)
+            except OSError as e:
+                print(f"Error saving run manifest for {job.id}: {e}", file=sys.stderr)
+            finished = self._pop_finished(job.id)
+        if finished is not None:
+            self._append_history(finished)
+
+    def _written(self, job_id):
+        """Writer callback: one of the run's images is on disk (or failed)"""
+        with self._lock:
+            self._pending[job_id] -= 1
+            finished = self._pop_finished(job_id)
+        if finished is not None:
+            self._append_history(finished)
+
+    def _pop_finished(self, job_id):
+        """
+        Return a run's manifest, and stop tracking it, once every provider is
+        saved and all of its images are on disk; None until then (lock held)
+        """
+        manifest = self._runs.get(job_id)
+        if manifest is None or self._pending.get(job_id) or len(manifest['results']) < len(manifest['providers']):
+            return None
+        del self._runs[job_id]
+        self._pending.pop(job_id, None)
+        return manifest
+
+    def _save_images(self, job, provider, result):
+        """Write one provider's images and return its manifest entry"""
+        if not result.ok:
+            return {'error': result.error}
+
+        urls = result.urls
+        images = result.fetch()
+        if not images:
+            return {'error': "Result has no image"}
+
+        model_dir = provider.replace(" ", "_")
+        paths = []
+        for image_idx, image_data in enumerate(images):
+            if not image_data:
+                continue
+            filename = self.layout.filename_for(job.prompt, job.created_at,
+                                                f"_{image_idx + 1}" if len(images) > 1 else "", result.extension)
+            filepath = self.layout.path_for(model_dir, filename, job.created_at)
+            with self._lock:
+                self._pending[job.id] = self._pending.get(job.id, 0) + 1
+            self.writer.submit(image_data, filepath, callback=self._indexer(job, provider, filepath, image_data),
+                               on_error=lambda error: self._written(job.id))
+            paths.append(self.archive_index.relative_path(filepath))
+
+        entry = {'paths': paths}
+        if urls:
+            entry['urls'] = urls
+        if result.metadata.get('errors'):
+            entry['errors'] = result.metadata['errors']
+        return entry
+
+    def _indexer(self, job, provider, filepath, image_data):
+        def on_written(digest, is_new):
+            try:
+                self.archive_index.add_image(
+                    filepath,
+                    image_data,
+                    provider,
+                    job.prompt,
+                    params=job.params,
+                    size=image_size(image_data),
+                    created_at=job.created_at
+                )
+            finally:
+                self._written(job.id)
+        return on_written
+
+    def _write_manifest(self, manifest):
+        path = self.manifest_path(manifest['id'], manifest['created_at'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def _append_history(self, manifest):
+        summary = {
+            'id': manifest['id'],
+            'prompt': manifest['prompt'],
+            'created_at': manifest['created_at'],
+            'providers': manifest['providers'],
+            'manifest': os.path.relpath(self.manifest_path(manifest['id'], manifest['created_at']),
+                                        self.runs_dir).replace(os.sep, "/")
+        }
+        try:
+            with open(self.history_path, 'a') as f:
+                f.write(json.dumps(summary) + "\n")
+        except OSError as e:
+            print(f"Error saving run history for {manifest['id']}: {e}", file=sys.stderr)
@@ -0,0 +1,119 @@
+import functools
+import hashlib
+import json
+import threading
+
+
+def credential_fingerprint(api_key):
+    """Short, non-reversible fingerprint of an API key for use in request keys"""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def make_request_key(provider, model, prompt, params=None):
+    """
+    Build the single-flight key for a generation request
+
+    Args:
+        provider: Provider name (e.g. "openai", "replicate")
+        model: Model identifier
+        prompt: Text prompt; surrounding and repeated whitespace is ignored
+        params: Optional dict of request parameters that affect the output
+
+    Returns:
+        str: Hex digest identifying the request
+    """
+    normalized_prompt = " ".join(prompt.split())
+    payload = json.dumps([provider, model, normalized_prompt, params or {}], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Call:
+    """An upstream call in progress and the callers waiting on it"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key onto a single execution
+
+    The first caller for a key runs the function; callers arriving while it is
+    still running wait and receive the same result (or exception). At most
+    max_inflight keys are tracked; beyond that calls run uncoalesced.
+    """
+    def __init__(self, max_inflight=128):
+        self.max_inflight = max_inflight
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {"executed": 0, "coalesced": 0, "bypassed": 0, "errors": 0}
+
+    def do(self, key, fn):
+        """Run fn() for key, or wait for the identical call already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self._stats["coalesced"] += 1
+                is_leader = False
+            elif len(self._calls) >= self.max_inflight:
+                self._stats["bypassed"] += 1
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executed"] += 1
+                is_leader = True
+
+        if call is None:
+            return fn()
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            with self._lock:
+                self._stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        """Return a snapshot of the coalescing counters and current in-flight count"""
+        with self._lock:
+            return dict(self._stats, inflight=len(self._calls))
+
+
+# Shared by every client in the process
+default_group = SingleFlight()
+
+
+def single_flight(provider, model, group=None):
+    """
+    Decorate a generate_image_* client function so identical concurrent calls share one request
+
+    The wrapped function must take (prompt, api_key=None, **params). The API key
+    is part of the key (as a fingerprint) so different accounts never share a call.
+    Callers that deliberately want several distinct images for the same prompt
+    pass a different variant for each; it is only used in the key. Each caller
+    gets its own copy of the GenerationResult (sharing the image buffers), so
+    one caller saving or fetching it doesn't change what the others see.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(prompt, api_key=None, variant=None, **params):
+            key = make_request_key(provider, model, prompt,
+                                   dict(params, variant=variant, credential=credential_fingerprint(api_key)))
+            return (group or default_group).do(key, lambda: func(prompt, api_key, **params)).copy()
+        return wrapper
+    return decorator
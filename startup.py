@@ -0,0 +1,61 @@
+import os
+import sys
+import threading
+import time
+
+from metrics import registry
+from tracing import tracer
+
+
+def _process_start():
+    """Monotonic time at which this process started (Linux), else now"""
+    try:
+        with open("/proc/self/stat") as f:
+            # The command name may contain spaces; the fields after it are fixed
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        age = uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.monotonic() - max(age, 0.0)
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+PROCESS_START = _process_start()
+
+startup_seconds = registry.gauge(
+    "imagegenie_startup_seconds", "Seconds from process start to each startup phase", ("entry", "phase"))
+
+_marks = {}
+_lock = threading.Lock()
+
+
+def mark(entry, phase):
+    """
+    Record that an entry point (app, grok) reached a startup phase
+
+    Only the first mark of each phase counts, so calls on every Streamlit
+    rerun are harmless. The time since process start goes to the
+    imagegenie_startup_seconds gauge, to the trace as a "startup.<phase>"
+    span and, with IMAGEGENIE_STARTUP_LOG set, to stderr.
+
+    Returns:
+        float: Seconds since process start for this phase
+    """
+    now = time.monotonic()
+    with _lock:
+        if (entry, phase) in _marks:
+            return _marks[(entry, phase)]
+        _marks[(entry, phase)] = seconds = now - PROCESS_START
+
+    startup_seconds.set(round(seconds, 4), entry=entry, phase=phase)
+    tracer.record(f"startup.{phase}", int(PROCESS_START * 1e9), int(now * 1e9), entry=entry)
+    if os.environ.get("IMAGEGENIE_STARTUP_LOG"):
+        print(f"startup: {entry}.{phase} {seconds:.3f}s", file=sys.stderr, flush=True)
+    return seconds
+
+
+def marks():
+    """Return {"<entry>.<phase>": seconds} for every phase reached so far"""
+    with _lock:
+        return {f"{entry}.{phase}": seconds for (entry, phase), seconds in _marks.items()}
@@ -0,0 +1,243 @@
+import json
+import mmap
+import os
+import threading
+
+from file_lock import FileLock
+
+
+class ThumbnailAtlas:
+    """
+    Fixed-size previews of the archive packed into one memory-mapped file
+
+    Every preview is stored as raw RGB pixels in a slot of size x size x 3 bytes,
+    so reading one is a slice of the mapping with no decoding and no per-file
+    open. An append-only JSON-lines index maps each image path (relative to the
+    archive root) to its slot, dimensions and source mtime; removals append a
+    tombstone and free the slot for reuse. The index is compacted when it
+    accumulates mostly dead lines.
+
+    Several processes (grok.py instances) may share an atlas. Writers take an
+    exclusive lock on atlas_<size>.lock and catch up on the index before
+    claiming a slot, so two processes never hand out the same one; readers
+    call refresh() to pick up entries appended since they loaded the index.
+    """
+    GROW_SLOTS = 256
+
+    def __init__(self, root_dir, size=128, dirname=".thumbnails"):
+        self.root_dir = root_dir
+        self.size = size
+        self.slot_bytes = size * size * 3
+        self.atlas_dir = os.path.join(root_dir, dirname)
+        self.data_path = os.path.join(self.atlas_dir, f"atlas_{size}.bin")
+        self.index_path = os.path.join(self.atlas_dir, f"atlas_{size}.idx")
+        self.file_lock = FileLock(os.path.join(self.atlas_dir, f"atlas_{size}.lock"))
+        self._entries = {}  # path -> (slot, width, height, mtime)
+        self._free_slots = []
+        self._next_slot = 0
+        self._index_lines = 0
+        self._index_offset = 0
+        self._index_inode = None
+        self._lock = threading.Lock()
+
+        if not os.path.exists(self.atlas_dir):
+            os.makedirs(self.atlas_dir)
+        if not os.path.exists(self.data_path):
+            open(self.data_path, 'wb').close()
+
+        self._data_file = open(self.data_path, 'r+b')
+        self._mmap = None
+        self._remap()
+        self.refresh()
+
+    def _remap(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if os.fstat(self._data_file.fileno()).st_size:
+            self._mmap = mmap.mmap(self._data_file.fileno(), 0)
+
+    def refresh(self):
+        """Read index lines appended since the last load (by this or another process)"""
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        """refresh() with the lock held"""
+        try:
+            stat = os.stat(self.index_path)
+        except OSError:
+            return
+        if stat.st_ino != self._index_inode or stat.st_size < self._index_offset:
+            # New file, or compacted (replaced) by another process; reload from the start
+            self._entries = {}
+            self._next_slot = 0
+            self._index_offset = 0
+            self._index_lines = 0
+            self._index_inode = stat.st_ino
+        if stat.st_size > self._index_offset:
+            with open(self.index_path, 'r') as f:
+                f.seek(self._index_offset)
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # Partially written by another process
+                    self._index_offset += len(line.encode("utf-8"))
+                    self._index_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._apply(record)
+            self._free_slots = sorted(
+                set(range(self._next_slot)) - {entry[0] for entry in self._entries.values()}, reverse=True)
+            if self._mmap is None or len(self._mmap) < self._next_slot * self.slot_bytes:
+                self._remap()
+
+    def _apply(self, record):
+        path = record["p"]
+        if record.get("d"):
+            self._entries.pop(path, None)
+        else:
+            self._entries[path] = (record["s"], record["w"], record["h"], record.get("m"))
+            self._next_slot = max(self._next_slot, record["s"] + 1)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def paths(self):
+        with self._lock:
+            return list(self._entries)
+
+    def is_current(self, path, mtime):
+        """Whether the stored preview was made from the file as of mtime"""
+        entry = self._entries.get(path)
+        return entry is not None and entry[3] == mtime
+
+    def get(self, path):
+        """Return the preview for path as a PIL image, or None if it isn't in the atlas"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or self._mmap is None:
+                return None
+            slot, width, height, _ = entry
+            offset = slot * self.slot_bytes
+            if offset + width * height * 3 > len(self._mmap):
+                return None
+            pixels = self._mmap[offset:offset + width * height * 3]
+        from PIL import Image
+        return Image.frombytes("RGB", (width, height), pixels)
+
+    def add(self, path, image, mtime=None):
+        """
+        Store a preview of image for path, replacing any previous preview
+
+        Args:
+            path: Image path relative to the archive root
+            image: PIL image (the original; it is not modified)
+            mtime: Modification time of the source file, used to detect stale previews
+        """
+        preview = image.copy()
+        preview.thumbnail((self.size, self.size))
+        preview = preview.convert("RGB")
+        width, height = preview.size
+        pixels = preview.tobytes()
+
+        with self._lock, self.file_lock:
+            # Another process may have claimed slots since the index was last read
+            self._refresh()
+            entry = self._entries.get(path)
+            if entry is not None:
+                slot = entry[0]
+            elif self._free_slots:
+                slot = self._free_slots.pop()
+            else:
+                slot = self._next_slot
+                self._next_slot += 1
+
+            required = (slot + 1) * self.slot_bytes
+            if self._mmap is None or len(self._mmap) < required:
+                if self._mmap is not None:
+                    # Some platforms can't resize a file while it is mapped
+                    self._mmap.close()
+                    self._mmap = None
+                # Never shrink: another process may have grown the file further
+                if os.fstat(self._data_file.fileno()).st_size < required:
+                    self._data_file.truncate((slot + self.GROW_SLOTS) * self.slot_bytes)
+                self._remap()
+
+            offset = slot * self.slot_bytes
+            self._mmap[offset:offset + len(pixels)] = pixels
+            self._entries[path] = (slot, width, height, mtime)
+            self._append_record({"p": path, "s": slot, "w": width, "h": height, "m": mtime})
+
+    def add_file(self, path, filepath):
+        """Build the preview for an image file; returns False if it can't be read"""
+        from PIL import Image
+        try:
+            mtime = os.path.getmtime(filepath)
+            with Image.open(filepath) as image:
+                image.draft("RGB", (self.size, self.size))
+                self.add(path, image, mtime=mtime)
+            return True
+        except Exception:
+            return False
+
+    def move(self, old_path, new_path):
+        """Re-key a preview after its image moved, keeping the slot"""
+        with self._lock, self.file_lock:
+            self._refresh()
+            entry = self._entries.pop(old_path, None)
+            if entry is None:
+                return
+            self._entries[new_path] = entry
+            slot, width, height, mtime = entry
+            self._append_record({"p": old_path, "d": 1})
+            self._append_record({"p": new_path, "s": slot, "w": width, "h": height, "m": mtime})
+
+    def remove(self, path):
+        """Drop the preview for path and free its slot"""
+        with self._lock, self.file_lock:
+            self._refresh()
+            entry = self._entries.pop(path, None)
+            if entry is None:
+                return
+            self._free_slots.append(entry[0])
+            self._append_record({"p": path, "d": 1})
+
+    def _append_record(self, record):
+        """Append one index line (both locks held, index caught up), compacting it when mostly dead"""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with open(self.index_path, 'a') as f:
+            f.write(line)
+            if self._index_inode is None:
+                self._index_inode = os.fstat(f.fileno()).st_ino
+        self._index_offset += len(line.encode("utf-8"))
+        self._index_lines += 1
+        if self._index_lines > 2 * len(self._entries) + 1000:
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the index with only live entries (both locks held)"""
+        if self._mmap is not None:
+            self._mmap.flush()
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            for path, (slot, width, height, mtime) in self._entries.items():
+                f.write(json.dumps({"p": path, "s": slot, "w": width, "h": height, "m": mtime},
+                                   separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.index_path)
+        stat = os.stat(self.index_path)
+        self._index_inode = stat.st_ino
+        self._index_offset = stat.st_size
+        self._index_lines = len(self._entries)
+
+    def close(self):
+        with self._lock:
+            if self._mmap is not None:
+                self._mmap.flush()
+                self._mmap.close()
+                self._mmap = None
+            self._data_file.close()
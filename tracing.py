@@ -0,0 +1,186 @@
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is off; entering and leaving it does nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """One timed stage; use as a context manager"""
+    __slots__ = ("tracer", "name", "attrs", "start_ns")
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.start_ns = 0
+
+    def __enter__(self):
+        self.start_ns = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end_ns = time.monotonic_ns()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._record(self.name, self.start_ns, end_ns - self.start_ns, self.attrs)
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes discovered while the span is open (sizes, counts, ...)"""
+        self.attrs.update(attrs)
+
+
+class Tracer:
+    """
+    Records stage timings as JSON lines
+
+    Each span becomes one line: {"name", "ts" (monotonic ns at start), "dur"
+    (ns), "tid", "thread", "args"}. Lines are buffered and appended to the
+    output file in batches. While disabled, span() returns a shared no-op
+    object, so instrumented code pays one attribute check per stage.
+
+    Convert a trace for a flame view (chrome://tracing, Perfetto, speedscope)
+    with: python tracing.py trace.jsonl trace.json
+    """
+    def __init__(self, path=None, buffer_size=256):
+        self.path = path
+        self.enabled = path is not None
+        self.buffer_size = buffer_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def enable(self, path):
+        self.path = path
+        self.enabled = True
+
+    def disable(self):
+        self.flush()
+        self.enabled = False
+
+    def span(self, name, **attrs):
+        """Time the enclosed block as a stage called name"""
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attrs)
+
+    def traced(self, name=None):
+        """Decorator that runs the function inside a span (named after the function by default)"""
+        def decorator(fn):
+            span_name = name or fn.__qualname__
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                with Span(self, span_name, {}) as active:
+                    result = fn(*args, **kwargs)
+                    # The API clients report failures as a GenerationResult error rather than raising
+                    error = getattr(result, "error", None)
+                    if error:
+                        active.set(error=str(error)[:200])
+                    return result
+            return wrapper
+        return decorator
+
+    def record(self, name, start_ns, end_ns=None, **attrs):
+        """
+        Record a stage that was timed elsewhere, such as one that began before the tracer existed
+
+        start_ns and end_ns (default: now) are time.monotonic_ns() values.
+        """
+        if not self.enabled:
+            return
+        if end_ns is None:
+            end_ns = time.monotonic_ns()
+        self._record(name, start_ns, end_ns - start_ns, attrs)
+
+    def _record(self, name, start_ns, duration_ns, attrs):
+        thread = threading.current_thread()
+        record = {"name": name, "ts": start_ns, "dur": duration_ns, "tid": thread.ident,
+                  "thread": thread.name, "args": attrs}
+        with self._lock:
+            self._buffer.append(record)
+            if len(self._buffer) < self.buffer_size:
+                return
+            records, self._buffer = self._buffer, []
+        self._write(records)
+
+    def flush(self):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if records:
+            self._write(records)
+
+    def _write(self, records):
+        try:
+            with open(self.path, 'a') as f:
+                f.write("".join(json.dumps(record, default=str) + "\n" for record in records))
+        except OSError as e:
+            print(f"Error writing trace to {self.path}: {e}", file=sys.stderr)
+
+
+def export_chrome_trace(jsonl_path, output_path):
+    """
+    Convert a JSON-lines trace to the Chrome trace event format
+
+    Returns:
+        int: Number of spans exported
+    """
+    events = []
+    thread_names = {}
+    with open(jsonl_path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            events.append({
+                "name": record["name"],
+                "ph": "X",
+                "ts": record["ts"] / 1000,
+                "dur": record["dur"] / 1000,
+                "pid": 1,
+                "tid": record["tid"],
+                "args": record.get("args", {})
+            })
+            thread_names.setdefault(record["tid"], record.get("thread", ""))
+    span_count = len(events)
+    for tid, thread_name in thread_names.items():
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": thread_name}})
+
+    with open(output_path, 'w') as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    return span_count
+
+
+# Shared tracer; set IMAGEGENIE_TRACE=<file.jsonl> to turn it on
+tracer = Tracer(os.environ.get("IMAGEGENIE_TRACE") or None)
+span = tracer.span
+traced = tracer.traced
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python tracing.py trace.jsonl trace.json")
+        sys.exit(1)
+    count = export_chrome_trace(sys.argv[1], sys.argv[2])
+    print(f"Exported {count} spans to {sys.argv[2]}")
@@ -1,6 +1,22 @@
-import requests
+import importlib
 from io import BytesIO
-from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_result import GenerationResult
+
+# Display name, API key name, client module and function, and whether it takes
+# num_images itself. Clients are imported on first use, so a provider's SDK is
+# only loaded once that provider is actually called.
+PROVIDERS = (
+    ('OpenAI DALL-E 3', 'openai', 'api_clients.openai_client', 'generate_image_openai', False),
+    ('Google Imagen 3', 'google', 'api_clients.google_client', 'generate_image_google', True),
+    ('Recraft AI', 'recraft', 'api_clients.recraft_client', 'generate_image_recraft', False),
+    ('Ideogram v2', 'ideogram', 'api_clients.ideogram_client', 'generate_image_ideogram', True),
+)
+
+def load_provider(module_name, function_name):
+    """Import an api_clients module on first use and return its generate function"""
+    return getattr(importlib.import_module(module_name), function_name)
 
 def save_image_from_url(image_url):
     """
@@ -12,6 +28,8 @@ def save_image_from_url(image_url):
     Returns:
         bytes: Image data as bytes or None if failed
     """
+    import requests
+    from PIL import Image
     try:
         response = requests.get(image_url)
         if response.status_code == 200:
@@ -35,6 +53,7 @@ def save_image_from_bytes(image_data):
     Returns:
         bytes: Image data as PNG bytes or None if failed
     """
+    from PIL import Image
     try:
         image = Image.open(BytesIO(image_data))
         img_byte_arr = BytesIO()
@@ -43,3 +62,77 @@ def save_image_from_bytes(image_data):
     except Exception as e:
         print(f"Error processing image: {e}")
         return None
+
+
+def save_images_from_urls(image_urls, max_workers=4):
+    """
+    Download several images in parallel and convert them to PNG
+    
+    Args:
+        image_urls: Iterable of image URLs
+        max_workers: Maximum number of concurrent downloads
+        
+    Returns:
+        list: PNG bytes (or None for failed downloads) in the order of image_urls
+    """
+    image_urls = list(image_urls)
+    if len(image_urls) <= 1:
+        return [save_image_from_url(url) for url in image_urls]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(image_urls))) as executor:
+        return list(executor.map(save_image_from_url, image_urls))
+
+def generate_batch(generate_fn, prompt, api_key, num_images, native=False, max_workers=4):
+    """
+    Generate num_images images with one provider
+    
+    Providers with a native multi-output parameter get a single request with
+    num_images; the others are fanned out to num_images parallel requests.
+    
+    Args:
+        generate_fn: One of the api_clients generate_image_* functions
+        prompt: Text prompt for image generation
+        api_key: API key for the provider
+        num_images: Number of images to generate
+        native: Whether generate_fn accepts num_images
+        max_workers: Maximum number of concurrent fan-out requests
+        
+    Returns:
+        GenerationResult: Every image produced; fan-out results are merged
+            without copying their images, and failed fan-out requests are
+            listed in metadata["errors"]
+    """
+    if num_images <= 1:
+        return generate_fn(prompt, api_key)
+    if native:
+        return generate_fn(prompt, api_key, num_images=num_images)
+    
+    # Each fan-out request is distinct, so they must not be coalesced with each other
+    with ThreadPoolExecutor(max_workers=min(max_workers, num_images)) as executor:
+        results = list(executor.map(
+            lambda variant: generate_fn(prompt, api_key, variant=variant),
+            range(num_images)
+        ))
+    
+    return GenerationResult.merge(results)
+
+def build_generators(prompt, api_keys, num_images=1):
+    """
+    Build the (provider name, zero-argument callable) list for a generation job
+    
+    Args:
+        prompt: Text prompt for image generation
+        api_keys: Dict of API keys by provider key; providers without a key are skipped
+        num_images: Number of images to generate per provider
+        
+    Returns:
+        list: (provider name, generator) tuples for JobManager.submit
+    """
+    generators = []
+    for name, key_name, module_name, function_name, native in PROVIDERS:
+        api_key = api_keys.get(key_name)
+        if api_key:
+            generators.append((name, lambda module_name=module_name, function_name=function_name,
+                               key=api_key, native=native:
+                               generate_batch(load_provider(module_name, function_name), prompt, key,
+                                              num_images, native=native)))
+    return generators